@@ -0,0 +1,66 @@
+import threading
+import database
+
+class ActivityBuffer:
+    """Accumulates point deltas and channel activity in memory and writes them to the database in batches."""
+
+    def __init__(self, max_pending=500):
+        self.max_pending = max_pending
+        self._pending = {}
+        self._buckets = {}  # (guild_id, channel_id, hour) -> [messages, voice_seconds]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, guild_id, user_id, activity_points, gambling_points, voice_seconds=0, messages=0):
+        """Queues a point delta for a user. Returns True when this call reaches the size threshold."""
+        key = (guild_id, user_id)
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = [activity_points, gambling_points, voice_seconds, messages]
+                return len(self._pending) == self.max_pending
+            pending[0] += activity_points
+            pending[1] += gambling_points
+            pending[2] += voice_seconds
+            pending[3] += messages
+            return False
+
+    def add_channel(self, guild_id, channel_id, hour, messages=0, voice_seconds=0):
+        """Queues activity for a channel's hourly bucket."""
+        key = (guild_id, channel_id, hour)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                self._buckets[key] = [messages, voice_seconds]
+            else:
+                bucket[0] += messages
+                bucket[1] += voice_seconds
+
+    def flush(self):
+        """Writes all queued deltas, then all channel buckets. Returns the number of user rows written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            buckets, self._buckets = self._buckets, {}
+
+        rows = [(guild_id, user_id, *deltas) for (guild_id, user_id), deltas in pending.items()]
+        bucket_rows = [(*key, *totals) for key, totals in buckets.items()]
+        try:
+            if rows:
+                database.add_points_bulk(rows)
+        except Exception:
+            # Put everything back so it is retried on the next flush
+            for row in rows:
+                self.add(*row)
+            for row in bucket_rows:
+                self.add_channel(*row)
+            raise
+        try:
+            if bucket_rows:
+                database.add_activity_buckets(bucket_rows)
+        except Exception:
+            for row in bucket_rows:
+                self.add_channel(*row)
+            raise
+        return len(rows)
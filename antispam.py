@@ -0,0 +1,102 @@
+"""Decides in memory whether a message earns points.
+
+Every (guild, user) has a token bucket: a message that finds a token earns
+points and spends it, and tokens refill at a per-guild rate up to a burst
+size. Messages over the limit still count as activity, they just don't pay.
+
+State is kept in two generations, each a per-guild dict from user id to a slot
+in flat float arrays. When a generation is older than the longest refill time,
+it is dropped as a whole and the current one takes its place; a user seen
+again in the meantime is moved across. Whoever is dropped has been idle long
+enough for their bucket to be full again, which is exactly the state a new
+entry starts in, so eviction never changes a decision.
+"""
+import time
+from array import array
+
+# Must match the defaults of the guild_settings columns
+DEFAULT_BURST = 5
+DEFAULT_PER_MINUTE = 12
+# Generations are never rotated more often than this, to keep rotation cheap
+MIN_GENERATION_SECONDS = 60
+
+class _Generation:
+    __slots__ = ('guilds', 'tokens', 'stamps', 'started')
+
+    def __init__(self, started):
+        self.guilds = {}  # guild_id -> {user_id: slot}
+        self.tokens = array('f')
+        self.stamps = array('f')  # seconds since `started`
+        self.started = started
+
+class MessageRateLimiter:
+    def __init__(self, burst=DEFAULT_BURST, per_minute=DEFAULT_PER_MINUTE, clock=time.monotonic):
+        self._clock = clock
+        self._default = self._limits_for(burst, per_minute)
+        self._limits = {}  # guild_id -> (burst, tokens per second) or None, for guilds that differ from the default
+        now = clock()
+        self._current = _Generation(now)
+        self._previous = _Generation(now)
+        self._generation_seconds = self._longest_refill()
+
+    @staticmethod
+    def _limits_for(burst, per_minute):
+        # A refill rate of 0 switches the limit off
+        return (float(burst), per_minute / 60) if per_minute > 0 else None
+
+    def _longest_refill(self):
+        refills = [burst / rate for burst, rate in [self._default, *self._limits.values()] if rate]
+        return max([MIN_GENERATION_SECONDS, *refills])
+
+    def set_limits(self, guild_id, burst, per_minute):
+        limits = self._limits_for(burst, per_minute)
+        if limits == self._default:
+            self._limits.pop(guild_id, None)
+        else:
+            self._limits[guild_id] = limits
+        self._generation_seconds = self._longest_refill()
+
+    def __len__(self):
+        """Number of tracked users, counting both generations."""
+        return sum(len(users) for generation in (self._current, self._previous) for users in generation.guilds.values())
+
+    def _rotate(self, now):
+        self._previous = self._current
+        self._current = _Generation(now)
+
+    def allow(self, guild_id, user_id):
+        """Takes a token for the user's message. Returns False if the user is over the limit."""
+        limits = self._limits.get(guild_id, self._default)
+        if limits is None:
+            return True
+        burst, rate = limits
+        now = self._clock()
+        current = self._current
+        if now - current.started >= self._generation_seconds:
+            self._rotate(now)
+            current = self._current
+
+        users = current.guilds.get(guild_id)
+        if users is None:
+            users = current.guilds[guild_id] = {}
+        slot = users.get(user_id)
+        if slot is not None:
+            tokens = current.tokens[slot] + (now - current.started - current.stamps[slot]) * rate
+        else:
+            previous = self._previous.guilds.get(guild_id)
+            old_slot = previous.pop(user_id, None) if previous else None
+            if old_slot is None:
+                tokens = burst
+            else:
+                previous_generation = self._previous
+                tokens = previous_generation.tokens[old_slot] + (now - previous_generation.started - previous_generation.stamps[old_slot]) * rate
+            slot = users[user_id] = len(current.tokens)
+            current.tokens.append(0.0)
+            current.stamps.append(0.0)
+
+        if tokens > burst:
+            tokens = burst
+        allowed = tokens >= 1
+        current.tokens[slot] = tokens - 1 if allowed else tokens
+        current.stamps[slot] = now - current.started
+        return allowed
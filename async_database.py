@@ -0,0 +1,95 @@
+"""Awaitable versions of the functions in database.py.
+
+Every call is executed on a dedicated worker thread so that SQLite work never
+blocks the discord.py event loop.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+import database
+
+DB_READ_WORKERS = int(os.getenv('DB_READ_WORKERS', 2))
+
+# A single worker serialises writes, which is what SQLite wants anyway.
+# Pure reads go to a small pool instead; in WAL mode they never wait for the writer.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='database')
+_read_executor = ThreadPoolExecutor(max_workers=DB_READ_WORKERS, thread_name_prefix='database-read')
+
+async def run(func, *args, **kwargs):
+    """Runs a blocking callable on the database worker thread."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+async def run_read(func, *args, **kwargs):
+    """Runs a blocking, read-only callable on the reader pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_read_executor, functools.partial(func, *args, **kwargs))
+
+def _wrap(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run(func, *args, **kwargs)
+    return wrapper
+
+def _wrap_read(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_read(func, *args, **kwargs)
+    return wrapper
+
+def shutdown():
+    """Waits for queued database work to finish, then closes the pooled connections."""
+    _executor.shutdown(wait=True)
+    _read_executor.shutdown(wait=True)
+    database.close_db_connections()
+
+init_db = _wrap(database.init_db)
+get_meta = _wrap_read(database.get_meta)
+set_meta = _wrap(database.set_meta)
+log_member_count = _wrap(database.log_member_count)
+get_member_count_history = _wrap_read(database.get_member_count_history)
+get_latest_member_count = _wrap_read(database.get_latest_member_count)
+
+add_activity_buckets = _wrap(database.add_activity_buckets)
+prune_activity = _wrap(database.prune_activity)
+get_activity_heatmap = _wrap_read(database.get_activity_heatmap)
+get_top_channels = _wrap_read(database.get_top_channels)
+
+add_points = _wrap(database.add_points)
+add_points_bulk = _wrap(database.add_points_bulk)
+get_user_data = _wrap(database.get_user_data)
+find_user_data = _wrap_read(database.find_user_data)
+update_gambling_points = _wrap(database.update_gambling_points)
+debit_gambling_points = _wrap(database.debit_gambling_points)
+settle_bet = _wrap(database.settle_bet)
+reserve_purchase = _wrap(database.reserve_purchase)
+rollback_purchase = _wrap(database.rollback_purchase)
+give_gambling_points_bulk = _wrap(database.give_gambling_points_bulk)
+take_gambling_points_bulk = _wrap(database.take_gambling_points_bulk)
+tax_gambling_points = _wrap(database.tax_gambling_points)
+reconstruct_balances = _wrap_read(database.reconstruct_balances)
+create_ledger_snapshot = _wrap(database.create_ledger_snapshot)
+get_leaderboard = _wrap_read(database.get_leaderboard)
+get_leaderboard_page = _wrap_read(database.get_leaderboard_page)
+get_guild_points = _wrap_read(database.get_guild_points)
+
+add_shop_item = _wrap(database.add_shop_item)
+remove_shop_item = _wrap(database.remove_shop_item)
+
+async def get_shop_items(guild_id):
+    items = database.peek_shop_items(guild_id)
+    return items if items is not None else await run_read(database.get_shop_items, guild_id)
+
+async def get_shop_item(item_id):
+    item = database.peek_shop_item(item_id)
+    return item if item is not None else await run_read(database.get_shop_item, item_id)
+
+async def get_guild_settings(guild_id):
+    # Cache hits are answered on the event loop without a round trip to the worker
+    settings = database.peek_guild_settings(guild_id)
+    return settings if settings is not None else await run(database.get_guild_settings, guild_id)
+
+set_bet_win_chance = _wrap(database.set_bet_win_chance)
+set_message_rate_limit = _wrap(database.set_message_rate_limit)
+get_message_rate_limits = _wrap_read(database.get_message_rate_limits)
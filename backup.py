@@ -0,0 +1,298 @@
+"""Hot backups of the bot database, and per-guild export and import.
+
+Backups use SQLite's online backup API a few pages at a time, from a read-only
+connection that holds one read transaction for the whole copy. In WAL mode
+the bot keeps writing meanwhile, and the copy is the database as of the
+moment it started. Exports stream one guild's rows as NDJSON (every table)
+or CSV (one table); imports load them back in large executemany batches
+within a single transaction.
+
+Usage, from the repository root:
+  python backup.py backup [--output PATH]
+  python backup.py export GUILD_ID [--format ndjson|csv] [--table users] [--output PATH]
+  python backup.py import PATH [--format ndjson|csv] [--table users]
+Import while the bot is stopped: it replaces the guild's rows in each imported
+table, and a running bot would keep serving its cached copies.
+"""
+import argparse
+import contextlib
+import csv
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+import database
+
+BACKUP_DIR = os.getenv('BACKUP_DIR', os.path.join(database.DB_FOLDER, 'backups'))
+BACKUPS_KEPT = int(os.getenv('BACKUPS_KEPT', 7))
+# Pages copied per backup step, and how long the copy yields to other threads between steps
+BACKUP_PAGES_PER_STEP = int(os.getenv('BACKUP_PAGES_PER_STEP', 256))
+BACKUP_STEP_PAUSE_SECONDS = float(os.getenv('BACKUP_STEP_PAUSE_SECONDS', 0.005))
+
+EXPORT_FETCH_ROWS = 1000
+IMPORT_BATCH_ROWS = int(os.getenv('IMPORT_BATCH_ROWS', 50_000))
+# Page cache of the backup, export and import connections; no mmap, so memory stays flat however big the file
+SCAN_CACHE_SIZE = -4000
+
+EXPORT_FORMAT = 'discordbot-guild-export'
+# Tables exported per guild, with surrogate keys that are reassigned on import.
+# The points ledger stays behind; imported balances start a new ledger snapshot.
+GUILD_TABLES = {
+    'guild_settings': (),
+    'users': (),
+    'shop_items': ('item_id',),
+    'member_counts': ('id',),
+    'activity_hourly': (),
+    'activity_daily': (),
+    'activity_monthly': (),
+    'activity_guild_hourly': (),
+}
+
+def _open_scan_connection(readonly=True):
+    conn = database.open_connection(readonly)
+    conn.execute("PRAGMA mmap_size = 0")
+    conn.execute(f"PRAGMA cache_size = {SCAN_CACHE_SIZE}")
+    return conn
+
+# --- Backups ---
+
+def backup_path(now=None):
+    return os.path.join(BACKUP_DIR, f"bot_stats-{(now or datetime.utcnow()):%Y%m%d-%H%M%S}.db")
+
+def create_backup(destination=None, pages_per_step=BACKUP_PAGES_PER_STEP, pause=BACKUP_STEP_PAUSE_SECONDS, progress=None):
+    """Copies the live database to `destination` and returns its path.
+
+    `progress(copied_pages, total_pages)` is called after every step. The copy
+    is written next to the destination and renamed once it is complete.
+    """
+    destination = destination or backup_path()
+    directory = os.path.dirname(destination)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    partial = destination + '.partial'
+    source = _open_scan_connection()
+    target = sqlite3.connect(partial)
+    try:
+        # Without a fixed snapshot, every commit by the bot would restart the copy from the first page
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+        def step(status, remaining, total):
+            if progress:
+                progress(total - remaining, total)
+            if remaining:
+                time.sleep(pause)
+
+        source.backup(target, pages=pages_per_step, progress=step)
+        source.rollback()
+    except BaseException:
+        target.close()
+        os.remove(partial)
+        raise
+    finally:
+        source.close()
+    target.close()
+    os.replace(partial, destination)
+    return destination
+
+def prune_backups(directory=None, kept=BACKUPS_KEPT):
+    """Deletes all but the newest `kept` backups. Returns the deleted paths."""
+    directory = directory or BACKUP_DIR
+    if not os.path.isdir(directory):
+        return []
+    backups = sorted(name for name in os.listdir(directory) if name.startswith('bot_stats-') and name.endswith('.db'))
+    stale = [os.path.join(directory, name) for name in backups[:max(0, len(backups) - kept)]]
+    for path in stale:
+        os.remove(path)
+    return stale
+
+# --- Export ---
+
+def _table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+def iter_guild_rows(conn, guild_id, tables=None):
+    """Yields (table, columns, row) for every row a guild has in `tables`, a chunk at a time."""
+    for table in tables or GUILD_TABLES:
+        columns = [column for column in _table_columns(conn, table) if column not in GUILD_TABLES[table]]
+        cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE guild_id = ?", (guild_id,))
+        while True:
+            rows = cursor.fetchmany(EXPORT_FETCH_ROWS)
+            if not rows:
+                break
+            for row in rows:
+                yield table, columns, tuple(row)
+
+def export_ndjson(guild_id, file):
+    """Writes a header line, then one JSON object per row of every guild table. Returns the number of rows."""
+    conn = _open_scan_connection()
+    try:
+        # One read transaction, so every table is exported as of the same moment
+        conn.execute("BEGIN")
+        header = {
+            'format': EXPORT_FORMAT,
+            'schema_version': database.get_schema_version(conn),
+            'guild_id': guild_id,
+            'exported_at': datetime.utcnow().isoformat(timespec='seconds'),
+        }
+        file.write(json.dumps(header) + "\n")
+        count = 0
+        for table, columns, row in iter_guild_rows(conn, guild_id):
+            file.write(json.dumps({'table': table, 'row': dict(zip(columns, row))}) + "\n")
+            count += 1
+        return count
+    finally:
+        conn.close()
+
+def export_csv(guild_id, file, table='users'):
+    """Writes one table of a guild as CSV with a header row. Returns the number of rows."""
+    if table not in GUILD_TABLES:
+        raise ValueError(f"Unknown table: {table}")
+    conn = _open_scan_connection()
+    try:
+        writer = csv.writer(file)
+        columns = [column for column in _table_columns(conn, table) if column not in GUILD_TABLES[table]]
+        writer.writerow(columns)
+        count = 0
+        for _, _, row in iter_guild_rows(conn, guild_id, [table]):
+            writer.writerow(row)
+            count += 1
+        return count
+    finally:
+        conn.close()
+
+# --- Import ---
+
+def _import_records(records, batch_rows=IMPORT_BATCH_ROWS):
+    """Inserts (table, columns, values) records in batches of `batch_rows`, all in one transaction.
+
+    The first time a table is seen for a guild, that guild's existing rows in it
+    are deleted, so importing the same export twice leaves one copy. Nothing is
+    committed until the whole stream has been read, so an import that fails
+    partway leaves the database as it was.
+    Returns {table: rows imported}.
+    """
+    conn = _open_scan_connection(readonly=False)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        counts = _import_into(conn, records, batch_rows)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    database.clear_caches()
+    return counts
+
+def _import_into(conn, records, batch_rows):
+    known_columns = {}
+    cleared = set()
+    counts = {}
+    guilds_with_users = set()
+    batch, batch_key = [], None
+
+    def flush():
+        if batch:
+            table, columns = batch_key
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", batch
+            )
+            batch.clear()
+
+    for table, columns, values in records:
+        if table not in GUILD_TABLES:
+            raise ValueError(f"Unknown table: {table}")
+        if table not in known_columns:
+            known_columns[table] = set(_table_columns(conn, table)) - set(GUILD_TABLES[table])
+        columns = tuple(columns)
+        unknown = set(columns) - known_columns[table]
+        if unknown or 'guild_id' not in columns:
+            raise ValueError(f"Unexpected columns for {table}: {sorted(unknown) or 'no guild_id'}")
+        guild_id = values[columns.index('guild_id')]
+        if (table, columns) != batch_key or len(batch) >= batch_rows:
+            flush()
+            batch_key = (table, columns)
+        if (table, guild_id) not in cleared:
+            flush()
+            conn.execute(f"DELETE FROM {table} WHERE guild_id = ?", (guild_id,))
+            cleared.add((table, guild_id))
+        if table == 'users':
+            guilds_with_users.add(guild_id)
+        batch.append(values)
+        counts[table] = counts.get(table, 0) + 1
+    flush()
+
+    for guild_id in guilds_with_users:
+        database.rebase_ledger(guild_id, conn)
+    return counts
+
+def import_ndjson(lines, batch_rows=IMPORT_BATCH_ROWS):
+    """Imports an export_ndjson() stream. Returns {table: rows imported}."""
+    lines = iter(lines)
+    header = json.loads(next(lines, '{}'))
+    if header.get('format') != EXPORT_FORMAT:
+        raise ValueError("Not a guild export")
+    if header['schema_version'] > len(database.MIGRATIONS):
+        raise ValueError(f"Export is from a newer schema ({header['schema_version']}) than this database ({len(database.MIGRATIONS)})")
+
+    def records():
+        for line in lines:
+            if line.strip():
+                record = json.loads(line)
+                yield record['table'], record['row'].keys(), tuple(record['row'].values())
+    return _import_records(records(), batch_rows)
+
+def import_csv(lines, table='users', batch_rows=IMPORT_BATCH_ROWS):
+    """Imports an export_csv() stream into `table`. Returns {table: rows imported}."""
+    reader = csv.reader(lines)
+    columns = next(reader)
+    # CSV has no NULL; SQLite's column affinity turns the other strings back into numbers
+    records = ((table, columns, tuple(value if value != '' else None for value in row)) for row in reader)
+    return _import_records(records, batch_rows)
+
+# --- Command line ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Backs up, exports or imports the bot database.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    backup_parser = commands.add_parser('backup', help='hot backup of the whole database')
+    backup_parser.add_argument('--output', help=f'backup file (default: a timestamped file in {BACKUP_DIR})')
+    export_parser = commands.add_parser('export', help="export one guild's data")
+    export_parser.add_argument('guild_id', type=int)
+    export_parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+    export_parser.add_argument('--table', choices=list(GUILD_TABLES), default='users', help='table to export as CSV')
+    export_parser.add_argument('--output', help='output file (default: stdout)')
+    import_parser = commands.add_parser('import', help='import a guild export')
+    import_parser.add_argument('path')
+    import_parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+    import_parser.add_argument('--table', choices=list(GUILD_TABLES), default='users', help='table a CSV file belongs to')
+    args = parser.parse_args()
+
+    if args.command == 'backup':
+        started = time.perf_counter()
+        path = create_backup(args.output)
+        logging.info(f"Backup written to {path} ({os.path.getsize(path) / 2**20:.1f} MiB) in {time.perf_counter() - started:.1f}s.")
+        if not args.output:
+            for stale in prune_backups():
+                logging.info(f"Deleted old backup {stale}.")
+    elif args.command == 'export':
+        with open(args.output, 'w', newline='', encoding='utf-8') if args.output else contextlib.nullcontext(sys.stdout) as file:
+            if args.format == 'ndjson':
+                count = export_ndjson(args.guild_id, file)
+            else:
+                count = export_csv(args.guild_id, file, args.table)
+        logging.info(f"Exported {count} rows of guild {args.guild_id}.")
+    else:
+        database.init_db()
+        with open(args.path, newline='', encoding='utf-8') as file:
+            counts = import_ndjson(file) if args.format == 'ndjson' else import_csv(file, args.table)
+        logging.info(f"Imported {', '.join(f'{count} {table}' for table, count in counts.items()) or 'nothing'}.")
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,53 @@
+"""Compares message throughput of per-message writes against the write-behind buffer.
+
+Run from the repository root: python -m bench.bench_activity_buffer
+"""
+import argparse
+import random
+import tempfile
+import time
+
+import database
+from activity_buffer import ActivityBuffer
+from bench.fakes import use_temp_database
+
+def message_stream(count, guilds, users):
+    rng = random.Random(42)
+    return [(rng.randrange(guilds), rng.randrange(users)) for _ in range(count)]
+
+def bench_direct(messages):
+    start = time.perf_counter()
+    for guild_id, user_id in messages:
+        database.add_points(guild_id, user_id, 1, 2)
+    return len(messages) / (time.perf_counter() - start)
+
+def bench_buffered(messages, max_pending):
+    buffer = ActivityBuffer(max_pending=max_pending)
+    start = time.perf_counter()
+    for guild_id, user_id in messages:
+        if buffer.add(guild_id, user_id, 1, 2):
+            buffer.flush()
+    buffer.flush()
+    return len(messages) / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--guilds', type=int, default=10)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--max-pending', type=int, default=500)
+    args = parser.parse_args()
+
+    messages = message_stream(args.messages, args.guilds, args.users)
+    with tempfile.TemporaryDirectory() as directory:
+        use_temp_database(directory)
+        direct = bench_direct(messages)
+    with tempfile.TemporaryDirectory() as directory:
+        use_temp_database(directory)
+        buffered = bench_buffered(messages, args.max_pending)
+
+    print(f"add_points per message: {direct:10.0f} msg/s")
+    print(f"ActivityBuffer:         {buffered:10.0f} msg/s ({buffered / direct:.1f}x)")
+
+if __name__ == '__main__':
+    main()
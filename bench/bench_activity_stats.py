@@ -0,0 +1,75 @@
+"""Fills a year of per-channel hourly activity and times the /stats activity queries.
+
+Checks that the heatmap read from the per-guild rollup matches the raw
+buckets and that pruning keeps every rollup within its retention.
+Run from the repository root: python -m bench.bench_activity_stats
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+
+import database
+from bench.fakes import use_temp_database
+
+GUILD_ID = 1
+
+def _timed(label, func, *args, repeat=20):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func(*args)
+    print(f"{label}: {(time.perf_counter() - started) / repeat * 1000:.2f}ms")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--channels', type=int, default=40)
+    parser.add_argument('--guilds', type=int, default=5, help='guilds filled alongside the measured one')
+    args = parser.parse_args()
+
+    rng = random.Random(13)
+    now_hour = database.current_activity_hour()
+    first_hour = now_hour - args.days * 24
+    expected = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        use_temp_database(directory)
+        started = time.perf_counter()
+        buckets = 0
+        for hour in range(first_hour, now_hour):
+            rows = []
+            for guild_id in range(1, args.guilds + 1):
+                for channel_id in rng.sample(range(args.channels), rng.randrange(1, 8)):
+                    messages, voice = rng.randrange(1, 40), rng.choice([0, 0, rng.randrange(60, 7200)])
+                    rows.append((guild_id, channel_id, hour, messages, voice))
+                    if guild_id == GUILD_ID:
+                        key = ((hour // 24 + 3) % 7, hour % 24)
+                        expected[key] = expected.get(key, 0) + messages
+            database.add_activity_buckets(rows)
+            buckets += len(rows)
+        print(f"wrote {buckets} hourly buckets for {args.guilds} guilds in {time.perf_counter() - started:.1f}s")
+
+        conn = database.get_db_connection()
+        for table in ['activity_hourly', 'activity_guild_hourly', 'activity_daily', 'activity_monthly']:
+            print(f"  {table}: {conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]} rows")
+
+        heatmap = _timed(f"heatmap, {args.days} days", database.get_activity_heatmap, GUILD_ID, first_hour, now_hour)
+        _timed(f"top channels, {args.days} days", database.get_top_channels, GUILD_ID, first_hour // 24)
+        _timed("top channels, 7 days", database.get_top_channels, GUILD_ID, now_hour // 24 - 7)
+        ok = {(row['weekday'], row['hour_of_day']): row['message_count'] for row in heatmap} == expected
+
+        started = time.perf_counter()
+        deleted = database.prune_activity()
+        print(f"prune: {deleted} rows in {(time.perf_counter() - started) * 1000:.0f}ms")
+        oldest = conn.execute("SELECT MIN(hour) FROM activity_hourly").fetchone()[0]
+        ok &= oldest >= now_hour - database.ACTIVITY_HOURLY_RETENTION_DAYS * 24
+        database.close_db_connections()
+
+    print("OK" if ok else "MISMATCH between the heatmap and the written buckets")
+    if not ok:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
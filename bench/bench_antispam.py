@@ -0,0 +1,98 @@
+"""Measures the message rate limiter: memory per tracked user, decisions per second,
+and that evicting idle users never changes a decision.
+
+Run from the repository root: python -m bench.bench_antispam
+"""
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+
+from antispam import MessageRateLimiter
+
+GUILD_BASE = 1 << 50
+USER_BASE = 1 << 58
+
+def reference_allow(buckets, burst, rate, guild_id, user_id, now):
+    """Token bucket without eviction, as a plain dict of lists."""
+    bucket = buckets.get((guild_id, user_id))
+    if bucket is None:
+        bucket = buckets[(guild_id, user_id)] = [burst, now]
+    tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+    bucket[1] = now
+    allowed = tokens >= 1
+    bucket[0] = tokens - 1 if allowed else tokens
+    return allowed
+
+def check_eviction(args):
+    """Replays a random trace through the limiter and the reference; decisions must match."""
+    rng = random.Random(19)
+    clock = [0.0]
+    limiter = MessageRateLimiter(burst=5, per_minute=12, clock=lambda: clock[0])
+    limiter.set_limits(GUILD_BASE + 1, 3, 2)
+    limits = {GUILD_BASE: (5.0, 12 / 60), GUILD_BASE + 1: (3.0, 2 / 60)}
+    buckets = {}
+    mismatches = allowed = 0
+    for _ in range(args.trace):
+        # Mostly quick bursts, sometimes long pauses that let generations rotate
+        clock[0] += rng.expovariate(1 / 0.5) if rng.random() < 0.999 else rng.uniform(60, 400)
+        guild_id = GUILD_BASE + rng.randrange(2)
+        user_id = USER_BASE + int(rng.paretovariate(1.2)) % 500
+        expected = reference_allow(buckets, *limits[guild_id], guild_id, user_id, clock[0])
+        actual = limiter.allow(guild_id, user_id)
+        mismatches += expected != actual
+        allowed += actual
+    print(f"eviction: {args.trace} decisions over {clock[0] / 3600:.1f}h, {allowed} earned points, "
+          f"{mismatches} differ from the reference, {len(limiter)} users tracked vs {len(buckets)} without eviction")
+    return mismatches == 0
+
+def measure_memory(users, guilds):
+    ids = [(GUILD_BASE + i % guilds, USER_BASE + i) for i in range(users)]
+    clock = [0.0]
+    tracemalloc.start()
+    limiter = MessageRateLimiter(clock=lambda: clock[0])
+    before = tracemalloc.get_traced_memory()[0]
+    for guild_id, user_id in ids:
+        limiter.allow(guild_id, user_id)
+    limiter_bytes = tracemalloc.get_traced_memory()[0] - before
+
+    before = tracemalloc.get_traced_memory()[0]
+    buckets = {}
+    for guild_id, user_id in ids:
+        reference_allow(buckets, 5.0, 0.2, guild_id, user_id, 0.0)
+    reference_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"memory at {users:,} users: {limiter_bytes / users:.0f} B/user ({limiter_bytes / 2**20:.0f} MiB), "
+          f"dict of (guild, user) -> [tokens, stamp]: {reference_bytes / users:.0f} B/user")
+    # The user ids are shared with `ids` and not counted; the bot keeps its own from the message
+    del limiter, buckets
+
+def measure_throughput(decisions, users):
+    rng = random.Random(7)
+    trace = [(GUILD_BASE + rng.randrange(10), USER_BASE + rng.randrange(users)) for _ in range(decisions)]
+    limiter = MessageRateLimiter()
+    allow = limiter.allow
+    started = time.perf_counter()
+    for guild_id, user_id in trace:
+        allow(guild_id, user_id)
+    elapsed = time.perf_counter() - started
+    print(f"throughput: {decisions / elapsed:,.0f} decisions/s over {users:,} users ({elapsed / decisions * 1e6:.2f} us each)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--guilds', type=int, default=1000)
+    parser.add_argument('--decisions', type=int, default=2_000_000)
+    parser.add_argument('--trace', type=int, default=200_000)
+    args = parser.parse_args()
+
+    ok = check_eviction(args)
+    measure_memory(args.users, args.guilds)
+    measure_throughput(args.decisions, 10_000)
+    measure_throughput(args.decisions, args.users)
+    if not ok:
+        sys.exit("FAILED: eviction changed decisions")
+
+if __name__ == '__main__':
+    main()
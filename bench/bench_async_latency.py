@@ -0,0 +1,86 @@
+"""Measures /balance response latency while a heavy write load runs.
+
+The lookups run once without any writes as a baseline, then under the write
+load both directly from the event loop and through async_database. Fails if
+the async p99 under load goes past --max-p99-ms. Run from the repository root:
+python -m bench.bench_async_latency
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import async_database
+import database
+from bench.fakes import use_temp_database
+
+async def write_load(duration, batch_size, use_async):
+    rng = random.Random(1)
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        rows = [(rng.randrange(10), rng.randrange(50000), 1, 2, 0, 1) for _ in range(batch_size)]
+        if use_async:
+            await async_database.add_points_bulk(rows)
+        else:
+            database.add_points_bulk(rows)
+        await asyncio.sleep(0)
+
+async def interactions(duration, interval, use_async):
+    """Simulates /balance calls and records how long each one takes to respond."""
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        if use_async:
+            await async_database.find_user_data(1, random.randrange(50000))
+        else:
+            database.find_user_data(1, random.randrange(50000))
+        latencies.append(time.perf_counter() - start - interval)
+    return latencies
+
+async def run(duration, batch_size, interval, use_async):
+    if not batch_size:
+        return await interactions(duration, interval, use_async)
+    _, latencies = await asyncio.gather(
+        write_load(duration, batch_size, use_async),
+        interactions(duration, interval, use_async),
+    )
+    return latencies
+
+def report(label, latencies):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{label:<22} samples={len(latencies):5d}  p50={p50:8.2f} ms  p99={p99:8.2f} ms  max={latencies[-1] * 1000:8.2f} ms")
+    return p99
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--interval', type=float, default=0.01)
+    parser.add_argument('--max-p99-ms', type=float, default=20.0, help='allowed async p99 under the write load')
+    args = parser.parse_args()
+
+    p99 = {}
+    for label, batch_size, use_async in (
+        ('async_database idle', 0, True),
+        ('blocking loaded', args.batch_size, False),
+        ('async_database loaded', args.batch_size, True),
+    ):
+        with tempfile.TemporaryDirectory() as directory:
+            use_temp_database(directory)
+            latencies = asyncio.run(run(args.duration, batch_size, args.interval, use_async))
+            p99[label] = report(label, latencies)
+    async_database.shutdown()
+    if p99['async_database loaded'] > args.max_p99_ms:
+        sys.exit(f"FAILED: p99 under load is {p99['async_database loaded']:.2f} ms, "
+                 f"over {args.max_p99_ms:.0f} ms (idle {p99['async_database idle']:.2f} ms)")
+    print(f"OK: p99 under load stays within {args.max_p99_ms:.0f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Compares per-member point updates with the bulk role and guild-wide operations.
+
+Also drives /givepoints role:, /takepoints role: and /economy through the Core cog
+to check progress reporting, event loop lag, and that balances still match
+the points ledger afterwards.
+Run from the repository root: python -m bench.bench_bulk_economy
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+
+import async_database
+import database
+from bench.fakes import use_temp_database
+from bench.fakes import FakeGuild, FakeInteraction, FakeRole
+from bench.simulate import LoopLagMonitor, make_core
+
+GUILD_ID = 1
+
+def time_call(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+def bench_database(member_ids, baseline):
+    _, elapsed = time_call(lambda: [database.update_gambling_points(GUILD_ID, user_id, 10, reason='admin') for user_id in member_ids[:baseline]])
+    print(f"update_gambling_points loop:  {baseline / elapsed:>10,.0f} users/s ({baseline} users)")
+    for name, func, args in [
+        ('give_gambling_points_bulk', database.give_gambling_points_bulk, (member_ids, 10)),
+        ('take_gambling_points_bulk', database.take_gambling_points_bulk, (member_ids, 5)),
+        ('tax_gambling_points', database.tax_gambling_points, (50,)),
+    ]:
+        (users, points), elapsed = time_call(func, GUILD_ID, *args)
+        print(f"{name + ':':<29} {users / elapsed:>10,.0f} users/s ({users} users, {points} points, {elapsed * 1000:.0f} ms)")
+
+async def bench_commands(member_ids, guild):
+    core = make_core([guild])
+    role = FakeRole(1, members=guild.members[:len(member_ids) // 2])
+    failures = []
+    try:
+        for name, command, kwargs in [
+            ('/givepoints role:', core.givepoints, {'amount': 50, 'role': role}),
+            ('/takepoints role:', core.takepoints, {'amount': 20, 'role': role}),
+            ('/economy payout', core.economy_payout, {'amount': 5}),
+            ('/economy tax', core.economy_tax, {'percent': 25}),
+        ]:
+            interaction = FakeInteraction(guild, guild.members[0])
+            with LoopLagMonitor() as lag:
+                started = time.perf_counter()
+                await command.callback(core, interaction, **kwargs)
+                elapsed = time.perf_counter() - started
+            progress = [edit['content'] for edit in interaction.edits[:-1]]
+            print(f"{name:<18} {elapsed * 1000:>7.0f} ms, {len(progress)} progress updates, "
+                  f"loop lag max {max(lag.samples, default=0) * 1000:.1f} ms: {interaction.edits[-1]['content']}")
+        # A bulk change drops the cached board, so /top has to show the new balances
+        top = await core.get_top(guild.id, 'gambling_points', 1)
+        richest = database.get_leaderboard(guild.id, point_type='gambling_points', limit=1)[0]
+        if top[0][1] != richest['gambling_points']:
+            failures.append(f"cached leaderboard shows {top[0][1]}, database has {richest['gambling_points']}")
+    finally:
+        await core.cog_unload()
+    return failures
+
+def check_ledger():
+    balances = database.reconstruct_balances(GUILD_ID)
+    rows = database.get_db_connection().execute("SELECT user_id, gambling_points FROM users WHERE guild_id = ?", (GUILD_ID,)).fetchall()
+    return [
+        f"user {row['user_id']}: balance {row['gambling_points']}, ledger {balances.get(row['user_id'], (0, 0))[1]}"
+        for row in rows
+        if balances.get(row['user_id'], (0, 0))[1] != row['gambling_points']
+    ]
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--members', type=int, default=20_000)
+    parser.add_argument('--baseline', type=int, default=2000, help='members updated one by one for comparison')
+    args = parser.parse_args()
+
+    guild = FakeGuild(GUILD_ID, members=args.members)
+    member_ids = [member.id for member in guild.members]
+    with tempfile.TemporaryDirectory() as directory:
+        await async_database.run(use_temp_database, directory)
+        try:
+            await async_database.run(bench_database, member_ids, args.baseline)
+            failures = await bench_commands(member_ids, guild)
+            failures += await async_database.run(check_ledger)
+        finally:
+            async_database.shutdown()
+            database.close_db_connections()
+    if failures:
+        print(f"FAILED: {len(failures)} problems")
+        for failure in failures[:20]:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("OK: balances match the ledger")
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+"""Renders multi-year member count histories for many guilds through the chart process pool.
+
+Reports throughput with and without downsampling and how late the event loop
+ran while charts were rendering, which should stay near zero.
+Run from the repository root: python -m bench.bench_charts
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+import charts
+
+def _history(rng, days):
+    start = date.today() - timedelta(days=days)
+    count = rng.randrange(50, 5000)
+    history = []
+    for day in range(days):
+        count = max(1, count + rng.randrange(-15, 20))
+        history.append(((start + timedelta(days=day)).isoformat(), count))
+    return history
+
+async def _loop_lag(stop, samples, interval=0.01):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+async def _run(histories, max_points):
+    stop = asyncio.Event()
+    lag = []
+    probe = asyncio.create_task(_loop_lag(stop, lag))
+    started = time.perf_counter()
+    pngs = await asyncio.gather(*(
+        charts.render(charts.render_growth_png, f"guild {i}", history, max_points)
+        for i, history in enumerate(histories)
+    ))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+    return elapsed, pngs, lag
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--guilds', type=int, default=40)
+    parser.add_argument('--years', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(12)
+    histories = [_history(rng, args.years * 365) for _ in range(args.guilds)]
+    print(f"{args.guilds} guilds x {len(histories[0])} days, {charts.CHART_WORKERS} worker(s)")
+
+    # Start the worker processes (spawn + matplotlib import) before timing
+    started = time.perf_counter()
+    await charts.render(charts.render_growth_png, "warmup", histories[0][:10])
+    print(f"pool warm-up: {time.perf_counter() - started:.2f}s")
+
+    for label, max_points in [("full history", len(histories[0])), (f"downsampled to {charts.CHART_MAX_POINTS}", charts.CHART_MAX_POINTS)]:
+        elapsed, pngs, lag = await _run(histories, max_points)
+        size = statistics.mean(len(png) for png in pngs) / 1024
+        print(
+            f"{label:<24} {elapsed:6.2f}s total, {elapsed / len(pngs) * 1000:6.1f}ms/chart, "
+            f"{size:5.1f} KiB/png, loop lag max {max(lag, default=0) * 1000:.1f}ms"
+        )
+
+    points = [(x, rng.random()) for x in range(args.years * 365)]
+    started = time.perf_counter()
+    for _ in range(100):
+        charts.downsample_lttb(points, charts.CHART_MAX_POINTS)
+    print(f"downsample_lttb {len(points)} -> {charts.CHART_MAX_POINTS}: {(time.perf_counter() - started) * 10:.2f}ms")
+    charts.shutdown()
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+"""Micro-benchmark for the hot database.py functions at different table sizes.
+
+Each function is timed with the pooled connection and with a fresh connection
+per call (the old behaviour). Run from the repository root:
+python -m bench.bench_database [--sizes 10000 100000 1000000]
+"""
+import argparse
+import random
+import tempfile
+import time
+
+import database
+from bench.fakes import use_temp_database
+
+GUILDS = 10
+
+def populate(user_rows):
+    rng = random.Random(7)
+    conn = database.get_db_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO users (guild_id, user_id, activity_points, monthly_activity_points, gambling_points) VALUES (?, ?, ?, ?, ?)",
+            ((i % GUILDS, i, rng.randrange(100000), rng.randrange(1000), rng.randrange(100000)) for i in range(user_rows))
+        )
+
+def time_calls(func, calls, reconnect):
+    start = time.perf_counter()
+    for i in range(calls):
+        func(i)
+        if reconnect:
+            database.close_db_connections()
+    return (time.perf_counter() - start) / calls * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--calls', type=int, default=2000)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            use_temp_database(directory)
+            populate(size)
+            workloads = {
+                'add_points': (lambda i: database.add_points(i % GUILDS, i * 7 % size, 1, 2), args.calls),
+                'get_user_data': (lambda i: database.get_user_data(i % GUILDS, i * 7 % size), args.calls),
+                'get_leaderboard': (lambda i: database.get_leaderboard(i % GUILDS), max(10, args.calls * 1000 // size)),
+            }
+            print(f"--- {size} user rows ---")
+            for name, (func, calls) in workloads.items():
+                pooled = time_calls(func, calls, reconnect=False)
+                fresh = time_calls(func, calls, reconnect=True)
+                print(f"{name:<16} pooled={pooled:10.1f} us/call  reconnect={fresh:10.1f} us/call")
+            database.close_db_connections()
+
+if __name__ == '__main__':
+    main()
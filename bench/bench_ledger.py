@@ -0,0 +1,91 @@
+"""Times rebuilding balances of a guild with a large points ledger, with and without a snapshot.
+
+Fills a temporary database through database.add_points_bulk and the economy
+helpers, so the ledger is written exactly like the bot writes it, then checks
+that reconstruct_balances agrees with the users table, also after old
+snapshots and the entries they cover are pruned.
+Run from the repository root: python -m bench.bench_ledger
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+
+import database
+from bench.fakes import use_temp_database
+
+GUILD_ID = 1
+
+def _users_table():
+    rows = database.get_db_connection().execute(
+        "SELECT user_id, activity_points, gambling_points FROM users WHERE guild_id = ?", (GUILD_ID,)
+    )
+    return {row['user_id']: (row['activity_points'], row['gambling_points']) for row in rows}
+
+def _timed(label, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    print(f"{label}: {time.perf_counter() - started:.3f}s")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--entries', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--tail', type=int, default=10_000, help='entries written after the snapshot')
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+
+    def write(count):
+        for start in range(0, count, args.batch):
+            rows = [
+                (GUILD_ID, rng.randrange(args.users), rng.randrange(1, 5), rng.randrange(1, 5), 0, 1)
+                for _ in range(min(args.batch, count - start))
+            ]
+            database.add_points_bulk(rows)
+        for _ in range(count // 1000):
+            database.settle_bet(GUILD_ID, rng.randrange(args.users), rng.randrange(1, 20), rng.random() < 0.5)
+
+    with tempfile.TemporaryDirectory() as directory:
+        use_temp_database(directory)
+        _timed(f"write {args.entries} ledger entries", write, args.entries)
+        entries = database.get_db_connection().execute("SELECT COUNT(*) FROM points_ledger").fetchone()[0]
+        print(f"ledger entries: {entries}")
+        expected = _users_table()
+
+        ok = True
+        # The migration seeds an empty snapshot, so this replays the whole ledger
+        balances = _timed("reconstruct guild, full ledger", database.reconstruct_balances, GUILD_ID)
+        ok &= balances == expected
+        user_id = next(iter(expected))
+        single = _timed("reconstruct one user, full ledger", database.reconstruct_balances, GUILD_ID, user_id)
+        ok &= single == {user_id: expected[user_id]}
+
+        _timed("create snapshot", database.create_ledger_snapshot, GUILD_ID)
+        write(args.tail)
+        expected = _users_table()
+        balances = _timed(f"reconstruct guild, snapshot + {args.tail} entries", database.reconstruct_balances, GUILD_ID)
+        ok &= balances == expected
+        single = _timed("reconstruct one user, snapshot + tail", database.reconstruct_balances, GUILD_ID, user_id)
+        ok &= single == {user_id: expected[user_id]}
+
+        # Once the first snapshot is pruned, only the entries after the oldest kept one remain
+        for _ in range(database.LEDGER_SNAPSHOTS_KEPT):
+            database.create_ledger_snapshot(GUILD_ID)
+            write(args.tail)
+        remaining = database.get_db_connection().execute("SELECT COUNT(*) FROM points_ledger").fetchone()[0]
+        print(f"ledger entries after {database.LEDGER_SNAPSHOTS_KEPT} more snapshots: {remaining}")
+        ok &= remaining < entries
+        ok &= database.reconstruct_balances(GUILD_ID) == _users_table()
+
+        database.close_db_connections()
+
+    print("OK" if ok else "MISMATCH between the ledger and the users table")
+    if not ok:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Benchmarks the per-guild rank index at large member counts.
+
+Run from the repository root: python -m bench.bench_rank [--members 500000]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from leaderboards import RankIndex
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--members', type=int, default=500000)
+    parser.add_argument('--operations', type=int, default=200000)
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    rows = [(user_id, rng.randrange(1_000_000)) for user_id in range(args.members)]
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = RankIndex(rows)
+    build = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(args.operations):
+        user_id = rng.randrange(args.members)
+        index.update(user_id, index.points[user_id] + rng.randrange(-50, 100))
+    updates = args.operations / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(args.operations):
+        index.rank(rng.randrange(args.members))
+    lookups = args.operations / (time.perf_counter() - start)
+
+    # Spot-check against a linear count
+    for _ in range(20):
+        user_id = rng.randrange(args.members)
+        points = index.points[user_id]
+        expected = sum(1 for value in index.points.values() if value > points) + 1
+        assert index.rank(user_id) == (expected, args.members)
+
+    print(f"members={args.members}  build={build:.2f}s  memory={memory / 2**20:.1f} MiB ({memory / args.members:.0f} B/member)")
+    print(f"updates={updates:,.0f}/s  rank lookups={lookups:,.0f}/s")
+
+if __name__ == '__main__':
+    main()
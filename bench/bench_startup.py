@@ -0,0 +1,75 @@
+"""Measures cold and warm startup of MyBot without connecting to Discord.
+
+Each boot runs in a fresh process against the same temporary database:
+  cold    - empty database: schema, migrations and a command sync
+  warm    - a restart with unchanged commands: no DDL and no sync
+  forced  - FORCE_COMMAND_SYNC=1
+Command sync is replaced by a sleep of --sync-latency seconds, roughly what
+a global sync takes. Reported phases are seconds since bot.py started importing.
+Run from the repository root: python -m bench.bench_startup
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+PHASES = ['imports', 'database', 'extensions', 'command_sync', 'setup_hook']
+
+async def _boot(directory, sync_latency):
+    import bot as bot_module
+    import time
+    from bench.fakes import use_temp_database
+    imported = time.perf_counter() - bot_module.STARTED
+
+    # setup_hook creates the schema, so it is timed as part of startup
+    use_temp_database(directory, 'startup.db', init=False)
+    bot_module.WEB_ENABLED = False
+    bot = bot_module.MyBot()
+    syncs = []
+
+    async def fake_sync(*args, **kwargs):
+        await asyncio.sleep(sync_latency)
+        syncs.append(time.perf_counter())
+        return bot.tree.get_commands()
+
+    bot.tree.sync = fake_sync
+    bot._connection.application_id = 1
+    # What login() does before calling setup_hook
+    await bot._async_setup_hook()
+    await bot.setup_hook()
+    # Gateway reconnects fire on_ready again; none of the startup work may repeat
+    for _ in range(3):
+        await bot.on_ready()
+    await bot.close()
+    return {'imports': imported, **bot.startup_timings, 'syncs': len(syncs)}
+
+def _child(directory, sync_latency):
+    import logging
+    timings = asyncio.run(_boot(directory, sync_latency))
+    logging.disable(logging.CRITICAL)
+    print(json.dumps(timings))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sync-latency', type=float, default=1.0)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child(args.child, args.sync_latency)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'boot':<8}" + "".join(f"{phase:>14}" for phase in PHASES) + f"{'syncs':>8}")
+        for name, env in [('cold', {}), ('warm', {}), ('forced', {'FORCE_COMMAND_SYNC': '1'})]:
+            result = subprocess.run(
+                [sys.executable, '-m', 'bench.bench_startup', '--child', directory, '--sync-latency', str(args.sync_latency)],
+                capture_output=True, text=True, env={**os.environ, 'METRICS_ENABLED': '0', **env}, check=True
+            )
+            timings = json.loads(result.stdout.strip().splitlines()[-1])
+            print(f"{name:<8}" + "".join(f"{timings.get(phase, 0):>13.3f}s" for phase in PHASES) + f"{timings['syncs']:>8}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Load test for the web dashboard against a local stand-in database.
+
+Polls the JSON API and HTML pages from many concurrent clients, half of
+which revalidate with If-None-Match like a dashboard would, while a writer
+thread keeps committing point batches the way the activity flush does.
+Reports request latency, the share of 304s, and whether the writer slowed down.
+Run from the repository root: python -m bench.bench_webapp
+"""
+import argparse
+import asyncio
+import random
+import socket
+import statistics
+import tempfile
+import threading
+import time
+
+import aiohttp
+
+import database
+import webapp
+from bench.fakes import use_temp_database
+
+def _fill(guilds, users):
+    rng = random.Random(14)
+    for guild_id in range(1, guilds + 1):
+        database.add_points_bulk([(guild_id, user_id, rng.randrange(500), rng.randrange(500), 0, 1) for user_id in range(users)])
+        for role_id in range(10):
+            database.add_shop_item(guild_id, role_id, rng.randrange(50, 5000))
+    conn = database.get_db_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO member_counts (guild_id, member_count, date) VALUES (?, ?, date('now', ?))",
+            [(guild_id, 100 + day, f"-{day} days") for guild_id in range(1, guilds + 1) for day in range(365)]
+        )
+
+def _writer(stop, guilds, users, interval, latencies):
+    rng = random.Random(15)
+    while not stop.is_set():
+        rows = [(rng.randrange(1, guilds + 1), rng.randrange(users), 1, 2, 0, 1) for _ in range(200)]
+        started = time.perf_counter()
+        database.add_points_bulk(rows)
+        latencies.append(time.perf_counter() - started)
+        time.sleep(interval)
+    database.close_db_connections()
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000 if values else 0
+
+def _urls(guilds, users, rng):
+    guild_id = rng.randrange(1, guilds + 1)
+    return rng.choice([
+        f"/api/guilds/{guild_id}/leaderboard?type={rng.choice(['activity_points', 'monthly_activity_points', 'gambling_points'])}",
+        f"/api/guilds/{guild_id}/users/{rng.randrange(users)}",
+        f"/api/guilds/{guild_id}/shop",
+        f"/api/guilds/{guild_id}/member-counts",
+        f"/guilds/{guild_id}",
+        "/api/guilds",
+    ])
+
+async def _client(session, base, deadline, revalidate, args, results, seed):
+    rng = random.Random(seed)
+    etags = {}
+    while time.perf_counter() < deadline:
+        url = _urls(args.guilds, args.users, rng)
+        headers = {'If-None-Match': etags[url]} if revalidate and url in etags else {}
+        started = time.perf_counter()
+        async with session.get(base + url, headers=headers) as response:
+            await response.read()
+            results.setdefault(response.status, []).append(time.perf_counter() - started)
+            if 'ETag' in response.headers:
+                etags[url] = response.headers['ETag']
+
+async def _load(base, args):
+    results = {}
+    deadline = time.perf_counter() + args.seconds
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(
+            _client(session, base, deadline, i % 2 == 0, args, results, i) for i in range(args.clients)
+        ))
+    return results
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--guilds', type=int, default=20)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-interval', type=float, default=1.0, help='seconds between batches; the bot flushes every 10s')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        use_temp_database(directory)
+        _fill(args.guilds, args.users)
+        database.close_db_connections()
+
+        # Writer alone, as a baseline
+        stop, baseline = threading.Event(), []
+        writer = threading.Thread(target=_writer, args=(stop, args.guilds, args.users, args.write_interval, baseline))
+        writer.start()
+        await asyncio.sleep(min(args.seconds, 5))
+        stop.set()
+        writer.join()
+
+        port = _free_port()
+        server = webapp.WebServer(host='127.0.0.1', port=port)
+        webapp.WEB_ACCESS_LOG = None
+        await server.start()
+        stop, under_load = threading.Event(), []
+        writer = threading.Thread(target=_writer, args=(stop, args.guilds, args.users, args.write_interval, under_load))
+        writer.start()
+        try:
+            results = await _load(f"http://127.0.0.1:{port}", args)
+        finally:
+            stop.set()
+            writer.join()
+            await server.stop()
+            database.close_db_connections()
+
+    total = sum(len(latencies) for latencies in results.values())
+    print(f"{total} requests from {args.clients} clients in {args.seconds:.0f}s: {total / args.seconds:.0f} req/s")
+    for status, latencies in sorted(results.items()):
+        print(
+            f"  {status}: {len(latencies):6d} ({len(latencies) / total * 100:4.1f}%)  "
+            f"p50 {_percentile(latencies, 0.5):6.2f}ms  p99 {_percentile(latencies, 0.99):6.2f}ms"
+        )
+    print(
+        f"writer batch commit: alone p50 {_percentile(baseline, 0.5):.2f}ms p99 {_percentile(baseline, 0.99):.2f}ms, "
+        f"under load p50 {_percentile(under_load, 0.5):.2f}ms p99 {_percentile(under_load, 0.99):.2f}ms "
+        f"({len(under_load)} batches, mean {statistics.mean(under_load) * 1000 if under_load else 0:.2f}ms)"
+    )
+
+if __name__ == '__main__':
+    asyncio.run(main())
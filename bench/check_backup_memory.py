@@ -0,0 +1,155 @@
+"""Backs up, exports and re-imports a multi-GB database and checks memory stays bounded.
+
+Each operation runs in its own process, which reports its peak RSS growth over
+the RSS it had before starting. The backup runs while a writer thread keeps
+committing, like the bot would; its writes must keep going and the copy must
+pass an integrity check.
+Run from the repository root: python -m bench.check_backup_memory [--size-gb 2]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import database
+from bench.fakes import use_temp_database
+
+GUILD_ID = 1
+OTHER_GUILD_ID = 2
+LEDGER_ROWS_PER_STEP = 1_000_000
+
+def _rss_mb():
+    with open('/proc/self/statm') as file:
+        return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+
+def _peak_rss_mb():
+    # VmHWM, unlike ru_maxrss, is not carried over from the parent across exec
+    with open('/proc/self/status') as file:
+        for line in file:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+
+def build(directory, size_gb, guild_users):
+    """Fills a database with one big guild and enough ledger history to reach `size_gb`."""
+    use_temp_database(directory)
+    conn = database.get_db_connection()
+    with conn:
+        conn.execute(
+            """
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+            INSERT INTO users (guild_id, user_id, activity_points, gambling_points, message_count, last_activity_timestamp)
+            SELECT ?, i, i % 1000, i % 5000, i % 300, '2024-01-01 00:00:00' FROM n
+            """,
+            (guild_users, GUILD_ID)
+        )
+    target = size_gb * 2**30
+    while os.path.getsize(database.DB_NAME) < target:
+        with conn:
+            conn.execute(
+                """
+                WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+                INSERT INTO points_ledger (guild_id, user_id, activity_delta, gambling_delta, reason, created_at)
+                SELECT ?, i % ?, 1, 2, 'activity ' || hex(randomblob(80)), '2024-01-01 00:00:00' FROM n
+                """,
+                (LEDGER_ROWS_PER_STEP, OTHER_GUILD_ID, 50_000)
+            )
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    database.close_db_connections()
+
+def op_backup(directory):
+    use_temp_database(directory, init=False)
+    import backup
+    latencies = []
+    stop = threading.Event()
+
+    def writer():
+        user_id = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            database.update_gambling_points(OTHER_GUILD_ID, user_id % 1000, 1)
+            latencies.append(time.perf_counter() - started)
+            user_id += 1
+            time.sleep(0.01)
+
+    thread = threading.Thread(target=writer)
+    baseline = _rss_mb()
+    thread.start()
+    started = time.perf_counter()
+    path = backup.create_backup(os.path.join(directory, 'backup.db'))
+    elapsed = time.perf_counter() - started
+    peak = _peak_rss_mb()
+    stop.set()
+    thread.join()
+    database.close_db_connections()
+    check = sqlite3.connect(path).execute("PRAGMA quick_check").fetchone()[0]
+    return {
+        'seconds': round(elapsed, 1), 'baseline_mb': round(baseline), 'peak_mb': round(peak),
+        'size_gb': round(os.path.getsize(path) / 2**30, 2), 'quick_check': check,
+        'writes_during_backup': len(latencies), 'write_max_ms': round(max(latencies, default=0) * 1000, 1),
+    }
+
+def op_export(directory):
+    use_temp_database(directory, init=False)
+    import backup
+    baseline = _rss_mb()
+    started = time.perf_counter()
+    with open(os.path.join(directory, 'guild.ndjson'), 'w', encoding='utf-8') as file:
+        rows = backup.export_ndjson(GUILD_ID, file)
+    return {'seconds': round(time.perf_counter() - started, 1), 'baseline_mb': round(baseline), 'peak_mb': round(_peak_rss_mb()), 'rows': rows}
+
+def op_import(directory):
+    use_temp_database(directory, 'imported.db')
+    import backup
+    baseline = _rss_mb()
+    started = time.perf_counter()
+    with open(os.path.join(directory, 'guild.ndjson'), encoding='utf-8') as file:
+        counts = backup.import_ndjson(file)
+    return {'seconds': round(time.perf_counter() - started, 1), 'baseline_mb': round(baseline), 'peak_mb': round(_peak_rss_mb()), 'rows': counts.get('users', 0)}
+
+OPERATIONS = {'backup': op_backup, 'export': op_export, 'import': op_import}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size-gb', type=float, default=2.0)
+    parser.add_argument('--guild-users', type=int, default=1_000_000, help='users in the exported guild')
+    parser.add_argument('--max-growth-mb', type=float, default=64, help='allowed peak RSS growth per operation')
+    parser.add_argument('--directory', help='where to build the database (default: a temporary directory)')
+    parser.add_argument('--operation', choices=list(OPERATIONS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.operation:
+        print(json.dumps(OPERATIONS[args.operation](args.directory)))
+        return
+
+    failures = []
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        started = time.perf_counter()
+        build(directory, args.size_gb, args.guild_users)
+        print(f"built {os.path.getsize(database.DB_NAME) / 2**30:.2f} GB in {time.perf_counter() - started:.0f}s")
+        for name in OPERATIONS:
+            output = subprocess.run(
+                [sys.executable, '-m', 'bench.check_backup_memory', '--operation', name, '--directory', directory],
+                capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            growth = result['peak_mb'] - result['baseline_mb']
+            print(f"{name:<7} growth {growth:>5.0f} MB  " + ", ".join(f"{key}={value}" for key, value in result.items()))
+            if growth > args.max_growth_mb:
+                failures.append(f"{name} grew by {growth:.0f} MB")
+            if result.get('quick_check', 'ok') != 'ok':
+                failures.append(f"backup failed its integrity check: {result['quick_check']}")
+            if name != 'backup' and result['rows'] < args.guild_users:
+                failures.append(f"{name} handled {result['rows']} users, expected {args.guild_users}")
+            if name == 'backup' and not result['writes_during_backup']:
+                failures.append("no writes went through during the backup")
+    if failures:
+        print("FAILED: " + "; ".join(failures))
+        sys.exit(1)
+    print(f"OK: every operation stayed within {args.max_growth_mb:.0f} MB")
+
+if __name__ == '__main__':
+    main()
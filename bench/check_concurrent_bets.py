@@ -0,0 +1,67 @@
+"""Fires thousands of parallel bets and checks that balances never go negative and totals reconcile.
+
+Each worker thread has its own pooled connection, so the bets really race
+inside SQLite. Run from the repository root: python -m bench.check_concurrent_bets
+"""
+import argparse
+import random
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+from bench.fakes import use_temp_database
+
+GUILD_ID = 1
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bets', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--starting-balance', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        use_temp_database(directory)
+        for user_id in range(args.users):
+            database.update_gambling_points(GUILD_ID, user_id, args.starting_balance)
+
+        applied = []
+        lock = threading.Lock()
+
+        def place_bet(seed):
+            rng = random.Random(seed)
+            user_id = rng.randrange(args.users)
+            amount = rng.randrange(1, 60)
+            won = rng.random() < 0.5
+            balance = database.settle_bet(GUILD_ID, user_id, amount, won)
+            if balance is not None:
+                with lock:
+                    applied.append((user_id, amount if won else -amount, balance))
+
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            list(pool.map(place_bet, range(args.bets)))
+
+        conn = database.get_db_connection()
+        balances = dict(conn.execute("SELECT user_id, gambling_points FROM users WHERE guild_id = ?", (GUILD_ID,)).fetchall())
+        expected = {user_id: args.starting_balance for user_id in range(args.users)}
+        for user_id, delta, _ in applied:
+            expected[user_id] += delta
+
+        failures = []
+        if any(balance < 0 for _, _, balance in applied) or any(balance < 0 for balance in balances.values()):
+            failures.append("a balance went negative")
+        if balances != expected:
+            failures.append(f"balances don't reconcile: db={balances} expected={expected}")
+        database.close_db_connections()
+
+    print(f"{len(applied)} of {args.bets} bets settled, {args.bets - len(applied)} rejected for insufficient funds")
+    if failures:
+        print("\n".join(failures))
+        sys.exit(1)
+    print("No negative balances; totals reconcile")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""Checks that paging through a leaderboard stays consistent while scores change.
+
+Walks a whole board page by page, changing the points of random users between
+pages. With keyset pagination every user whose points did not change must
+show up exactly once; the same walk with OFFSET is shown for comparison.
+Also compares how long a deep page takes against the first one, and drives
+the /wallet buttons through the Core cog.
+Run from the repository root: python -m bench.check_leaderboard_pages
+"""
+import argparse
+import asyncio
+import random
+import sys
+import tempfile
+import time
+
+import async_database
+import database
+from bench.fakes import use_temp_database
+from bench.fakes import FakeGuild, FakeInteraction, FakeMember
+from bench.simulate import make_core
+from pagination import PAGE_SIZE
+
+GUILD_ID = 1
+POINT_TYPE = 'gambling_points'
+
+def seed(users, rng):
+    conn = database.get_db_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO users (guild_id, user_id, gambling_points) VALUES (?, ?, ?)",
+            ((GUILD_ID, GUILD_ID * 1_000_000 + i, rng.randrange(1000)) for i in range(users))
+        )
+
+def offset_page(page, page_size):
+    conn = database.get_db_connection()
+    return conn.execute(
+        f"SELECT user_id, {POINT_TYPE} FROM users WHERE guild_id = ? ORDER BY {POINT_TYPE} DESC, user_id DESC LIMIT ? OFFSET ?",
+        (GUILD_ID, page_size, page * page_size)
+    ).fetchall()
+
+def walk(next_page, user_ids, changes_per_page, rng):
+    """Reads pages until one comes back empty, changing random users' points in between.
+
+    Returns (times each user was listed, users whose points changed, pages out of order).
+    """
+    seen, changed, out_of_order = {}, set(), 0
+    page_number, cursor = 0, None
+    while True:
+        rows = next_page(page_number, cursor)
+        if not rows:
+            return seen, changed, out_of_order
+        keys = [(row[POINT_TYPE], row['user_id']) for row in rows]
+        out_of_order += keys != sorted(keys, reverse=True)
+        for row in rows:
+            seen[row['user_id']] = seen.get(row['user_id'], 0) + 1
+        page_number, cursor = page_number + 1, keys[-1]
+        for user_id in rng.sample(user_ids, changes_per_page):
+            changed.add(user_id)
+            database.update_gambling_points(GUILD_ID, user_id, rng.randint(-300, 300), reason='admin')
+
+def report(name, seen, changed, out_of_order, user_ids):
+    stable = [user_id for user_id in user_ids if user_id not in changed]
+    missing = sum(1 for user_id in stable if user_id not in seen)
+    repeated = sum(1 for user_id in stable if seen.get(user_id, 0) > 1)
+    print(f"{name:<7} {len(changed)} users changed during the walk; of the {len(stable)} others "
+          f"{missing} were skipped and {repeated} listed twice; {out_of_order} pages out of order")
+    return missing, repeated, out_of_order
+
+def check_stability(args, user_ids):
+    rng = random.Random(22)
+    keyset = walk(
+        lambda page, cursor: database.get_leaderboard_page(GUILD_ID, POINT_TYPE, cursor, args.page_size),
+        user_ids, args.changes_per_page, rng
+    )
+    keyset_problems = report('keyset', *keyset, user_ids)
+    offset = walk(lambda page, cursor: offset_page(page, args.page_size), user_ids, args.changes_per_page, rng)
+    report('offset', *offset, user_ids)
+    return [] if not any(keyset_problems) else [f"keyset walk: {keyset_problems[0]} skipped, {keyset_problems[1]} repeated, {keyset_problems[2]} out of order"]
+
+def time_pages(args, users):
+    deep_page = users // args.page_size - 1
+    boundary = offset_page(deep_page, args.page_size)[0]
+    # The row before the deep page is its cursor; the row itself is found with OFFSET once
+    previous = offset_page(deep_page * args.page_size - 1, 1)[0]
+    cursor = (previous[POINT_TYPE], previous['user_id'])
+
+    def timed(func):
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            rows = func()
+        return (time.perf_counter() - started) / args.repeat * 1000, rows
+
+    first, _ = timed(lambda: database.get_leaderboard_page(GUILD_ID, POINT_TYPE, None, args.page_size))
+    keyset, rows = timed(lambda: database.get_leaderboard_page(GUILD_ID, POINT_TYPE, cursor, args.page_size))
+    offset, _ = timed(lambda: offset_page(deep_page, args.page_size))
+    print(f"page 1: {first:.3f} ms; page {deep_page + 1}: keyset {keyset:.3f} ms, OFFSET {offset:.3f} ms")
+    if rows[0]['user_id'] != boundary['user_id']:
+        return [f"keyset page {deep_page + 1} starts at user {rows[0]['user_id']}, OFFSET at {boundary['user_id']}"]
+    return []
+
+async def click(view, interaction, button):
+    """Dispatches a button click the way discord.py does: interaction_check first."""
+    if await view.interaction_check(interaction):
+        await button.callback(interaction)
+    return interaction.response.messages[-1][1]
+
+def listed_users(embed):
+    return [line.split('**')[1].split('. ', 1)[1] for line in embed.description.split("\n")]
+
+def seed_members(guild):
+    conn = database.get_db_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO users (guild_id, user_id, gambling_points) VALUES (?, ?, ?)",
+            ((guild.id, member.id, 1000 + i) for i, member in enumerate(guild.members))
+        )
+
+async def check_buttons(guild):
+    failures = []
+    clock = [0.0]
+    core = make_core([guild])
+    core.leaderboard_pages._clock = lambda: clock[0]
+    owner = guild.members[0]
+    try:
+        interaction = FakeInteraction(guild, owner)
+        await core.wallet.callback(core, interaction)
+        first = interaction.response.messages[0][1]
+        view = first['view']
+        pages = [listed_users(first['embed'])]
+        for _ in range(2):
+            pages.append(listed_users((await click(view, FakeInteraction(guild, owner), view.next_page))['embed']))
+        if len({name for page in pages for name in page}) != 3 * PAGE_SIZE:
+            failures.append("the first three pages overlap or are short")
+
+        # The last user of page 3 becomes the richest; page 2 is still cached, page 1 comes from the live board
+        richest = guild.get_member(int(pages[2][-1].rsplit('-', 1)[1]))
+        await async_database.update_gambling_points(guild.id, richest.id, 10_000, reason='admin')
+        cached = listed_users((await click(view, FakeInteraction(guild, owner), view.previous_page))['embed'])
+        if cached != pages[1]:
+            failures.append("page 2 changed within the cache window")
+        first_again = listed_users((await click(view, FakeInteraction(guild, owner), view.first_page))['embed'])
+        if first_again[0] != richest.display_name:
+            failures.append(f"page 1 does not show the new richest user: {first_again[0]}")
+        if not view.previous_page.disabled or view.next_page.disabled:
+            failures.append("wrong buttons enabled on page 1")
+        clock[0] += 3600
+        refreshed = listed_users((await click(view, FakeInteraction(guild, owner), view.next_page))['embed'])
+        if refreshed[0] != pages[0][-1]:
+            failures.append(f"page 2 does not continue after the new page 1: starts with {refreshed[0]}")
+
+        stranger = FakeInteraction(guild, FakeMember(guild, 42))
+        await click(view, stranger, view.next_page)
+        if not stranger.response.messages[-1][1].get('ephemeral'):
+            failures.append("someone else could turn the pages")
+        print(f"buttons: {len(pages)} pages of {PAGE_SIZE}, page cache {core.leaderboard_pages.stats()}")
+    finally:
+        await core.cog_unload()
+    return failures
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=200_000)
+    parser.add_argument('--page-size', type=int, default=50, help='rows per page of the walks')
+    parser.add_argument('--changes-per-page', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=50, help='runs of each timed query')
+    args = parser.parse_args()
+
+    guild = FakeGuild(GUILD_ID + 1, members=3 * PAGE_SIZE + 5)
+    with tempfile.TemporaryDirectory() as directory:
+        await async_database.run(use_temp_database, directory)
+        try:
+            await async_database.run(seed, args.users, random.Random(1))
+            user_ids = [GUILD_ID * 1_000_000 + i for i in range(args.users)]
+            failures = await async_database.run(check_stability, args, user_ids)
+            failures += await async_database.run(time_pages, args, args.users)
+            await async_database.run(seed_members, guild)
+            failures += await check_buttons(guild)
+        finally:
+            async_database.shutdown()
+            database.close_db_connections()
+    if failures:
+        print("FAILED: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK: keyset pages list every unchanged user exactly once")
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+"""Checks the in-memory leaderboards and rank indexes against SQL under randomized point streams.
+
+The stream also crosses month boundaries and restarts (fresh caches over the same database).
+
+Run from the repository root: python -m bench.check_leaderboards [--rounds N]
+"""
+import argparse
+import random
+import sys
+import tempfile
+
+import database
+from bench.fakes import use_temp_database
+from leaderboards import POINT_TYPES, LeaderboardCache, RankCache
+
+def check(cache, guild_id, limit):
+    for point_type in POINT_TYPES:
+        cached = cache.top(guild_id, point_type, limit)
+        if cached is None:
+            cached = cache.seed(guild_id, point_type, limit)
+        expected = [(row['user_id'], row[point_type]) for row in database.get_leaderboard(guild_id, point_type, limit)]
+        if cached != expected:
+            return f"{point_type}: cache={cached} sql={expected}"
+    return None
+
+def check_rank(ranks, guild_id, user_id):
+    conn = database.get_db_connection()
+    for point_type in POINT_TYPES:
+        result = ranks.rank(guild_id, point_type, user_id)
+        if result is False:
+            result = ranks.seed(guild_id, point_type, user_id)
+        column = point_type
+        if point_type == 'monthly_activity_points':
+            column = f"(CASE WHEN monthly_epoch = {database.current_month_epoch()} THEN monthly_activity_points ELSE 0 END)"
+        row = conn.execute(f"SELECT {column} FROM users WHERE guild_id = ? AND user_id = ?", (guild_id, user_id)).fetchone()
+        expected = None
+        if row is not None:
+            above = conn.execute(f"SELECT COUNT(*) FROM users WHERE guild_id = ? AND {column} > ?", (guild_id, row[0])).fetchone()[0]
+            total = conn.execute("SELECT COUNT(*) FROM users WHERE guild_id = ?", (guild_id,)).fetchone()[0]
+            expected = (row[0], above + 1, total)
+        if result != expected:
+            return f"rank {point_type} of {user_id}: index={result} sql={expected}"
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rounds', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    month = [database.current_month_epoch()]
+    database.current_month_epoch = lambda now=None: month[0]
+    with tempfile.TemporaryDirectory() as directory:
+        use_temp_database(directory)
+        cache = LeaderboardCache(capacity=20)
+        ranks = RankCache()
+        database.add_points_listener(cache.on_points_changed)
+        database.add_points_listener(ranks.on_points_changed)
+        for round_number in range(args.rounds):
+            guild_id = rng.randrange(3)
+            action = rng.random()
+            if action < 0.6:
+                rows = [(guild_id, rng.randrange(args.users), rng.randrange(5), rng.randrange(5), 0, 0) for _ in range(rng.randrange(1, 30))]
+                database.add_points_bulk(rows)
+            elif action < 0.97:
+                database.update_gambling_points(guild_id, rng.randrange(args.users), rng.randrange(-50, 50))
+            elif action < 0.99:
+                month[0] += 1
+            else:
+                database.remove_points_listener(cache.on_points_changed)
+                database.remove_points_listener(ranks.on_points_changed)
+                cache = LeaderboardCache(capacity=20)
+                ranks = RankCache()
+                database.add_points_listener(cache.on_points_changed)
+                database.add_points_listener(ranks.on_points_changed)
+            error = check(cache, guild_id, limit=rng.choice([1, 5, 10])) or check_rank(ranks, guild_id, rng.randrange(args.users))
+            if error:
+                print(f"Mismatch in round {round_number} (guild {guild_id}): {error}")
+                sys.exit(1)
+        database.close_db_connections()
+    print(f"{args.rounds} rounds matched SQL")
+
+if __name__ == '__main__':
+    main()
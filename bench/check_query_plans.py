@@ -0,0 +1,59 @@
+"""Fails if a leaderboard or per-guild query falls back to a table scan.
+
+The statements are captured from the database functions themselves with a
+trace callback, so the plans checked are those of the SQL the bot runs.
+
+Run from the repository root: python -m bench.check_query_plans
+"""
+import sys
+import tempfile
+
+import database
+from bench.fakes import use_temp_database
+
+def guarded_queries():
+    """Yields (name, call) pairs; each call runs one of the database functions under test."""
+    for point_type in ['activity_points', 'gambling_points', 'monthly_activity_points']:
+        yield f"leaderboard:{point_type}", lambda point_type=point_type: database.get_leaderboard(1, point_type, 10)
+        yield (
+            f"leaderboard_page:{point_type}",
+            lambda point_type=point_type: database.get_leaderboard_page(1, point_type, (500, 42), 11)
+        )
+    yield "member_count_history", lambda: database.get_member_count_history(1, '2024-01-01')
+    yield "activity_heatmap", lambda: database.get_activity_heatmap(1, 0, 1000)
+
+def traced_statements(conn, call):
+    """Runs `call` and returns the SELECT statements it sent to SQLite, with the parameters filled in."""
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        conn.set_trace_callback(None)
+    return [sql.strip() for sql in statements if sql.lstrip().upper().startswith('SELECT')]
+
+def main():
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        use_temp_database(directory)
+        conn = database.get_db_connection()
+        for name, call in guarded_queries():
+            statements = traced_statements(conn, call)
+            if not statements:
+                print(f"NONE  {name}: no SELECT was traced")
+                failures.append(name)
+            for sql in statements:
+                plan = [row['detail'] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+                status = "ok"
+                # Grouping a bounded index range is fine; sorting for ORDER BY ... LIMIT is not
+                if any(step.startswith('SCAN') or ('TEMP B-TREE' in step and 'ORDER BY' in step) for step in plan):
+                    status = "SCAN"
+                    failures.append(name)
+                print(f"{status:<5} {name}: {'; '.join(plan)}")
+        database.close_db_connections()
+    if failures:
+        print(f"{len(failures)} queries fall back to a scan or sort: {', '.join(failures)}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
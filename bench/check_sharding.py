@@ -0,0 +1,176 @@
+"""Runs several sharded worker processes against one database and checks nothing is awarded twice.
+
+Every worker is fed the events of every guild by a fake gateway, the worst
+case of a misrouted or overlapping deployment, and has to skip the guilds
+whose shards it doesn't own. Afterwards each member's points, message count
+and voice time must match a single pass over the events.
+Run from the repository root: python -m bench.check_sharding
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+import database
+import sharding
+from bench.fakes import use_temp_database
+from bench.fakes import FakeGuild, FakeMessage, FakeVoiceState
+
+VOICE_MEMBERS = 3
+
+def make_guilds(count, members):
+    rng = random.Random(18)
+    # Snowflake-shaped ids, the shard comes from the bits above bit 22. Kept small
+    # enough that FakeGuild's derived member ids still fit in an SQLite integer.
+    return [FakeGuild(rng.randrange(1 << 10, 1 << 21) << 22 | i, members=members, text_channels=3, voice_channels=1) for i in range(count)]
+
+def message_events(guilds, count):
+    rng = random.Random(42)
+    created_at = datetime.now(timezone.utc)
+    for _ in range(count):
+        guild = rng.choice(guilds)
+        yield FakeMessage(rng.choice(guild.members), rng.choice(guild.text_channels), created_at)
+
+def split_shards(shard_count, workers):
+    """Splits the shard ids between workers, interleaved."""
+    return [list(range(shard_count))[worker::workers] for worker in range(workers)]
+
+async def run_worker(args):
+    from antispam import MessageRateLimiter
+    from bench.simulate import make_core
+    from cogs.core import VOICE_AWARD_INTERVAL_SECONDS
+    from voice_sessions import VoiceSessionTracker
+
+    database.DB_FOLDER = args.directory
+    database.DB_NAME = os.path.join(args.directory, 'bench.db')
+    guilds = make_guilds(args.guilds, args.members)
+    core = make_core(guilds)
+    core.bot.shard_count = args.shards
+    core.bot.shard_ids = sharding.parse_shard_ids(args.worker)
+    clock = [0.0]
+    core.voice_sessions = VoiceSessionTracker(VOICE_AWARD_INTERVAL_SECONDS, clock=lambda: clock[0])
+    # The clock stands still while messages arrive, so each member earns points for at most a burst of them
+    core.message_limiter = MessageRateLimiter(clock=lambda: clock[0])
+    try:
+        for guild in guilds:
+            channel = guild.voice_channels[0]
+            for member in guild.members[:VOICE_MEMBERS]:
+                member.voice = FakeVoiceState(channel)
+                channel.members.append(member)
+        await core.on_ready()
+
+        for message in message_events(guilds, args.messages):
+            await core.on_message(message)
+
+        # Everyone already in voice earns args.intervals awards, then one more member joins for a single award
+        clock[0] += args.intervals * VOICE_AWARD_INTERVAL_SECONDS
+        for guild in guilds:
+            member = guild.members[VOICE_MEMBERS]
+            member.voice = FakeVoiceState(guild.voice_channels[0])
+            await core.on_voice_state_update(member, FakeVoiceState(), member.voice)
+        clock[0] += VOICE_AWARD_INTERVAL_SECONDS
+        await core.voice_activity_check.coro(core)
+        await core.ledger_snapshot_task.coro(core)
+        await core.activity_prune_task.coro(core)
+    finally:
+        await core.cog_unload()
+    owned = [guild.id for guild in guilds if core.owns(guild)]
+    print(json.dumps({'shard_ids': core.bot.shard_ids, 'primary': sharding.is_primary(core.bot), 'guilds': owned}))
+
+def expected_totals(args):
+    from antispam import DEFAULT_BURST
+    from cogs.core import MESSAGE_ACTIVITY_POINTS, VOICE_ACTIVITY_POINTS, VOICE_AWARD_INTERVAL_SECONDS
+
+    guilds = make_guilds(args.guilds, args.members)
+    totals = {}  # (guild_id, user_id) -> [activity_points, message_count, voice_seconds]
+    for message in message_events(guilds, args.messages):
+        row = totals.setdefault((message.guild.id, message.author.id), [0, 0, 0])
+        if row[1] < DEFAULT_BURST:
+            row[0] += MESSAGE_ACTIVITY_POINTS
+        row[1] += 1
+    for guild in guilds:
+        for index, member in enumerate(guild.members[:VOICE_MEMBERS + 1]):
+            awards = args.intervals + 1 if index < VOICE_MEMBERS else 1
+            row = totals.setdefault((guild.id, member.id), [0, 0, 0])
+            row[0] += awards * VOICE_ACTIVITY_POINTS
+            row[2] += awards * VOICE_AWARD_INTERVAL_SECONDS
+    return guilds, totals
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--shards', type=int, default=8)
+    parser.add_argument('--guilds', type=int, default=40)
+    parser.add_argument('--members', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=20_000)
+    parser.add_argument('--intervals', type=int, default=3, help='award intervals before the late joiner arrives')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--directory', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        asyncio.run(run_worker(args))
+        return
+
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        use_temp_database(directory)
+        database.close_db_connections()
+        common = [
+            '--directory', directory, '--shards', str(args.shards), '--guilds', str(args.guilds),
+            '--members', str(args.members), '--messages', str(args.messages), '--intervals', str(args.intervals),
+        ]
+        # All workers run at the same time, so their writes contend for the database
+        processes = [
+            subprocess.Popen(
+                [sys.executable, '-m', 'bench.check_sharding', '--worker', ','.join(map(str, shard_ids))] + common,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+            )
+            for shard_ids in split_shards(args.shards, args.workers)
+        ]
+        reports = []
+        for process in processes:
+            stdout, stderr = process.communicate()
+            if process.returncode != 0:
+                sys.exit(f"worker failed:\n{stderr}")
+            reports.append(json.loads(stdout.strip().splitlines()[-1]))
+
+        guilds, expected = expected_totals(args)
+        owners = {}
+        for report in reports:
+            print(f"worker shards={report['shard_ids']} primary={report['primary']} guilds={len(report['guilds'])}")
+            for guild_id in report['guilds']:
+                owners.setdefault(guild_id, []).append(report['shard_ids'])
+        for guild in guilds:
+            if len(owners.get(guild.id, [])) != 1:
+                failures.append(f"guild {guild.id} is owned by {len(owners.get(guild.id, []))} workers")
+        if sum(report['primary'] for report in reports) != 1:
+            failures.append("expected exactly one primary worker")
+
+        database.DB_NAME = os.path.join(directory, 'bench.db')
+        rows = database.get_db_connection().execute(
+            "SELECT guild_id, user_id, activity_points, message_count, voice_seconds FROM users"
+        ).fetchall()
+        actual = {(row['guild_id'], row['user_id']): [row['activity_points'], row['message_count'], row['voice_seconds']] for row in rows}
+        for key in expected.keys() | actual.keys():
+            if expected.get(key, [0, 0, 0]) != actual.get(key, [0, 0, 0]):
+                failures.append(f"guild {key[0]} user {key[1]}: expected {expected.get(key)}, got {actual.get(key)}")
+        hourly = database.get_db_connection().execute("SELECT SUM(message_count) FROM activity_hourly").fetchone()[0]
+        if hourly != args.messages:
+            failures.append(f"activity_hourly counts {hourly} messages, expected {args.messages}")
+        database.close_db_connections()
+
+    print(f"{len(expected)} members across {len(guilds)} guilds, {args.messages} messages, {args.workers} workers")
+    if failures:
+        print(f"FAILED: {len(failures)} problems")
+        for failure in failures[:20]:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("OK: every guild has one worker and nothing was counted twice")
+
+if __name__ == '__main__':
+    main()
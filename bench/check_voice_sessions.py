@@ -0,0 +1,115 @@
+"""Replays synthetic voice state streams through VoiceSessionTracker.
+
+Credited seconds and awards, and channel member-seconds per hour, are compared
+with a brute-force, second-by-second simulation of the same stream.
+Run from the repository root: python -m bench.check_voice_sessions [--seconds N]
+"""
+import argparse
+import random
+import sys
+
+from voice_sessions import VoiceSessionTracker
+
+GUILD_ID = 1
+
+def check_disconnect():
+    """Two members talk for 5 minutes on each side of a 2 hour disconnect; only those 10 minutes count."""
+    clock = [0]
+    tracker = VoiceSessionTracker(award_interval=600, clock=lambda: clock[0], wall_clock=lambda: 1_700_000_000 + clock[0])
+    states = [(10, 1, True, False), (10, 2, True, False)]
+    tracker.sync_guild(GUILD_ID, states)
+    clock[0] = 300
+    tracker.close_guild(GUILD_ID)
+    clock[0] += 7200
+    tracker.sync_guild(GUILD_ID, states)
+    clock[0] += 300
+    credited = {user_id: (seconds, earned) for _, user_id, seconds, earned in tracker.collect()}
+    if credited != {1: (600, 1), 2: (600, 1)}:
+        print(f"disconnect: expected 600s/1 award each, tracker {credited}")
+        return 1
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=12)
+    parser.add_argument('--channels', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    clock = [0]
+    # The wall clock starts mid-hour, so sessions straddle hour boundaries
+    start = 1_700_000_000 + 1234
+    tracker = VoiceSessionTracker(award_interval=600, clock=lambda: clock[0], wall_clock=lambda: start + clock[0])
+    state = {}  # user_id -> (channel_id, active)
+    bots = {user_id for user_id in range(args.users) if rng.random() < 0.15}
+    expected = {}
+    collected = {}
+    expected_channels = {}
+    collected_channels = {}
+    awards = {}
+
+    for second in range(args.seconds):
+        clock[0] = second
+        # Apply this second's events before crediting it, like the tracker does
+        for _ in range(rng.choice([0, 0, 0, 1, 2])):
+            user_id = rng.randrange(args.users)
+            before_channel, _ = state.get(user_id, (None, False))
+            after_channel = rng.choice([None] + list(range(args.channels)))
+            active = rng.random() < 0.7
+            tracker.update(GUILD_ID, user_id, before_channel, after_channel, active, bot=user_id in bots)
+            if after_channel is None:
+                state.pop(user_id, None)
+            else:
+                state[user_id] = (after_channel, active)
+        if second % 997 == 0:
+            for _, user_id, seconds, earned in tracker.collect():
+                collected[user_id] = collected.get(user_id, 0) + seconds
+                awards[user_id] = awards.get(user_id, 0) + earned
+            for _, channel_id, hour, seconds in tracker.collect_channels():
+                key = (channel_id, hour)
+                collected_channels[key] = collected_channels.get(key, 0) + seconds
+
+        for channel_id in range(args.channels):
+            active = [user_id for user_id, (channel, is_active) in state.items() if channel == channel_id and is_active]
+            if len(active) > 1:
+                for user_id in active:
+                    if user_id not in bots:
+                        expected[user_id] = expected.get(user_id, 0) + 1
+                        key = (channel_id, (start + second) // 3600)
+                        expected_channels[key] = expected_channels.get(key, 0) + 1
+
+    clock[0] = args.seconds
+    for _, user_id, seconds, earned in tracker.collect():
+        collected[user_id] = collected.get(user_id, 0) + seconds
+        awards[user_id] = awards.get(user_id, 0) + earned
+    for _, channel_id, hour, seconds in tracker.collect_channels():
+        key = (channel_id, hour)
+        collected_channels[key] = collected_channels.get(key, 0) + seconds
+
+    failures = 0
+    # Everyone's partial interval is forgotten once they have earned nothing for a day
+    carried = len(tracker._carry)
+    for user_id, (channel, _) in list(state.items()):
+        tracker.update(GUILD_ID, user_id, channel, None, False, bot=user_id in bots)
+    clock[0] += tracker.carry_ttl + 1
+    tracker.collect()
+    if tracker._carry:
+        print(f"{len(tracker._carry)} of {carried} partial intervals were kept after {tracker.carry_ttl}s without voice time")
+        failures += 1
+    failures += check_disconnect()
+    for user_id in sorted(set(expected) | set(collected)):
+        want, got = expected.get(user_id, 0), collected.get(user_id, 0)
+        if want != got or awards.get(user_id, 0) != want // 600:
+            print(f"user {user_id}: expected {want}s/{want // 600} awards, tracker {got}s/{awards.get(user_id, 0)} awards")
+            failures += 1
+    if expected_channels != collected_channels:
+        print(f"channel member-seconds per hour: expected {expected_channels}, tracker {collected_channels}")
+        failures += 1
+    if failures:
+        sys.exit(1)
+    print(f"{args.seconds}s of voice events matched for {len(expected)} members")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Stand-ins for the discord.py objects the Core cog touches, and a throwaway database.
+
+They only implement the attributes and coroutines the cog actually uses, so
+the cog can be driven without a gateway connection.
+"""
+import os
+import time
+from datetime import datetime, timezone
+
+import database
+
+def use_temp_database(directory, name='bench.db', init=True):
+    """Points the database module at a file in `directory`, creating the schema unless `init` is False."""
+    database.close_db_connections()
+    database.DB_FOLDER = directory
+    database.DB_NAME = os.path.join(directory, name)
+    if init:
+        database.init_db()
+
+class FakeRole:
+    def __init__(self, role_id, name=None, members=None):
+        self.id = role_id
+        self.name = name or f"role-{role_id}"
+        self.members = members or []
+
+class FakeVoiceState:
+    def __init__(self, channel=None, self_mute=False, self_deaf=False):
+        self.channel = channel
+        self.self_mute = self_mute
+        self.self_deaf = self_deaf
+
+class FakeMember:
+    def __init__(self, guild, member_id, bot=False):
+        self.guild = guild
+        self.id = member_id
+        self.bot = bot
+        self.display_name = f"member-{member_id}"
+        self.roles = []
+        self.voice = None
+
+    async def add_roles(self, *roles, reason=None):
+        self.roles.extend(roles)
+
+    async def remove_roles(self, *roles, reason=None):
+        self.roles = [role for role in self.roles if role not in roles]
+
+class FakeTextChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.mention = f"<#{channel_id}>"
+
+class FakeVoiceChannel(FakeTextChannel):
+    def __init__(self, channel_id):
+        super().__init__(channel_id)
+        self.members = []
+
+class FakeGuild:
+    def __init__(self, guild_id, members=0, text_channels=1, voice_channels=0):
+        self.id = guild_id
+        self.name = f"guild-{guild_id}"
+        self.members = [FakeMember(self, guild_id * 1_000_000 + i) for i in range(members)]
+        self._members = {member.id: member for member in self.members}
+        self.text_channels = [FakeTextChannel(guild_id * 10_000 + i) for i in range(text_channels)]
+        self.voice_channels = [FakeVoiceChannel(guild_id * 10_000 + 5_000 + i) for i in range(voice_channels)]
+        self._channels = {channel.id: channel for channel in self.text_channels + self.voice_channels}
+        self._roles = {}
+
+    @property
+    def member_count(self):
+        return len(self.members)
+
+    def get_member(self, member_id):
+        return self._members.get(member_id)
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+    def get_role(self, role_id):
+        if role_id not in self._roles:
+            self._roles[role_id] = FakeRole(role_id)
+        return self._roles[role_id]
+
+class FakeMessage:
+    def __init__(self, author, channel, created_at=None):
+        self.author = author
+        self.guild = author.guild
+        self.channel = channel
+        self.created_at = created_at or datetime.now(timezone.utc)
+
+class FakeResponse:
+    """Records when the interaction was first answered, which is what a user perceives as latency."""
+
+    def __init__(self):
+        self.responded_at = None
+        self.messages = []
+
+    async def send_message(self, content=None, **kwargs):
+        if self.responded_at is None:
+            self.responded_at = time.perf_counter()
+        self.messages.append((content, kwargs))
+
+    async def defer(self, **kwargs):
+        if self.responded_at is None:
+            self.responded_at = time.perf_counter()
+
+    async def edit_message(self, **kwargs):
+        if self.responded_at is None:
+            self.responded_at = time.perf_counter()
+        self.messages.append((None, kwargs))
+
+    def is_done(self):
+        return self.responded_at is not None
+
+class FakeFollowup:
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, content=None, **kwargs):
+        self.messages.append((content, kwargs))
+
+class FakeInteraction:
+    def __init__(self, guild, user):
+        self.guild = guild
+        self.user = user
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+        self.edits = []
+        self.created_at = datetime.now(timezone.utc)
+
+    async def edit_original_response(self, **kwargs):
+        self.edits.append(kwargs)
+
+class FakeBot:
+    def __init__(self, guilds):
+        self.guilds = guilds
+        self._guilds = {guild.id: guild for guild in guilds}
+        self.user = FakeMember(None, 0, bot=True)
+        # Unsharded unless a benchmark assigns a shard layout
+        self.shard_count = None
+        self.shard_ids = None
+
+    def get_guild(self, guild_id):
+        return self._guilds.get(guild_id)
+
+    async def wait_until_ready(self):
+        pass
+
+    def is_ready(self):
+        return True
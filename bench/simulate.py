@@ -0,0 +1,284 @@
+"""Drives the Core cog with fake Discord objects against a temporary database.
+
+Scenarios:
+  messages  - a message flood through on_message and the activity buffer
+  voice     - voice state updates and a voice sweep across thousands of channels
+  commands  - concurrent /bet, /top, /rank and /balance interactions
+  monthly   - the first reads and writes after the month rolls over
+
+Each scenario reports throughput, p50/p99 latency and event loop lag. Results
+can be saved as JSON and compared with an earlier run:
+  python -m bench.simulate --output before.json
+  python -m bench.simulate --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from discord.ext import tasks
+
+import async_database
+import database
+from bench.fakes import use_temp_database
+from bench.fakes import FakeBot, FakeGuild, FakeInteraction, FakeMessage, FakeVoiceState
+from cogs.core import Core, VOICE_AWARD_INTERVAL_SECONDS
+from voice_sessions import VoiceSessionTracker
+
+class LoopLagMonitor:
+    """Measures how late a short sleep wakes up, i.e. how long the event loop was blocked."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(time.perf_counter() - started - self.interval)
+
+    def __enter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+def summarize(operations, elapsed, latencies, lag, **extra):
+    return {
+        'operations': operations,
+        'seconds': round(elapsed, 4),
+        'throughput_per_s': round(operations / elapsed, 1) if elapsed else None,
+        'latency_p50_ms': round(_percentile(latencies, 0.5) * 1000, 3),
+        'latency_p99_ms': round(_percentile(latencies, 0.99) * 1000, 3),
+        'loop_lag_p99_ms': round(_percentile(lag.samples, 0.99) * 1000, 3),
+        'loop_lag_max_ms': round(max(lag.samples, default=0) * 1000, 3),
+        **extra,
+    }
+
+def make_core(guilds):
+    core = Core(FakeBot(guilds))
+    # The scenarios drive the background tasks themselves
+    for name, attribute in vars(Core).items():
+        if isinstance(attribute, tasks.Loop):
+            getattr(core, name).cancel()
+    return core
+
+async def scenario_messages(core, guilds, args, rng):
+    messages = [
+        FakeMessage(member, rng.choice(guild.text_channels))
+        for guild in guilds
+        for member in rng.choices(guild.members, k=args.messages // len(guilds))
+    ]
+    rng.shuffle(messages)
+    latencies = []
+    with LoopLagMonitor() as lag:
+        started = time.perf_counter()
+        for i, message in enumerate(messages):
+            call_started = time.perf_counter()
+            await core.on_message(message)
+            latencies.append(time.perf_counter() - call_started)
+            if i % 200 == 0:
+                # Gateway events arrive one by one; let the loop breathe like it would between them
+                await asyncio.sleep(0)
+        await core.flush_activity()
+        elapsed = time.perf_counter() - started
+    return summarize(len(messages), elapsed, latencies, lag)
+
+async def scenario_voice(core, guilds, args, rng):
+    clock = [0.0]
+    core.voice_sessions = VoiceSessionTracker(VOICE_AWARD_INTERVAL_SECONDS, clock=lambda: clock[0])
+    members_in_voice = []
+    for guild in guilds:
+        pool = iter(rng.sample(guild.members, min(len(guild.members), len(guild.voice_channels) * 4)))
+        for channel in guild.voice_channels:
+            for member in [member for _, member in zip(range(rng.randrange(2, 5)), pool)]:
+                member.voice = FakeVoiceState(channel)
+                channel.members.append(member)
+                members_in_voice.append(member)
+
+    latencies = []
+    with LoopLagMonitor() as lag:
+        started = time.perf_counter()
+        for guild in guilds:
+            core.sync_voice_sessions(guild)
+        sync_seconds = time.perf_counter() - started
+
+        # Mute toggles spread over one award interval
+        updates = 0
+        for step in range(args.voice_updates):
+            clock[0] += VOICE_AWARD_INTERVAL_SECONDS / args.voice_updates
+            member = rng.choice(members_in_voice)
+            before = member.voice
+            after = FakeVoiceState(before.channel, self_mute=not before.self_mute)
+            member.voice = after
+            call_started = time.perf_counter()
+            await core.on_voice_state_update(member, before, after)
+            latencies.append(time.perf_counter() - call_started)
+            updates += 1
+            if step % 200 == 0:
+                await asyncio.sleep(0)
+
+        clock[0] += 1
+        sweep_started = time.perf_counter()
+        await core.voice_activity_check.coro(core)
+        sweep_seconds = time.perf_counter() - sweep_started
+        elapsed = time.perf_counter() - started
+    channels = sum(len(guild.voice_channels) for guild in guilds)
+    return summarize(
+        updates, elapsed, latencies, lag,
+        voice_channels=channels,
+        members_in_voice=len(members_in_voice),
+        sync_ms=round(sync_seconds * 1000, 3),
+        sweep_ms=round(sweep_seconds * 1000, 3),
+    )
+
+async def _interaction(core, guild, rng, latencies, counts):
+    member = rng.choice(guild.members)
+    interaction = FakeInteraction(guild, member)
+    command = rng.choices(['bet', 'top', 'rank', 'balance'], weights=[4, 3, 2, 1])[0]
+    started = time.perf_counter()
+    if command == 'bet':
+        await core.bet.callback(core, interaction, rng.randrange(1, 50))
+    elif command == 'top':
+        await core.top.callback(core, interaction, rng.choice(['all', 'monthly']))
+    elif command == 'rank':
+        await core.rank.callback(core, interaction, None, 'all')
+    else:
+        await core.balance.callback(core, interaction, None)
+    latencies.append(interaction.response.responded_at - started)
+    counts[command] = counts.get(command, 0) + 1
+
+async def scenario_commands(core, guilds, args, rng):
+    for guild in guilds:
+        await async_database.add_points_bulk([(guild.id, member.id, 0, 1000, 0, 0) for member in guild.members])
+    latencies, counts = [], {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited():
+        async with semaphore:
+            await _interaction(core, rng.choice(guilds), rng, latencies, counts)
+
+    with LoopLagMonitor() as lag:
+        started = time.perf_counter()
+        await asyncio.gather(*(limited() for _ in range(args.commands)))
+        elapsed = time.perf_counter() - started
+    return summarize(args.commands, elapsed, latencies, lag, concurrency=args.concurrency, mix=counts)
+
+async def scenario_monthly(core, guilds, args, rng):
+    # Warm every monthly board and rank index, then move to the next month
+    for guild in guilds:
+        await core.get_top(guild.id, 'monthly_activity_points')
+        await core.get_rank(guild.id, 'monthly_activity_points', guild.members[0].id)
+    real_epoch = database.current_month_epoch
+    database.current_month_epoch = lambda now=None: real_epoch(now) + 1
+    try:
+        latencies = []
+        stale = False
+        with LoopLagMonitor() as lag:
+            started = time.perf_counter()
+            for guild in guilds:
+                interaction = FakeInteraction(guild, guild.members[0])
+                call_started = time.perf_counter()
+                await core.top.callback(core, interaction, 'monthly')
+                latencies.append(interaction.response.responded_at - call_started)
+                # Nobody has earned points in the new month yet
+                stale |= interaction.response.messages[0][1]['embed'].description != "Nikt jeszcze nie zdobył żadnych punktów aktywności."
+            for guild in guilds:
+                for member in guild.members[:50]:
+                    await core.on_message(FakeMessage(member, guild.text_channels[0]))
+            await core.flush_activity()
+            top = await core.get_top(guilds[0].id, 'monthly_activity_points')
+            elapsed = time.perf_counter() - started
+    finally:
+        database.current_month_epoch = real_epoch
+    return summarize(
+        len(guilds), elapsed, latencies, lag,
+        stale_board_after_rollover=stale,
+        new_month_top_points=top[0][1] if top else None,
+    )
+
+SCENARIOS = {
+    'messages': scenario_messages,
+    'voice': scenario_voice,
+    'commands': scenario_commands,
+    'monthly': scenario_monthly,
+}
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _compare(results, previous):
+    print(f"\ncompared with {previous.get('commit')} ({previous.get('timestamp')}):")
+    for name, current in results['scenarios'].items():
+        before = previous.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        for metric in ['throughput_per_s', 'latency_p50_ms', 'latency_p99_ms', 'loop_lag_p99_ms']:
+            old, new = before.get(metric), current.get(metric)
+            if old and new is not None:
+                print(f"  {name:<9} {metric:<17} {old:>10} -> {new:<10} ({(new - old) / old * 100:+.1f}%)")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', choices=['all'] + list(SCENARIOS), default='all')
+    parser.add_argument('--guilds', type=int, default=10)
+    parser.add_argument('--members', type=int, default=2000, help='members per guild')
+    parser.add_argument('--voice-channels', type=int, default=300, help='voice channels per guild')
+    parser.add_argument('--messages', type=int, default=100_000)
+    parser.add_argument('--voice-updates', type=int, default=20_000)
+    parser.add_argument('--commands', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file from an earlier run to compare against')
+    args = parser.parse_args()
+
+    rng = random.Random(15)
+    guilds = [
+        FakeGuild(guild_id, members=args.members, text_channels=20, voice_channels=args.voice_channels)
+        for guild_id in range(1, args.guilds + 1)
+    ]
+    names = list(SCENARIOS) if args.scenario == 'all' else [args.scenario]
+    results = {
+        'commit': _git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'scenarios': {},
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        await async_database.run(use_temp_database, directory)
+        core = make_core(guilds)
+        try:
+            for name in names:
+                results['scenarios'][name] = result = await SCENARIOS[name](core, guilds, args, rng)
+                print(f"{name:<9} " + ", ".join(f"{key}={value}" for key, value in result.items()))
+        finally:
+            await core.cog_unload()
+            async_database.shutdown()
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f"results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as file:
+            _compare(results, json.load(file))
+
+if __name__ == '__main__':
+    asyncio.run(main())
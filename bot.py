@@ -1,95 +1,201 @@
+import time
+# Cold-start timings are measured from here, before the heavy imports
+STARTED = time.perf_counter()
+
+import os
+from dotenv import load_dotenv
+
+# Chart workers are spawned processes, which re-import this file as __mp_main__.
+# Everything at module level must stay free of side effects; the bot itself is built in main().
+# The project modules read their settings at import time, so bot.env is loaded before them.
+if __name__ == '__main__':
+    load_dotenv('bot.env')
+
 import discord
 from discord.ext import commands, tasks
-import os
-import database
+import hashlib
+import json
+import async_database
+import charts
 import logging
-from dotenv import load_dotenv
+import metrics
+import sharding
+import signal
 
-# --- Logging Setup ---
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Set to 1 to push the command tree to Discord even if its definitions look unchanged
+FORCE_COMMAND_SYNC = os.getenv('FORCE_COMMAND_SYNC', '0') == '1'
+WEB_ENABLED = os.getenv('WEB_ENABLED', '1') == '1'
 
-load_dotenv('bot.env')
+APP_COMMAND_ERRORS = metrics.counter('app_command_errors_total', "App commands that failed with an unexpected error.", ['command'])
 
 # --- Bot Setup ---
-intents = discord.Intents.default()
-intents.message_content = True
-intents.voice_states = True
-intents.members = True
+def make_intents():
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.voice_states = True
+    intents.members = True
+    return intents
 
-class MyBot(commands.Bot):
+class MyBot(commands.AutoShardedBot):
     def __init__(self):
-        super().__init__(command_prefix='$', intents=intents)
+        super().__init__(
+            command_prefix='$',
+            intents=make_intents(),
+            shard_count=sharding.SHARD_COUNT,
+            shard_ids=sharding.SHARD_IDS
+        )
+        self.web = None
+        self.loop_lag_monitor = None
+        self.startup_timings = {}  # phase -> seconds since STARTED
 
-    async def on_ready(self):
-        """Called when the bot is ready and connected to Discord."""
-        logging.info(f'Logged in as {self.user}')
-        database.init_db()
+    def _mark(self, phase):
+        self.startup_timings[phase] = time.perf_counter() - STARTED
+
+    async def setup_hook(self):
+        """Runs once per process, before connecting to the gateway; reconnects don't repeat it."""
+        self._mark('login')
+        await async_database.init_db()
+        self._mark('database')
         logging.info("Database initialized.")
 
-        # Load the new core cog
         try:
             await self.load_extension('cogs.core')
             logging.info('Loaded cog: core.py')
         except Exception as e:
             logging.error(f'Failed to load cog core.py: {e}')
-
-        # Sync slash commands
-        try:
-            synced = await self.tree.sync()
-            logging.info(f"Synced {len(synced)} slash commands.")
-        except Exception as e:
-            logging.error(f"Failed to sync slash commands: {e}")
+        self._mark('extensions')
 
         # Register the error handler for the command tree
         self.tree.on_error = self.on_tree_error
+        primary = sharding.is_primary(self)
+        logging.info(f"Starting worker ({sharding.describe(self)}){', primary' if primary else ''}.")
+        # The command tree is global, so one worker syncing it is enough
+        if primary:
+            try:
+                await self.sync_commands()
+            except Exception as e:
+                logging.error(f"Failed to sync slash commands: {e}")
+        self._mark('command_sync')
+
+        try:
+            # docker stop sends SIGTERM; closing the bot flushes the cogs' buffers before the process exits
+            self.loop.add_signal_handler(signal.SIGTERM, lambda: self.loop.create_task(self.close()))
+        except NotImplementedError:
+            pass  # Windows event loops have no signal handlers
+        if metrics.ENABLED:
+            self.loop_lag_monitor = self.loop.create_task(metrics.monitor_loop_lag())
+            if hasattr(signal, 'SIGUSR1'):
+                # kill -USR1 <pid> writes the current metrics to METRICS_DUMP_PATH
+                self.loop.add_signal_handler(signal.SIGUSR1, dump_metrics)
+
+        # The dashboard isn't needed to answer commands, so it starts in the background
+        if WEB_ENABLED and primary:
+            self.loop.create_task(self.start_web())
+
+        self.daily_member_count_task.start()
+        self._mark('setup_hook')
 
-        # Start the daily background task
-        if not daily_member_count_task.is_running():
-            daily_member_count_task.start()
+    async def start_web(self):
+        import webapp
+        web = webapp.WebServer(self)
+        try:
+            await web.start()
+        except OSError as e:
+            logging.error(f"Failed to start the web dashboard: {e}")
+            return
+        self.web = web
+
+    def command_tree_hash(self):
+        """Hash of the global app command definitions, as they are sent to Discord."""
+        payload = [command.to_dict(self.tree) for command in self.tree.get_commands()]
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    async def sync_commands(self):
+        """Syncs the command tree only if its definitions changed since the last sync. Returns True if it synced."""
+        key = f"command_tree_hash:{self.application_id}"
+        tree_hash = self.command_tree_hash()
+        if not FORCE_COMMAND_SYNC and await async_database.get_meta(key) == tree_hash:
+            logging.info("Slash commands unchanged, skipping sync.")
+            return False
+        synced = await self.tree.sync()
+        await async_database.set_meta(key, tree_hash)
+        logging.info(f"Synced {len(synced)} slash commands.")
+        return True
+
+    async def on_ready(self):
+        """Called when the bot is ready, and again after every gateway reconnect."""
+        if 'ready' not in self.startup_timings:
+            self._mark('ready')
+            logging.info(f"Logged in as {self.user}, ready {self.startup_timings['ready']:.2f}s after start.")
+        else:
+            logging.info(f"Reconnected as {self.user}.")
+
+    async def on_interaction(self, interaction):
+        if 'first_interaction' not in self.startup_timings:
+            self._mark('first_interaction')
+            logging.info(f"First interaction {self.startup_timings['first_interaction']:.2f}s after start.")
+
+    async def close(self):
+        """Unloads the cogs (flushing their buffers) before stopping the web server, chart and database workers."""
+        await super().close()
+        self.daily_member_count_task.cancel()
+        if self.loop_lag_monitor is not None:
+            self.loop_lag_monitor.cancel()
+        if self.web is not None:
+            await self.web.stop()
+        charts.shutdown()
+        async_database.shutdown()
 
     async def on_tree_error(self, interaction: discord.Interaction, error: discord.app_commands.AppCommandError):
         """Global error handler for app commands (slash commands)."""
         if isinstance(error, discord.app_commands.MissingPermissions):
-            await interaction.response.send_message(
-                "❌ Nie masz uprawnień do użycia tej komendy.", ephemeral=True
-            )
+            message = "❌ Nie masz uprawnień do użycia tej komendy."
         elif isinstance(error, discord.app_commands.BotMissingPermissions):
-            await interaction.response.send_message(
-                "❌ Bot nie ma wystarczających uprawnień, aby wykonać tę akcję.", ephemeral=True
-            )
+            message = "❌ Bot nie ma wystarczających uprawnień, aby wykonać tę akcję."
         elif isinstance(error, discord.app_commands.CommandOnCooldown):
-            await interaction.response.send_message(
-                f"⏳ Komenda jest na odnowieniu. Spróbuj ponownie za {error.retry_after:.2f}s.", ephemeral=True
-            )
+            message = f"⏳ Komenda jest na odnowieniu. Spróbuj ponownie za {error.retry_after:.2f}s."
         else:
-            logging.error(f"An error occurred in command '{interaction.command.name}': {error}")
-            await interaction.response.send_message(
-                "❌ Wystąpił błąd podczas wykonywania komendy.", ephemeral=True
-            )
-
-bot = MyBot()
-
-# --- Background Tasks ---
-@tasks.loop(hours=24)
-async def daily_member_count_task():
-    """A background task that runs daily to log the member count of each guild."""
-    logging.info("Running daily member count task...")
-    for guild in bot.guilds:
-        try:
-            member_count = guild.member_count
-            database.log_member_count(guild.id, member_count)
-            logging.info(f"Logged member count for {guild.name}: {member_count}")
-        except Exception as e:
-            logging.error(f"Error logging member count for guild {guild.name}: {e}")
+            command_name = interaction.command.qualified_name if interaction.command else 'unknown'
+            APP_COMMAND_ERRORS.labels(command_name).inc()
+            logging.error(f"An error occurred in command '{command_name}': {error}")
+            message = "❌ Wystąpił błąd podczas wykonywania komendy."
+        # Commands that deferred (e.g. bulk point changes) can only be answered with a followup
+        if interaction.response.is_done():
+            await interaction.followup.send(message, ephemeral=True)
+        else:
+            await interaction.response.send_message(message, ephemeral=True)
+
+    # --- Background Tasks ---
+    @tasks.loop(hours=24)
+    async def daily_member_count_task(self):
+        """A background task that runs daily to log the member count of each guild."""
+        logging.info("Running daily member count task...")
+        for guild in sharding.owned_guilds(self):
+            try:
+                member_count = guild.member_count
+                await async_database.log_member_count(guild.id, member_count)
+                logging.info(f"Logged member count for {guild.name}: {member_count}")
+            except Exception as e:
+                logging.error(f"Error logging member count for guild {guild.name}: {e}")
 
-@daily_member_count_task.before_loop
-async def before_daily_task():
-    await bot.wait_until_ready()
+    @daily_member_count_task.before_loop
+    async def before_daily_member_count_task(self):
+        await self.wait_until_ready()
+
+def dump_metrics():
+    try:
+        logging.info(f"Metrics written to {metrics.dump()}")
+    except OSError as e:
+        logging.error(f"Failed to write metrics: {e}")
 
 # --- Run the Bot ---
-if __name__ == "__main__":
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     token = os.getenv('DISCORD_TOKEN')
     if not token:
         logging.error("DISCORD_TOKEN not found in bot.env file.")
-    else:
-        bot.run(token)
+        return
+    MyBot().run(token)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Small thread-safe in-process caches."""
+import threading
+import time
+import weakref
+from collections import OrderedDict
+import metrics
+
+_instances = weakref.WeakSet()
+
+class LRUCache:
+    """A bounded mapping that evicts the least recently used entry and counts hits and misses.
+
+    With a `ttl`, entries also expire that many seconds after they were stored.
+    """
+
+    def __init__(self, name, max_size, ttl=None, clock=time.monotonic):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self.hits = 0
+        self.misses = 0
+        # Bumped by every invalidation so that a read which raced with a write isn't cached
+        self.version = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        _instances.add(self)
+
+    def __len__(self):
+        return len(self._data)
+
+    def _lookup(self, key):
+        """Returns (found, value) and counts a hit; the caller holds the lock."""
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        value, expires = entry
+        if expires is not None and self._clock() >= expires:
+            del self._data[key]
+            return False, None
+        self.hits += 1
+        self._data.move_to_end(key)
+        return True, value
+
+    def get(self, key, default=None):
+        """Returns the cached value, counting a hit or a miss."""
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                return value
+            self.misses += 1
+            return default
+
+    def peek(self, key, default=None):
+        """Like get(), but a miss is not counted; for fast paths that fall back to a counted get()."""
+        with self._lock:
+            found, value = self._lookup(key)
+            return value if found else default
+
+    def set(self, key, value, version=None):
+        """Stores a value. Pass the `version` read before loading it to skip storing stale data."""
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._data[key] = (value, self._clock() + self.ttl if self.ttl is not None else None)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self.version += 1
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self._data.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'max_size': self.max_size}
+
+def _collect_metrics():
+    caches = sorted(_instances, key=lambda cache: cache.name)
+    families = []
+    for field, kind, documentation in [
+        ('hits', 'counter', "Cache lookups that found an entry."),
+        ('misses', 'counter', "Cache lookups that missed."),
+        ('size', 'gauge', "Entries currently cached."),
+    ]:
+        name = f"cache_{field}_total" if kind == 'counter' else f"cache_{field}"
+        families.append((name, kind, documentation, [({'cache': cache.name}, cache.stats()[field]) for cache in caches]))
+    return families
+
+metrics.register_collector(_collect_metrics)
@@ -0,0 +1,128 @@
+"""Chart rendering for the /stats commands.
+
+matplotlib is slow to import and to draw, so charts are rendered in a small
+process pool and never on the event loop. This module must stay cheap to
+import because every worker process imports it.
+"""
+import asyncio
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+# Histories longer than this are downsampled before plotting
+CHART_MAX_POINTS = int(os.getenv('CHART_MAX_POINTS', 500))
+CHART_WORKERS = int(os.getenv('CHART_WORKERS', 1))
+
+# Range choices for /stats growth, in days; None means the whole history
+GROWTH_RANGES = {'30d': 30, '90d': 90, '1y': 365, 'all': None}
+# Range choices for /stats activity, in days
+ACTIVITY_RANGES = {'7d': 7, '30d': 30, '90d': 90, '1y': 365}
+WEEKDAYS = ['Pon', 'Wt', 'Śr', 'Czw', 'Pt', 'Sob', 'Nd']
+
+_pool = None
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn, because forking a process that runs database threads is not safe
+        _pool = ProcessPoolExecutor(max_workers=CHART_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+def shutdown():
+    """Stops the rendering processes; the pool is recreated on the next render."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def downsample_lttb(points, threshold):
+    """Largest-Triangle-Three-Buckets downsampling of (x, y) points sorted by x.
+
+    Keeps the first and last point and, for every bucket in between, the point
+    that forms the largest triangle with its neighbours, which preserves the
+    visual shape of the series (spikes and drops) far better than averaging.
+    """
+    if threshold >= len(points) or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (len(points) - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+
+        # Average of the next bucket is the third corner of the triangle
+        next_start, next_end = end, min(int((i + 2) * bucket_size) + 1, len(points))
+        next_bucket = points[next_start:next_end] or [points[-1]]
+        avg_x = sum(x for x, _ in next_bucket) / len(next_bucket)
+        avg_y = sum(y for _, y in next_bucket) / len(next_bucket)
+
+        ax, ay = points[a]
+        best_area, best = -1, start
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best_area, best = area, j
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+def render_growth_png(title, history, max_points=CHART_MAX_POINTS):
+    """Renders [(iso date, member count)] as a PNG and returns its bytes. Runs in a worker process."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.dates as mdates
+    import matplotlib.pyplot as plt
+
+    points = [(date.fromisoformat(day).toordinal(), count) for day, count in history]
+    points = downsample_lttb(points, max_points)
+    days = [date.fromordinal(x) for x, _ in points]
+    counts = [y for _, y in points]
+
+    fig, ax = plt.subplots(figsize=(8, 4), dpi=100)
+    try:
+        ax.plot(days, counts, color='#5865F2', linewidth=1.5)
+        ax.fill_between(days, counts, min(counts), color='#5865F2', alpha=0.15)
+        ax.set_title(title)
+        ax.set_ylabel('Członkowie')
+        ax.grid(True, alpha=0.3)
+        locator = mdates.AutoDateLocator()
+        ax.xaxis.set_major_locator(locator)
+        ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+        fig.tight_layout()
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png')
+    finally:
+        plt.close(fig)
+    return buffer.getvalue()
+
+def render_heatmap_png(title, matrix):
+    """Renders a 7x24 matrix (weekday x UTC hour) of message counts as a PNG. Runs in a worker process."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(10, 3.6), dpi=100)
+    try:
+        image = ax.imshow(matrix, aspect='auto', cmap='viridis', interpolation='nearest')
+        ax.set_title(title)
+        ax.set_yticks(range(7), WEEKDAYS)
+        ax.set_xticks(range(0, 24, 2), [f"{hour:02d}" for hour in range(0, 24, 2)])
+        ax.set_xlabel('Godzina (UTC)')
+        fig.colorbar(image, ax=ax, label='Wiadomości')
+        fig.tight_layout()
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png')
+    finally:
+        plt.close(fig)
+    return buffer.getvalue()
+
+async def render(func, *args):
+    """Runs a render function in the process pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), func, *args)
@@ -1,74 +1,330 @@
+import asyncio
 import discord
 from discord import app_commands
 from discord.ext import commands, tasks
+import async_database
+import backup
+import charts
 import database
+import io
 import logging
+import metrics
+import os
+import tempfile
+import time
 import random
-from datetime import datetime
+import sharding
+from datetime import date, timedelta
+from activity_buffer import ActivityBuffer
+from antispam import MessageRateLimiter
+from cache import LRUCache
+from leaderboards import LeaderboardCache, RankCache
+from pagination import PAGE_SIZE, PageView
+from voice_sessions import VoiceSessionTracker
 
 # --- Constants ---
 MESSAGE_ACTIVITY_POINTS = 1
 MESSAGE_GAMBLING_POINTS = 2
 VOICE_ACTIVITY_POINTS = 10
 VOICE_GAMBLING_POINTS = 20
+# Voice points are awarded per full interval of eligible time
+VOICE_AWARD_INTERVAL_SECONDS = 600
+# Seconds towards the next voice award are forfeited after this long without voice time
+VOICE_CARRY_TTL_SECONDS = int(os.getenv('VOICE_CARRY_TTL_SECONDS', 86400))
+# How often each guild's points ledger is compacted into a snapshot
+LEDGER_SNAPSHOT_INTERVAL_HOURS = float(os.getenv('LEDGER_SNAPSHOT_INTERVAL_HOURS', 24))
+# Hours between scheduled hot backups of the database; 0 turns them off
+BACKUP_INTERVAL_HOURS = float(os.getenv('BACKUP_INTERVAL_HOURS', 24))
+
+# Message points are buffered in memory and written in batches
+ACTIVITY_FLUSH_INTERVAL_SECONDS = float(os.getenv('ACTIVITY_FLUSH_INTERVAL_SECONDS', 10))
+ACTIVITY_FLUSH_MAX_PENDING = int(os.getenv('ACTIVITY_FLUSH_MAX_PENDING', 500))
+
+# How often a running bulk operation updates its progress message
+BULK_PROGRESS_INTERVAL_SECONDS = float(os.getenv('BULK_PROGRESS_INTERVAL_SECONDS', 2))
+
+# Rendered growth charts, keyed by (guild_id, range, latest date, latest count)
+GROWTH_CHART_CACHE_SIZE = int(os.getenv('GROWTH_CHART_CACHE_SIZE', 64))
+# Rendered activity heatmaps, keyed by (guild_id, range, last complete hour)
+HEATMAP_CACHE_SIZE = int(os.getenv('HEATMAP_CACHE_SIZE', 64))
+# Leaderboard pages after the first, keyed by (guild_id, point_type, cursor); the first page comes from the live board
+LEADERBOARD_PAGE_CACHE_SIZE = int(os.getenv('LEADERBOARD_PAGE_CACHE_SIZE', 1000))
+LEADERBOARD_PAGE_CACHE_SECONDS = float(os.getenv('LEADERBOARD_PAGE_CACHE_SECONDS', 15))
+
+MESSAGES_SEEN = metrics.counter('discord_messages_total', "Guild messages from non-bot members seen by on_message.")
+MESSAGES_RATE_LIMITED = metrics.counter('discord_messages_rate_limited_total', "Messages that earned no points because their author was over the message limit.")
+APP_COMMAND_SECONDS = metrics.histogram('app_command_seconds', "Time from dispatch to completion of app commands.", ['command'])
 
 class Core(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.activity_buffer = ActivityBuffer(max_pending=ACTIVITY_FLUSH_MAX_PENDING)
+        self.leaderboards = LeaderboardCache()
+        self.ranks = RankCache()
+        self.voice_sessions = VoiceSessionTracker(award_interval=VOICE_AWARD_INTERVAL_SECONDS, carry_ttl=VOICE_CARRY_TTL_SECONDS)
+        self.message_limiter = MessageRateLimiter()
+        self.growth_charts = LRUCache('growth_charts', GROWTH_CHART_CACHE_SIZE)
+        self.heatmaps = LRUCache('activity_heatmaps', HEATMAP_CACHE_SIZE)
+        self.leaderboard_pages = LRUCache('leaderboard_pages', LEADERBOARD_PAGE_CACHE_SIZE, ttl=LEADERBOARD_PAGE_CACHE_SECONDS)
+        database.add_points_listener(self.leaderboards.on_points_changed)
+        database.add_points_listener(self.ranks.on_points_changed)
+        self.activity_flush_task.start()
         self.voice_activity_check.start()
-        self.monthly_reset_task.start()
+        self.ledger_snapshot_task.start()
+        self.activity_prune_task.start()
+        if BACKUP_INTERVAL_HOURS > 0:
+            self.backup_task.start()
         logging.info("Core cog loaded and tasks started.")
 
-    def cog_unload(self):
+    async def cog_load(self):
+        # on_message decides without the database, so every guild's limits are loaded up front
+        for guild_id, burst, per_minute in await async_database.get_message_rate_limits():
+            self.message_limiter.set_limits(guild_id, burst, per_minute)
+
+    async def cog_unload(self):
+        self.activity_flush_task.cancel()
         self.voice_activity_check.cancel()
-        self.monthly_reset_task.cancel()
+        self.ledger_snapshot_task.cancel()
+        self.activity_prune_task.cancel()
+        self.backup_task.cancel()
+        # Bot.close() unloads extensions, so this also covers shutdown
+        self.collect_voice_activity()
+        await self.flush_activity()
+        database.remove_points_listener(self.leaderboards.on_points_changed)
+        database.remove_points_listener(self.ranks.on_points_changed)
+
+    def collect_voice_activity(self):
+        """Moves credited voice time into the activity buffer; returns how many members earned points."""
+        awarded = 0
+        for guild_id, user_id, seconds, awards in self.voice_sessions.collect():
+            self.activity_buffer.add(
+                guild_id,
+                user_id,
+                awards * VOICE_ACTIVITY_POINTS,
+                awards * VOICE_GAMBLING_POINTS,
+                voice_seconds=seconds
+            )
+            awarded += awards > 0
+        for guild_id, channel_id, hour, seconds in self.voice_sessions.collect_channels():
+            self.activity_buffer.add_channel(guild_id, channel_id, hour, voice_seconds=seconds)
+        return awarded
+
+    async def flush_activity(self):
+        """Writes buffered message activity to the database."""
+        try:
+            await async_database.run(self.activity_buffer.flush)
+        except Exception as e:
+            logging.error(f"Failed to flush activity buffer: {e}")
+
+    def owns(self, guild):
+        """Whether this process handles the guild's activity (see sharding.py)."""
+        return sharding.owns_guild(self.bot, guild.id)
+
+    def shard_guilds(self, shard_id):
+        """The guilds of this process that one shard handles."""
+        if not self.bot.shard_count:
+            return list(sharding.owned_guilds(self.bot))
+        return [guild for guild in sharding.owned_guilds(self.bot) if sharding.shard_for_guild(guild.id, self.bot.shard_count) == shard_id]
+
+    def sync_voice_sessions(self, guild):
+        """Loads the current voice states of a guild into the session tracker."""
+        self.voice_sessions.sync_guild(guild.id, [
+            (channel.id, member.id, not (member.voice.self_mute or member.voice.self_deaf), member.bot)
+            for channel in guild.voice_channels
+            for member in channel.members
+        ])
+
+    async def get_top(self, guild_id, point_type, limit=10):
+        """Returns [(user_id, points)] from the leaderboard cache, seeding it if needed."""
+        top = self.leaderboards.top(guild_id, point_type, limit)
+        if top is None:
+            top = await async_database.run(self.leaderboards.seed, guild_id, point_type, limit)
+        return top
+
+    async def get_leaderboard_page(self, guild_id, point_type, after=None):
+        """Returns ([(user_id, points)], next_cursor) for the page that follows cursor `after`.
+
+        Cursors are the (points, user_id) of the last row of the previous page;
+        next_cursor is None on the last page.
+        """
+        if after is None:
+            rows = await self.get_top(guild_id, point_type, PAGE_SIZE + 1)
+        else:
+            key = (guild_id, point_type, after)
+            rows = self.leaderboard_pages.get(key)
+            if rows is None:
+                rows = [
+                    (row['user_id'], row[point_type])
+                    for row in await async_database.get_leaderboard_page(guild_id, point_type, after, PAGE_SIZE + 1)
+                ]
+                self.leaderboard_pages.set(key, rows)
+        if len(rows) <= PAGE_SIZE:
+            return rows, None
+        user_id, points = rows[PAGE_SIZE - 1]
+        return rows[:PAGE_SIZE], (points, user_id)
+
+    async def send_leaderboard(self, interaction, point_type, title, color, unit, empty_text):
+        """Answers with a leaderboard that can be paged through with buttons."""
+        guild = interaction.guild
+
+        async def fetch(cursor, page_number):
+            rows, next_cursor = await self.get_leaderboard_page(guild.id, point_type, cursor)
+            embed = discord.Embed(title=title, color=color)
+            if not rows:
+                embed.description = empty_text if page_number == 1 else "Brak kolejnych pozycji."
+                return embed, None
+            leaderboard_list = []
+            for i, (user_id, points) in enumerate(rows, start=(page_number - 1) * PAGE_SIZE + 1):
+                member = guild.get_member(user_id)
+                display_name = member.display_name if member else f"Nieznany użytkownik (ID: {user_id})"
+                leaderboard_list.append(f"**{i}. {display_name}**: {points} {unit}")
+            embed.description = "\n".join(leaderboard_list)
+            embed.set_footer(text=f"Strona {page_number}")
+            return embed, next_cursor
+
+        await PageView(interaction.user.id, fetch).start(interaction)
+
+    async def get_rank(self, guild_id, point_type, user_id):
+        """Returns (points, rank, total) from the rank index, or None if the user has no points yet."""
+        result = self.ranks.rank(guild_id, point_type, user_id)
+        if result is False:
+            result = await async_database.run(self.ranks.seed, guild_id, point_type, user_id)
+        return result
+
+    async def interaction_check(self, interaction):
+        if metrics.ENABLED:
+            interaction.extras['started'] = time.perf_counter()
+        return True
 
     # --- Event Listeners ---
+    @commands.Cog.listener()
+    async def on_app_command_completion(self, interaction, command):
+        started = interaction.extras.get('started')
+        if started is not None:
+            APP_COMMAND_SECONDS.labels(command.qualified_name).observe(time.perf_counter() - started)
+
     @commands.Cog.listener()
     async def on_message(self, message):
-        if message.author.bot or not message.guild:
+        if message.author.bot or not message.guild or not self.owns(message.guild):
             return
-        database.add_points(
-            message.guild.id,
-            message.author.id,
-            activity_points_to_add=MESSAGE_ACTIVITY_POINTS,
-            gambling_points_to_add=MESSAGE_GAMBLING_POINTS
+        MESSAGES_SEEN.inc()
+        self.activity_buffer.add_channel(
+            message.guild.id, message.channel.id, database.current_activity_hour(message.created_at.timestamp()), messages=1
         )
+        if self.message_limiter.allow(message.guild.id, message.author.id):
+            activity_points, gambling_points = MESSAGE_ACTIVITY_POINTS, MESSAGE_GAMBLING_POINTS
+        else:
+            # Still counted as activity, just not paid
+            MESSAGES_RATE_LIMITED.inc()
+            activity_points, gambling_points = 0, 0
+        if self.activity_buffer.add(message.guild.id, message.author.id, activity_points, gambling_points, messages=1):
+            await self.flush_activity()
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member, before, after):
+        if (before.channel == after.channel
+                and before.self_mute == after.self_mute
+                and before.self_deaf == after.self_deaf):
+            return
+        if not self.owns(member.guild):
+            return
+        self.voice_sessions.update(
+            member.guild.id,
+            member.id,
+            before.channel.id if before.channel else None,
+            after.channel.id if after.channel else None,
+            active=not (after.self_mute or after.self_deaf),
+            bot=member.bot
+        )
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # Voice state updates missed while disconnected are not replayed after a new session
+        for guild in sharding.owned_guilds(self.bot):
+            self.sync_voice_sessions(guild)
+
+    @commands.Cog.listener()
+    async def on_shard_ready(self, shard_id):
+        # A single shard starting a new session doesn't fire on_ready again
+        for guild in self.shard_guilds(shard_id):
+            self.sync_voice_sessions(guild)
+
+    @commands.Cog.listener()
+    async def on_shard_disconnect(self, shard_id):
+        # Credit voice time up to the disconnect; nobody earns anything for the gap
+        for guild in self.shard_guilds(shard_id):
+            self.voice_sessions.close_guild(guild.id)
+
+    @commands.Cog.listener()
+    async def on_shard_resumed(self, shard_id):
+        # A resumed session replays missed events but not the voice states closed at the disconnect
+        for guild in self.shard_guilds(shard_id):
+            self.sync_voice_sessions(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.voice_sessions.drop_guild(guild.id)
 
     # --- Background Tasks ---
+    @tasks.loop(seconds=ACTIVITY_FLUSH_INTERVAL_SECONDS)
+    @metrics.timed_task('activity_flush')
+    async def activity_flush_task(self):
+        await self.flush_activity()
+
     @tasks.loop(minutes=10)
+    @metrics.timed_task('voice_activity_check')
     async def voice_activity_check(self):
-        logging.info("Running voice activity check...")
-        for guild in self.bot.guilds:
-            for vc in guild.voice_channels:
-                active_users = [m for m in vc.members if not m.voice.self_mute and not m.voice.self_deaf]
-                if len(active_users) > 1:
-                    for member in active_users:
-                        if not member.bot:
-                            database.add_points(
-                                guild.id,
-                                member.id,
-                                activity_points_to_add=VOICE_ACTIVITY_POINTS,
-                                gambling_points_to_add=VOICE_GAMBLING_POINTS
-                            )
-                            logging.info(f"Awarded points to {member.display_name} in {guild.name} for voice activity.")
+        awarded = self.collect_voice_activity()
+        await self.flush_activity()
+        logging.info(f"Voice activity check: awarded points to {awarded} members.")
 
     @voice_activity_check.before_loop
     async def before_voice_activity_check(self):
         await self.bot.wait_until_ready()
+        for guild in sharding.owned_guilds(self.bot):
+            self.sync_voice_sessions(guild)
+
+    @tasks.loop(hours=LEDGER_SNAPSHOT_INTERVAL_HOURS)
+    @metrics.timed_task('ledger_snapshot')
+    async def ledger_snapshot_task(self):
+        for guild in sharding.owned_guilds(self.bot):
+            try:
+                await async_database.create_ledger_snapshot(guild.id)
+            except Exception as e:
+                logging.error(f"Failed to snapshot the points ledger for guild {guild.name}: {e}")
+
+    @ledger_snapshot_task.before_loop
+    async def before_ledger_snapshot_task(self):
+        await self.bot.wait_until_ready()
 
     @tasks.loop(hours=24)
-    async def monthly_reset_task(self):
-        now = datetime.utcnow()
-        if now.day == 1:
-            logging.info(f"It's the first day of the month. Resetting monthly points for all guilds.")
-            for guild in self.bot.guilds:
-                database.reset_monthly_points(guild.id)
-                logging.info(f"Reset monthly points for {guild.name}.")
-
-    @monthly_reset_task.before_loop
-    async def before_monthly_reset_task(self):
-        await self.bot.wait_until_ready()
+    @metrics.timed_task('activity_prune')
+    async def activity_prune_task(self):
+        # Pruning covers every guild, including ones no worker owns any more
+        if not sharding.is_primary(self.bot):
+            return
+        try:
+            deleted = await async_database.prune_activity()
+            logging.info(f"Pruned {deleted} expired activity rows.")
+        except Exception as e:
+            logging.error(f"Failed to prune activity rollups: {e}")
+
+    @tasks.loop(hours=BACKUP_INTERVAL_HOURS or 24)
+    @metrics.timed_task('backup')
+    async def backup_task(self):
+        # The loop starts with the bot; the first backup is due one interval later, not on every restart
+        if self.backup_task.current_loop == 0 or not sharding.is_primary(self.bot):
+            return
+        await self.create_backup()
+
+    async def create_backup(self):
+        """Writes a hot backup on a thread of its own, so the database workers keep serving. Returns its path."""
+        started = time.perf_counter()
+        path = await asyncio.to_thread(backup.create_backup)
+        logging.info(f"Backup written to {path} in {time.perf_counter() - started:.1f}s.")
+        for stale in await asyncio.to_thread(backup.prune_backups):
+            logging.info(f"Deleted old backup {stale}.")
+        return path
 
     # --- Leaderboard Commands ---
     @app_commands.command(name='top', description='Pokazuje ranking najbardziej aktywnych użytkowników.')
@@ -76,52 +332,145 @@ class Core(commands.Cog):
     async def top(self, interaction: discord.Interaction, period: str = 'all'):
         if period == 'monthly':
             point_type = 'monthly_activity_points'
-            title = "🏆 Top 10 najbardziej aktywnych użytkowników w tym miesiącu"
+            title = "🏆 Najbardziej aktywni użytkownicy w tym miesiącu"
         else:
             point_type = 'activity_points'
-            title = "🏆 Top 10 najbardziej aktywnych użytkowników (cały czas)"
-
-        leaderboard_data = database.get_leaderboard(interaction.guild.id, point_type=point_type)
-        embed = discord.Embed(title=title, color=discord.Color.gold())
-        if not leaderboard_data:
-            embed.description = "Nikt jeszcze nie zdobył żadnych punktów aktywności."
-        else:
-            leaderboard_list = []
-            for i, row in enumerate(leaderboard_data):
-                member = interaction.guild.get_member(row['user_id'])
-                display_name = member.display_name if member else f"Nieznany użytkownik (ID: {row['user_id']})"
-                points = row[point_type]
-                leaderboard_list.append(f"**{i+1}. {display_name}**: {points} AP")
-            embed.description = "\n".join(leaderboard_list)
-        await interaction.response.send_message(embed=embed)
+            title = "🏆 Najbardziej aktywni użytkownicy (cały czas)"
+        await self.send_leaderboard(
+            interaction, point_type, title, discord.Color.gold(), "AP", "Nikt jeszcze nie zdobył żadnych punktów aktywności."
+        )
 
     @app_commands.command(name='wallet', description='Pokazuje ranking najbogatszych użytkowników.')
     async def wallet(self, interaction: discord.Interaction):
-        leaderboard_data = database.get_leaderboard(interaction.guild.id, point_type='gambling_points')
-        settings = database.get_guild_settings(interaction.guild.id)
+        settings = await async_database.get_guild_settings(interaction.guild.id)
         currency_name = settings['currency_name']
-        embed = discord.Embed(title=f"💰 Top 10 najbogatszych użytkowników ({currency_name})", color=discord.Color.green())
+        await self.send_leaderboard(
+            interaction, 'gambling_points', f"💰 Najbogatsi użytkownicy ({currency_name})", discord.Color.green(),
+            currency_name, "Nikt jeszcze nie ma żadnych pieniędzy."
+        )
 
-        if not leaderboard_data:
-            embed.description = "Nikt jeszcze nie ma żadnych pieniędzy."
+    @app_commands.command(name='rank', description='Pokazuje pozycję użytkownika w rankingach.')
+    @app_commands.describe(member='Użytkownik, którego pozycję chcesz sprawdzić.', period='Okres rankingu aktywności (monthly lub all)')
+    async def rank(self, interaction: discord.Interaction, member: discord.Member = None, period: str = 'all'):
+        member = member or interaction.user
+        settings = await async_database.get_guild_settings(interaction.guild.id)
+        currency_name = settings['currency_name']
+        if period == 'monthly':
+            rankings = [('monthly_activity_points', "Aktywność w tym miesiącu", "AP")]
         else:
-            leaderboard_list = []
-            for i, row in enumerate(leaderboard_data):
-                member = interaction.guild.get_member(row['user_id'])
-                display_name = member.display_name if member else f"Nieznany użytkownik (ID: {row['user_id']})"
-                leaderboard_list.append(f"**{i+1}. {display_name}**: {row['gambling_points']} {currency_name}")
-            embed.description = "\n".join(leaderboard_list)
+            rankings = [('activity_points', "Aktywność (cały czas)", "AP")]
+        rankings.append(('gambling_points', "Portfel", currency_name))
+
+        embed = discord.Embed(title=f"📊 Pozycja użytkownika {member.display_name}", color=discord.Color.blurple())
+        for point_type, label, unit in rankings:
+            result = await self.get_rank(interaction.guild.id, point_type, member.id)
+            if result is None:
+                value = "Brak punktów."
+            else:
+                points, position, total = result
+                value = f"**#{position}** z {total} ({points} {unit}, top {position / total * 100:.1f}%)"
+            embed.add_field(name=label, value=value, inline=False)
         await interaction.response.send_message(embed=embed)
 
+    # --- Stats Commands ---
+    stats = app_commands.Group(name="stats", description="Statystyki serwera.")
+
+    async def get_growth_chart(self, guild, period):
+        """Returns the PNG growth chart of a guild for a range from GROWTH_RANGES, or None without history."""
+        latest = await async_database.get_latest_member_count(guild.id)
+        if latest is None:
+            return None
+        key = (guild.id, period, latest['date'], latest['member_count'])
+        png = self.growth_charts.get(key)
+        if png is None:
+            days = charts.GROWTH_RANGES[period]
+            since = (date.today() - timedelta(days=days)).isoformat() if days else None
+            history = await async_database.get_member_count_history(guild.id, since)
+            if not history:
+                return None
+            title = f"Liczba członków: {guild.name} ({period})"
+            png = await charts.render(charts.render_growth_png, title, [tuple(row) for row in history])
+            self.growth_charts.set(key, png)
+        return png
+
+    @stats.command(name='growth', description='Pokazuje wykres liczby członków serwera.')
+    @app_commands.rename(period='range')
+    @app_commands.describe(period='Zakres wykresu (30d, 90d, 1y lub all)')
+    async def stats_growth(self, interaction: discord.Interaction, period: str = '90d'):
+        if period not in charts.GROWTH_RANGES:
+            await interaction.response.send_message(
+                f"❌ Nieznany zakres. Dostępne: {', '.join(charts.GROWTH_RANGES)}.", ephemeral=True
+            )
+            return
+        # Rendering can take a few seconds, especially while the chart process starts
+        await interaction.response.defer()
+        png = await self.get_growth_chart(interaction.guild, period)
+        if png is None:
+            await interaction.followup.send("Brak zapisanej historii liczby członków dla tego serwera.")
+            return
+        await interaction.followup.send(file=discord.File(io.BytesIO(png), filename='growth.png'))
+
+    async def get_activity_heatmap(self, guild, period):
+        """Returns the PNG heatmap of a guild's messages by weekday and hour, or None without data.
+
+        Only complete hours are counted, so a rendered heatmap stays valid until the next hour starts.
+        """
+        until_hour = database.current_activity_hour()
+        key = (guild.id, period, until_hour)
+        png = self.heatmaps.get(key)
+        if png is None:
+            since_hour = until_hour - charts.ACTIVITY_RANGES[period] * 24
+            rows = await async_database.get_activity_heatmap(guild.id, since_hour, until_hour)
+            if not any(row['message_count'] for row in rows):
+                return None
+            matrix = [[0] * 24 for _ in range(7)]
+            for row in rows:
+                matrix[row['weekday']][row['hour_of_day']] = row['message_count']
+            title = f"Aktywność: {guild.name} ({period})"
+            png = await charts.render(charts.render_heatmap_png, title, matrix)
+            self.heatmaps.set(key, png)
+        return png
+
+    @stats.command(name='activity', description='Pokazuje, kiedy i na których kanałach serwer jest aktywny.')
+    @app_commands.rename(period='range')
+    @app_commands.describe(period='Zakres statystyk (7d, 30d, 90d lub 1y)')
+    async def stats_activity(self, interaction: discord.Interaction, period: str = '30d'):
+        if period not in charts.ACTIVITY_RANGES:
+            await interaction.response.send_message(
+                f"❌ Nieznany zakres. Dostępne: {', '.join(charts.ACTIVITY_RANGES)}.", ephemeral=True
+            )
+            return
+        await interaction.response.defer()
+        png = await self.get_activity_heatmap(interaction.guild, period)
+        since_day = database.current_activity_hour() // 24 - charts.ACTIVITY_RANGES[period]
+        channels = await async_database.get_top_channels(interaction.guild.id, since_day)
+        if png is None and not channels:
+            await interaction.followup.send("Brak zapisanej aktywności dla tego serwera w tym okresie.")
+            return
+
+        embed = discord.Embed(title=f"📈 Aktywność serwera ({period})", color=discord.Color.blurple())
+        lines = []
+        for i, row in enumerate(channels):
+            channel = interaction.guild.get_channel(row['channel_id'])
+            name = channel.mention if channel else f"Usunięty kanał (ID: {row['channel_id']})"
+            lines.append(f"**{i+1}.** {name}: {row['message_count']} wiadomości, {row['voice_seconds'] // 60} min na głosowym")
+        embed.add_field(name="Najaktywniejsze kanały", value="\n".join(lines) or "Brak danych.", inline=False)
+        if png is None:
+            await interaction.followup.send(embed=embed)
+            return
+        embed.set_image(url="attachment://activity.png")
+        await interaction.followup.send(embed=embed, file=discord.File(io.BytesIO(png), filename='activity.png'))
+
     # --- Economy Commands ---
     @app_commands.command(name='balance', description='Sprawdza saldo punktów hazardowych.')
     @app_commands.describe(member='Użytkownik, którego saldo chcesz sprawdzić.')
     async def balance(self, interaction: discord.Interaction, member: discord.Member = None):
         member = member or interaction.user
-        user_data = database.get_user_data(interaction.guild.id, member.id)
-        settings = database.get_guild_settings(interaction.guild.id)
+        # A pure read on the reader pool, so /balance never queues behind flushes and bulk jobs
+        user_data = await async_database.find_user_data(interaction.guild.id, member.id)
+        settings = await async_database.get_guild_settings(interaction.guild.id)
         currency_name = settings['currency_name']
-        balance = user_data['gambling_points']
+        balance = user_data['gambling_points'] if user_data else 0
         await interaction.response.send_message(f"**{member.display_name}** ma **{balance} {currency_name}**.")
 
     @app_commands.command(name='bet', description='Obstawia określoną ilość waluty.')
@@ -130,44 +479,52 @@ class Core(commands.Cog):
         if amount <= 0:
             return await interaction.response.send_message("Musisz obstawić dodatnią kwotę.", ephemeral=True)
 
-        user_data = database.get_user_data(interaction.guild.id, interaction.user.id)
-        balance = user_data['gambling_points']
-        if amount > balance:
-            return await interaction.response.send_message("Nie możesz obstawić więcej, niż posiadasz.", ephemeral=True)
-
-        settings = database.get_guild_settings(interaction.guild.id)
+        settings = await async_database.get_guild_settings(interaction.guild.id)
         win_chance = settings['bet_win_chance']
 
-        if random.randint(1, 100) <= win_chance:
-            new_balance = database.update_gambling_points(interaction.guild.id, interaction.user.id, amount)
+        # The balance check and the payout happen in a single conditional UPDATE
+        won = random.randint(1, 100) <= win_chance
+        new_balance = await async_database.settle_bet(interaction.guild.id, interaction.user.id, amount, won)
+        if new_balance is None:
+            await interaction.response.send_message("Nie możesz obstawić więcej, niż posiadasz.", ephemeral=True)
+        elif won:
             await interaction.response.send_message(f"🎉 **Wygrałeś!** Otrzymałeś **{amount}**. Twoje nowe saldo to **{new_balance}**.")
         else:
-            new_balance = database.update_gambling_points(interaction.guild.id, interaction.user.id, -amount)
             await interaction.response.send_message(f"😢 **Przegrałeś!** Straciłeś **{amount}**. Twoje nowe saldo to **{new_balance}**.")
 
     # --- Shop Commands ---
     @app_commands.command(name='shop', description='Wyświetla przedmioty dostępne do zakupu.')
     async def shop(self, interaction: discord.Interaction):
-        items = database.get_shop_items(interaction.guild.id)
-        settings = database.get_guild_settings(interaction.guild.id)
+        items = await async_database.get_shop_items(interaction.guild.id)
+        settings = await async_database.get_guild_settings(interaction.guild.id)
         currency_name = settings['currency_name']
 
         if not items:
             return await interaction.response.send_message("Sklep jest obecnie pusty. Administrator może dodać przedmioty za pomocą `/shopadmin add`.", ephemeral=True)
 
-        embed = discord.Embed(title="Sklep z rolami", color=discord.Color.teal())
-        description = "Kup rolę za pomocą komendy `/buy item_id`.\n\n"
-        for item in items:
-            role = interaction.guild.get_role(item['role_id'])
-            if role:
-                description += f"**ID: {item['item_id']}** | **{role.name}** - `{item['price']}` {currency_name}\n"
-        embed.description = description
-        await interaction.response.send_message(embed=embed)
+        guild = interaction.guild
+
+        async def fetch(cursor, page_number):
+            # Items are ordered by (price, item_id); only the roles shown on the page are looked up
+            page = await async_database.get_shop_items(guild.id)
+            if cursor is not None:
+                page = [item for item in page if (item['price'], item['item_id']) > cursor]
+            next_cursor = (page[PAGE_SIZE - 1]['price'], page[PAGE_SIZE - 1]['item_id']) if len(page) > PAGE_SIZE else None
+            lines = ["Kup rolę za pomocą komendy `/buy item_id`.\n"]
+            for item in page[:PAGE_SIZE]:
+                role = guild.get_role(item['role_id'])
+                if role:
+                    lines.append(f"**ID: {item['item_id']}** | **{role.name}** - `{item['price']}` {currency_name}")
+            embed = discord.Embed(title="Sklep z rolami", description="\n".join(lines), color=discord.Color.teal())
+            embed.set_footer(text=f"Strona {page_number}")
+            return embed, next_cursor
+
+        await PageView(interaction.user.id, fetch).start(interaction)
 
     @app_commands.command(name='buy', description='Kupuje przedmiot (rolę) ze sklepu.')
     @app_commands.describe(item_id='ID przedmiotu, który chcesz kupić.')
     async def buy(self, interaction: discord.Interaction, item_id: int):
-        item = database.get_shop_item(item_id)
+        item = await async_database.get_shop_item(item_id)
         if not item or item['guild_id'] != interaction.guild.id:
             return await interaction.response.send_message("Ten identyfikator przedmiotu jest nieprawidłowy.", ephemeral=True)
 
@@ -175,25 +532,22 @@ class Core(commands.Cog):
         if not role:
             return await interaction.response.send_message("Rola dla tego przedmiotu już nie istnieje. Administrator musi usunąć ten przedmiot.", ephemeral=True)
 
-        user_data = database.get_user_data(interaction.guild.id, interaction.user.id)
-        balance = user_data['gambling_points']
-
-        if balance < item['price']:
-            return await interaction.response.send_message(f"Nie masz wystarczająco dużo waluty, aby to kupić. Potrzebujesz `{item['price']}`.", ephemeral=True)
-
         if role in interaction.user.roles:
             return await interaction.response.send_message("Już posiadasz tę rolę!", ephemeral=True)
 
+        if await async_database.reserve_purchase(interaction.guild.id, interaction.user.id, item['price']) is None:
+            return await interaction.response.send_message(f"Nie masz wystarczająco dużo waluty, aby to kupić. Potrzebujesz `{item['price']}`.", ephemeral=True)
+
         try:
-            database.update_gambling_points(interaction.guild.id, interaction.user.id, -item['price'])
             await interaction.user.add_roles(role, reason="Purchased from shop")
-            await interaction.response.send_message(f"Pomyślnie zakupiłeś rolę **{role.name}**!")
         except discord.Forbidden:
+            await async_database.rollback_purchase(interaction.guild.id, interaction.user.id, item['price'])
             await interaction.response.send_message("Nie mam niezbędnych uprawnień do przypisywania ról.", ephemeral=True)
-            database.update_gambling_points(interaction.guild.id, interaction.user.id, item['price'])
         except Exception as e:
+            await async_database.rollback_purchase(interaction.guild.id, interaction.user.id, item['price'])
             await interaction.response.send_message(f"Wystąpił nieoczekiwany błąd: {e}", ephemeral=True)
-            database.update_gambling_points(interaction.guild.id, interaction.user.id, item['price'])
+        else:
+            await interaction.response.send_message(f"Pomyślnie zakupiłeś rolę **{role.name}**!")
 
     # --- Admin Commands ---
     shopadmin = app_commands.Group(name="shopadmin", description="Zarządza sklepem z rolami.")
@@ -204,7 +558,7 @@ class Core(commands.Cog):
     async def shop_add(self, interaction: discord.Interaction, role: discord.Role, price: int):
         if price < 0:
             return await interaction.response.send_message("Cena nie może być ujemna.", ephemeral=True)
-        if database.add_shop_item(interaction.guild.id, role.id, price):
+        if await async_database.add_shop_item(interaction.guild.id, role.id, price):
             await interaction.response.send_message(f"Dodano rolę **{role.name}** do sklepu za `{price}` waluty.")
         else:
             await interaction.response.send_message("Ta rola jest już w sklepie.", ephemeral=True)
@@ -213,28 +567,162 @@ class Core(commands.Cog):
     @app_commands.describe(item_id='ID przedmiotu do usunięcia.')
     @app_commands.default_permissions(administrator=True)
     async def shop_remove(self, interaction: discord.Interaction, item_id: int):
-        if database.remove_shop_item(item_id):
+        if await async_database.remove_shop_item(item_id):
             await interaction.response.send_message(f"Przedmiot o ID `{item_id}` został usunięty ze sklepu.")
         else:
             await interaction.response.send_message(f"Nie można znaleźć przedmiotu o ID `{item_id}`.", ephemeral=True)
 
-    @app_commands.command(name='givepoints', description='Daje użytkownikowi określoną ilość waluty.')
-    @app_commands.describe(member='Użytkownik, któremu chcesz dać punkty.', amount='Ilość punktów do dania.')
+    async def run_bulk(self, interaction, func, *args):
+        """Runs a bulk economy operation on a deferred interaction, showing its progress."""
+        await interaction.response.defer(thinking=True)
+        progress = [0, 0]
+
+        def report(done, total):
+            # Called on the database thread; the list is only read from the event loop
+            progress[:] = [done, total]
+
+        operation = asyncio.ensure_future(func(*args, progress=report))
+        shown = None
+        while True:
+            finished, _ = await asyncio.wait({operation}, timeout=BULK_PROGRESS_INTERVAL_SECONDS)
+            if finished:
+                return operation.result()
+            done, total = progress
+            if total and (done, total) != shown:
+                shown = (done, total)
+                await interaction.edit_original_response(content=f"⏳ Przetworzono {done}/{total} użytkowników...")
+
+    @staticmethod
+    def role_member_ids(role):
+        return [member.id for member in role.members if not member.bot]
+
+    @app_commands.command(name='givepoints', description='Daje użytkownikowi lub wszystkim z danej roli określoną ilość waluty.')
+    @app_commands.describe(amount='Ilość punktów do dania.', member='Użytkownik, któremu chcesz dać punkty.', role='Rola, której członkom chcesz dać punkty.')
     @app_commands.default_permissions(administrator=True)
-    async def givepoints(self, interaction: discord.Interaction, member: discord.Member, amount: int):
+    async def givepoints(self, interaction: discord.Interaction, amount: int, member: discord.Member = None, role: discord.Role = None):
         if amount <= 0:
             return await interaction.response.send_message("Kwota musi być dodatnia.", ephemeral=True)
-        database.update_gambling_points(interaction.guild.id, member.id, amount)
-        await interaction.response.send_message(f"Przyznano **{amount}** waluty **{member.display_name}**.")
-
-    @app_commands.command(name='takepoints', description='Zabiera użytkownikowi określoną ilość waluty.')
-    @app_commands.describe(member='Użytkownik, któremu chcesz zabrać punkty.', amount='Ilość punktów do zabrania.')
+        if (member is None) == (role is None):
+            return await interaction.response.send_message("Podaj użytkownika albo rolę.", ephemeral=True)
+        if member:
+            await async_database.update_gambling_points(interaction.guild.id, member.id, amount, reason='admin')
+            return await interaction.response.send_message(f"Przyznano **{amount}** waluty **{member.display_name}**.")
+        member_ids = self.role_member_ids(role)
+        if not member_ids:
+            return await interaction.response.send_message(f"Rola **{role.name}** nie ma żadnych członków.", ephemeral=True)
+        users, _ = await self.run_bulk(interaction, async_database.give_gambling_points_bulk, interaction.guild.id, member_ids, amount)
+        await interaction.edit_original_response(content=f"Przyznano **{amount}** waluty **{users}** członkom roli **{role.name}**.")
+
+    @app_commands.command(name='takepoints', description='Zabiera użytkownikowi lub wszystkim z danej roli określoną ilość waluty.')
+    @app_commands.describe(amount='Ilość punktów do zabrania.', member='Użytkownik, któremu chcesz zabrać punkty.', role='Rola, której członkom chcesz zabrać punkty.')
     @app_commands.default_permissions(administrator=True)
-    async def takepoints(self, interaction: discord.Interaction, member: discord.Member, amount: int):
+    async def takepoints(self, interaction: discord.Interaction, amount: int, member: discord.Member = None, role: discord.Role = None):
         if amount <= 0:
             return await interaction.response.send_message("Kwota musi być dodatnia.", ephemeral=True)
-        database.update_gambling_points(interaction.guild.id, member.id, -amount)
-        await interaction.response.send_message(f"Zabrano **{amount}** waluty od **{member.display_name}**.")
+        if (member is None) == (role is None):
+            return await interaction.response.send_message("Podaj użytkownika albo rolę.", ephemeral=True)
+        if member:
+            await async_database.update_gambling_points(interaction.guild.id, member.id, -amount, reason='admin')
+            return await interaction.response.send_message(f"Zabrano **{amount}** waluty od **{member.display_name}**.")
+        member_ids = self.role_member_ids(role)
+        if not member_ids:
+            return await interaction.response.send_message(f"Rola **{role.name}** nie ma żadnych członków.", ephemeral=True)
+        # In bulk nobody is taken below zero
+        users, points = await self.run_bulk(interaction, async_database.take_gambling_points_bulk, interaction.guild.id, member_ids, amount)
+        await interaction.edit_original_response(content=f"Zabrano łącznie **{points}** waluty od **{users}** członków roli **{role.name}**.")
+
+    economy = app_commands.Group(
+        name="economy",
+        description="Operacje na walucie wszystkich członków serwera.",
+        default_permissions=discord.Permissions(administrator=True),
+        guild_only=True
+    )
+
+    @economy.command(name='payout', description='Daje każdemu członkowi serwera określoną ilość waluty.')
+    @app_commands.describe(amount='Ilość punktów dla każdego członka.')
+    async def economy_payout(self, interaction: discord.Interaction, amount: int):
+        if amount <= 0:
+            return await interaction.response.send_message("Kwota musi być dodatnia.", ephemeral=True)
+        member_ids = [member.id for member in interaction.guild.members if not member.bot]
+        users, points = await self.run_bulk(
+            interaction, async_database.give_gambling_points_bulk, interaction.guild.id, member_ids, amount, 'payout'
+        )
+        await interaction.edit_original_response(content=f"Wypłacono **{amount}** waluty **{users}** członkom (łącznie **{points}**).")
+
+    @economy.command(name='tax', description='Zabiera każdemu członkowi serwera procent jego waluty.')
+    @app_commands.describe(percent='Jaki procent salda zabrać (1-100).')
+    async def economy_tax(self, interaction: discord.Interaction, percent: int):
+        if not 1 <= percent <= 100:
+            return await interaction.response.send_message("Procent musi wynosić od 1 do 100.", ephemeral=True)
+        users, points = await self.run_bulk(interaction, async_database.tax_gambling_points, interaction.guild.id, percent)
+        await interaction.edit_original_response(content=f"Pobrano podatek **{percent}%**: łącznie **{points}** waluty od **{users}** członków.")
+
+    backup_group = app_commands.Group(
+        name="backup",
+        description="Kopie zapasowe i eksport danych.",
+        default_permissions=discord.Permissions(administrator=True),
+        guild_only=True
+    )
+
+    @backup_group.command(name='create', description='Tworzy kopię zapasową całej bazy danych (tylko właściciel bota).')
+    async def backup_create(self, interaction: discord.Interaction):
+        # The database holds every guild, so only the bot's owner may copy it
+        if not await self.bot.is_owner(interaction.user):
+            return await interaction.response.send_message("Tylko właściciel bota może tworzyć kopie zapasowe.", ephemeral=True)
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        try:
+            path = await self.create_backup()
+        except Exception as e:
+            logging.error(f"Backup failed: {e}")
+            return await interaction.followup.send("❌ Nie udało się utworzyć kopii zapasowej.", ephemeral=True)
+        await interaction.followup.send(
+            f"Utworzono kopię zapasową `{os.path.basename(path)}` ({os.path.getsize(path) / 2**20:.1f} MiB).", ephemeral=True
+        )
+
+    @backup_group.command(name='export', description='Eksportuje dane tego serwera do pliku.')
+    @app_commands.describe(file_format='ndjson (wszystkie tabele) lub csv (tylko użytkownicy)')
+    @app_commands.rename(file_format='format')
+    async def backup_export(self, interaction: discord.Interaction, file_format: str = 'ndjson'):
+        if file_format not in ('ndjson', 'csv'):
+            return await interaction.response.send_message("❌ Nieznany format. Dostępne: ndjson, csv.", ephemeral=True)
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        filename = f"guild-{interaction.guild.id}.{file_format}"
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, filename)
+
+            def export():
+                with open(path, 'w', newline='', encoding='utf-8') as file:
+                    if file_format == 'csv':
+                        return backup.export_csv(interaction.guild.id, file)
+                    return backup.export_ndjson(interaction.guild.id, file)
+
+            count = await asyncio.to_thread(export)
+            if os.path.getsize(path) > interaction.guild.filesize_limit:
+                return await interaction.followup.send(
+                    f"Eksport ({count} wierszy) jest za duży, aby go wysłać. Użyj `python backup.py export {interaction.guild.id}` na serwerze bota.",
+                    ephemeral=True
+                )
+            await interaction.followup.send(f"Wyeksportowano {count} wierszy.", file=discord.File(path, filename=filename), ephemeral=True)
+
+    @app_commands.command(name='antispam', description='Ustawia, ile wiadomości z rzędu daje punkty.')
+    @app_commands.describe(
+        burst='Ile wiadomości wysłanych jedna po drugiej daje punkty.',
+        per_minute='Ile kolejnych wiadomości na minutę daje punkty (0 wyłącza limit).'
+    )
+    @app_commands.default_permissions(administrator=True)
+    async def antispam(self, interaction: discord.Interaction, burst: int, per_minute: int):
+        if not 1 <= burst <= 100:
+            return await interaction.response.send_message("Liczba wiadomości z rzędu musi wynosić od 1 do 100.", ephemeral=True)
+        if not 0 <= per_minute <= 600:
+            return await interaction.response.send_message("Liczba wiadomości na minutę musi wynosić od 0 do 600.", ephemeral=True)
+        await async_database.set_message_rate_limit(interaction.guild.id, burst, per_minute)
+        self.message_limiter.set_limits(interaction.guild.id, burst, per_minute)
+        if per_minute == 0:
+            await interaction.response.send_message("Limit wyłączony: każda wiadomość daje punkty.")
+        else:
+            await interaction.response.send_message(
+                f"Punkty daje do **{burst}** wiadomości z rzędu i **{per_minute}** kolejnych na minutę."
+            )
 
 async def setup(bot):
     await bot.add_cog(Core(bot))
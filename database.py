@@ -1,21 +1,127 @@
+import logging
 import sqlite3
+import threading
+import time
 from datetime import datetime
 import os
+from cache import LRUCache
+import metrics
 
 DB_FOLDER = 'data'
 DB_NAME = os.path.join(DB_FOLDER, 'bot_stats.db')
 
-def get_db_connection():
-    """Establishes a connection to the database."""
-    if not os.path.exists(DB_FOLDER):
-        os.makedirs(DB_FOLDER)
-    conn = sqlite3.connect(DB_NAME)
+# Connection tuning, overridable through the environment
+DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'WAL')
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', 256 * 1024 * 1024))
+DB_CACHE_SIZE = int(os.getenv('DB_CACHE_SIZE', -64000))  # Negative values are in KiB
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 256))
+DB_BUSY_TIMEOUT = float(os.getenv('DB_BUSY_TIMEOUT', 5.0))
+
+# Read-through caches for rows that only change through admin commands
+GUILD_SETTINGS_CACHE_SIZE = int(os.getenv('GUILD_SETTINGS_CACHE_SIZE', 1000))
+SHOP_CACHE_SIZE = int(os.getenv('SHOP_CACHE_SIZE', 1000))
+
+_guild_settings_cache = LRUCache('guild_settings', GUILD_SETTINGS_CACHE_SIZE)
+_shop_items_cache = LRUCache('shop_items', SHOP_CACHE_SIZE)
+_shop_item_cache = LRUCache('shop_item', SHOP_CACHE_SIZE)
+
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_generation = 0  # Bumped by close_db_connections() to invalidate every thread's connection
+
+def _connect(readonly=False):
+    if readonly:
+        # The bot process owns the schema and the journal mode; this side only reads
+        conn = sqlite3.connect(
+            f"file:{os.path.abspath(DB_NAME)}?mode=ro",
+            uri=True,
+            timeout=DB_BUSY_TIMEOUT,
+            cached_statements=DB_STATEMENT_CACHE_SIZE,
+            check_same_thread=False
+        )
+        conn.execute("PRAGMA query_only = ON")
+    else:
+        if not os.path.exists(DB_FOLDER):
+            os.makedirs(DB_FOLDER)
+        conn = sqlite3.connect(
+            DB_NAME,
+            timeout=DB_BUSY_TIMEOUT,
+            cached_statements=DB_STATEMENT_CACHE_SIZE,
+            check_same_thread=False  # Only so close_db_connections() can close it
+        )
+        conn.execute(f"PRAGMA journal_mode = {DB_JOURNAL_MODE}")
+        conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
     conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = {DB_CACHE_SIZE}")
     return conn
 
+def get_db_connection():
+    """Returns the calling thread's connection, opening it on first use.
+
+    Connections stay open for the lifetime of the process so that pragmas and
+    the prepared statement cache are reused between calls.
+    """
+    conn = getattr(_local, 'conn', None)
+    readonly = getattr(_local, 'readonly', False)
+    if conn is not None and _local.key == (DB_NAME, _generation, readonly):
+        return conn
+    if conn is not None:
+        with _connections_lock:
+            if conn in _connections:
+                _connections.remove(conn)
+        conn.close()
+    conn = _connect(readonly)
+    _local.conn = conn
+    _local.key = (DB_NAME, _generation, readonly)
+    with _connections_lock:
+        _connections.append(conn)
+    return conn
+
+def open_connection(readonly=False):
+    """Opens a connection outside the pool, for long jobs such as backups, exports and imports."""
+    return _connect(readonly)
+
+def use_readonly_connection():
+    """Makes the calling thread open its connection read-only, e.g. as a thread pool initializer."""
+    _local.readonly = True
+
+def get_data_version():
+    """Returns PRAGMA data_version of the calling thread's connection.
+
+    The value changes whenever another connection commits, so a thread that
+    only reads can use it to tell whether anything it cached is still current.
+    """
+    return get_db_connection().execute("PRAGMA data_version").fetchone()[0]
+
+def close_db_connections():
+    """Closes every pooled connection, e.g. on shutdown."""
+    global _generation
+    with _connections_lock:
+        _generation += 1
+        connections = list(_connections)
+        _connections.clear()
+    for conn in connections:
+        conn.close()
+    clear_caches()
+
+def clear_caches():
+    """Empties the read-through caches, e.g. after pointing DB_NAME at another file."""
+    for cache in (_guild_settings_cache, _shop_items_cache, _shop_item_cache):
+        cache.clear()
+
+def get_cache_stats():
+    """Returns hit/miss counters and sizes of the read-through caches."""
+    return {cache.name: cache.stats() for cache in (_guild_settings_cache, _shop_items_cache, _shop_item_cache)}
+
 def init_db():
-    """Initializes the database and creates tables if they don't exist."""
+    """Initializes the database, creates the base tables and applies pending migrations."""
     conn = get_db_connection()
+    if get_schema_version(conn) == len(MIGRATIONS):
+        # Already current, e.g. on every restart after the first
+        return
     cursor = conn.cursor()
 
     # Table for guild-specific settings
@@ -66,170 +172,873 @@ def init_db():
     ''')
 
     conn.commit()
-    conn.close()
+    run_migrations(conn)
+
+# --- Schema Migrations ---
+# Each step upgrades the schema by one version and is recorded in PRAGMA user_version.
+# Steps are only ever appended; never edit one that has already shipped.
+
+def _migrate_users_guild_first_key(cursor):
+    """Rebuilds users with a (guild_id, user_id) primary key so per-guild lookups use it."""
+    cursor.execute("DROP TABLE IF EXISTS users_new")
+    cursor.execute('''
+        CREATE TABLE users_new (
+            user_id INTEGER NOT NULL,
+            guild_id INTEGER NOT NULL,
+            activity_points INTEGER NOT NULL DEFAULT 0,
+            monthly_activity_points INTEGER NOT NULL DEFAULT 0,
+            gambling_points INTEGER NOT NULL DEFAULT 0,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            voice_seconds INTEGER NOT NULL DEFAULT 0,
+            last_activity_timestamp TIMESTAMP,
+            PRIMARY KEY (guild_id, user_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("INSERT INTO users_new SELECT * FROM users")
+    cursor.execute("DROP TABLE users")
+    cursor.execute("ALTER TABLE users_new RENAME TO users")
+
+def _migrate_ranking_indexes(cursor):
+    """Adds the indexes used by leaderboards; they also cover user_id through the primary key."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_activity ON users (guild_id, activity_points)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_monthly_activity ON users (guild_id, monthly_activity_points)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_gambling ON users (guild_id, gambling_points)")
+
+def _migrate_monthly_epochs(cursor):
+    """Stamps monthly points with the month they were earned in, so resets don't rewrite rows."""
+    cursor.execute("ALTER TABLE users ADD COLUMN monthly_epoch INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("UPDATE users SET monthly_epoch = ?", (current_month_epoch(),))
+    cursor.execute("DROP INDEX IF EXISTS idx_users_monthly_activity")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_monthly_epoch ON users (guild_id, monthly_epoch, monthly_activity_points)")
+
+def _migrate_points_ledger(cursor):
+    """Adds the append-only points ledger and its snapshots, seeded with the current balances."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS points_ledger (
+            entry_id INTEGER PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            activity_delta INTEGER NOT NULL DEFAULT 0,
+            gambling_delta INTEGER NOT NULL DEFAULT 0,
+            reason TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_points_ledger_guild ON points_ledger (guild_id, entry_id)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_snapshots (
+            snapshot_id INTEGER PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            last_entry_id INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ledger_snapshots_guild ON ledger_snapshots (guild_id, snapshot_id)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_snapshot_balances (
+            snapshot_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            activity_points INTEGER NOT NULL,
+            gambling_points INTEGER NOT NULL,
+            PRIMARY KEY (snapshot_id, user_id)
+        ) WITHOUT ROWID
+    ''')
+    # Balances from before the ledger existed become each guild's first snapshot
+    now = datetime.utcnow()
+    for (guild_id,) in cursor.execute("SELECT DISTINCT guild_id FROM users").fetchall():
+        cursor.execute(
+            "INSERT INTO ledger_snapshots (guild_id, last_entry_id, created_at) VALUES (?, 0, ?)",
+            (guild_id, now)
+        )
+        cursor.execute(
+            "INSERT INTO ledger_snapshot_balances SELECT ?, user_id, activity_points, gambling_points FROM users WHERE guild_id = ?",
+            (cursor.lastrowid, guild_id)
+        )
+
+def _migrate_activity_rollups(cursor):
+    """Adds the activity time series: per-channel hourly, daily and monthly buckets plus per-guild hours."""
+    for table, period in [
+        ('activity_hourly', 'hour'),
+        ('activity_daily', 'day'),
+        ('activity_monthly', 'month'),
+    ]:
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                guild_id INTEGER NOT NULL,
+                {period} INTEGER NOT NULL,
+                channel_id INTEGER NOT NULL,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                voice_seconds INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (guild_id, {period}, channel_id)
+            ) WITHOUT ROWID
+        ''')
+    # Across all channels, which keeps a year of heatmap data at 8760 rows per guild
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS activity_guild_hourly (
+            guild_id INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            voice_seconds INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, hour)
+        ) WITHOUT ROWID
+    ''')
+
+def _migrate_bot_meta(cursor):
+    """Adds a key/value table for bot state that must survive restarts."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bot_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+
+def _migrate_message_rate_limits(cursor):
+    """Adds per-guild limits on how many messages in a row earn points (see antispam.py)."""
+    cursor.execute("ALTER TABLE guild_settings ADD COLUMN message_points_burst INTEGER NOT NULL DEFAULT 5")
+    cursor.execute("ALTER TABLE guild_settings ADD COLUMN message_points_per_minute INTEGER NOT NULL DEFAULT 12")
+
+MIGRATIONS = [
+    _migrate_users_guild_first_key,
+    _migrate_ranking_indexes,
+    _migrate_monthly_epochs,
+    _migrate_points_ledger,
+    _migrate_activity_rollups,
+    _migrate_bot_meta,
+    _migrate_message_rate_limits,
+]
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def run_migrations(conn):
+    """Applies every migration newer than the database's user_version, one transaction each."""
+    while True:
+        # Take the write lock before reading the version so that concurrent processes can't both apply a step
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = get_schema_version(conn)
+            if version >= len(MIGRATIONS):
+                conn.commit()
+                return
+            migration = MIGRATIONS[version]
+            migration(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logging.info(f"Applied database migration {version + 1}: {migration.__name__}")
 
 def log_member_count(guild_id, member_count):
     """Logs the current member count for a guild for the current date."""
     conn = get_db_connection()
-    cursor = conn.cursor()
     today = datetime.utcnow().date()
-    # Use INSERT OR REPLACE to avoid duplicate entries for the same day
-    cursor.execute(
-        "INSERT OR REPLACE INTO member_counts (guild_id, member_count, date) VALUES (?, ?, ?)",
-        (guild_id, member_count, today)
+    with conn:
+        # Use INSERT OR REPLACE to avoid duplicate entries for the same day
+        conn.execute(
+            "INSERT OR REPLACE INTO member_counts (guild_id, member_count, date) VALUES (?, ?, ?)",
+            (guild_id, member_count, today)
+        )
+
+def get_member_count_history(guild_id, since=None):
+    """Retrieves the member count history for a guild, optionally starting at the date `since`."""
+    conn = get_db_connection()
+    cursor = conn.execute(
+        "SELECT date, member_count FROM member_counts WHERE guild_id = ? AND date >= ? ORDER BY date ASC",
+        (guild_id, since or '')
     )
-    conn.commit()
-    conn.close()
+    return cursor.fetchall()
 
-def get_member_count_history(guild_id):
-    """Retrieves the member count history for a guild."""
+def get_latest_member_count(guild_id):
+    """Returns the most recent (date, member_count) row for a guild, or None."""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT date, member_count FROM member_counts WHERE guild_id = ? ORDER BY date ASC",
+    return conn.execute(
+        "SELECT date, member_count FROM member_counts WHERE guild_id = ? ORDER BY date DESC LIMIT 1",
         (guild_id,)
+    ).fetchone()
+
+# --- Bot Metadata ---
+
+def get_meta(key, default=None):
+    conn = get_db_connection()
+    row = conn.execute("SELECT value FROM bot_meta WHERE key = ?", (key,)).fetchone()
+    return row['value'] if row else default
+
+def set_meta(key, value):
+    conn = get_db_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO bot_meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+
+# --- Activity Time Series ---
+# Message and voice activity per (guild, channel) bucket. Buckets are pre-aggregated
+# in memory, then each flush adds them to the hourly, daily and monthly tables at once.
+# Times are UTC: hours and days since the Unix epoch, months as month epochs.
+
+ACTIVITY_HOURLY_RETENTION_DAYS = int(os.getenv('ACTIVITY_HOURLY_RETENTION_DAYS', 35))
+ACTIVITY_GUILD_HOURLY_RETENTION_DAYS = int(os.getenv('ACTIVITY_GUILD_HOURLY_RETENTION_DAYS', 400))
+ACTIVITY_DAILY_RETENTION_DAYS = int(os.getenv('ACTIVITY_DAILY_RETENTION_DAYS', 800))
+
+def current_activity_hour(now=None):
+    """Hour bucket of a Unix timestamp (default: now)."""
+    return int((time.time() if now is None else now) // 3600)
+
+def _upsert_activity_sql(table, key_columns):
+    keys = ", ".join(key_columns)
+    return f"""
+        INSERT INTO {table} ({keys}, message_count, voice_seconds)
+        VALUES ({", ".join("?" * (len(key_columns) + 2))})
+        ON CONFLICT ({keys}) DO UPDATE SET
+            message_count = message_count + excluded.message_count,
+            voice_seconds = voice_seconds + excluded.voice_seconds
+    """
+
+def add_activity_buckets(buckets):
+    """Adds (guild_id, channel_id, hour, messages, voice_seconds) buckets to every rollup in one transaction."""
+    rollups = {'hourly': {}, 'daily': {}, 'monthly': {}, 'guild_hourly': {}}
+    month_of_day = {}
+    for guild_id, channel_id, hour, messages, voice_seconds in buckets:
+        day = hour // 24
+        if day not in month_of_day:
+            month_of_day[day] = current_month_epoch(datetime.utcfromtimestamp(day * 86400))
+        for rollup, key in [
+            ('hourly', (guild_id, hour, channel_id)),
+            ('daily', (guild_id, day, channel_id)),
+            ('monthly', (guild_id, month_of_day[day], channel_id)),
+            ('guild_hourly', (guild_id, hour)),
+        ]:
+            totals = rollups[rollup].setdefault(key, [0, 0])
+            totals[0] += messages
+            totals[1] += voice_seconds
+    if not rollups['hourly']:
+        return
+
+    conn = get_db_connection()
+    with conn:
+        for table, key_columns, rollup in [
+            ('activity_hourly', ('guild_id', 'hour', 'channel_id'), 'hourly'),
+            ('activity_daily', ('guild_id', 'day', 'channel_id'), 'daily'),
+            ('activity_monthly', ('guild_id', 'month', 'channel_id'), 'monthly'),
+            ('activity_guild_hourly', ('guild_id', 'hour'), 'guild_hourly'),
+        ]:
+            conn.executemany(
+                _upsert_activity_sql(table, key_columns),
+                [key + tuple(totals) for key, totals in rollups[rollup].items()]
+            )
+
+def prune_activity(now=None):
+    """Deletes rollup rows past their retention. Monthly rows are kept. Returns the number of rows deleted."""
+    hour = current_activity_hour(now)
+    deleted = 0
+    conn = get_db_connection()
+    with conn:
+        guild_ids = [row[0] for row in conn.execute("SELECT DISTINCT guild_id FROM activity_monthly")]
+        # Per guild, so every delete is a range on the primary key
+        for guild_id in guild_ids:
+            for table, column, cutoff in [
+                ('activity_hourly', 'hour', hour - ACTIVITY_HOURLY_RETENTION_DAYS * 24),
+                ('activity_guild_hourly', 'hour', hour - ACTIVITY_GUILD_HOURLY_RETENTION_DAYS * 24),
+                ('activity_daily', 'day', hour // 24 - ACTIVITY_DAILY_RETENTION_DAYS),
+            ]:
+                deleted += conn.execute(
+                    f"DELETE FROM {table} WHERE guild_id = ? AND {column} < ?", (guild_id, cutoff)
+                ).rowcount
+    return deleted
+
+def get_activity_heatmap(guild_id, since_hour, until_hour):
+    """Sums activity in [since_hour, until_hour) by UTC weekday (Monday = 0) and hour of day.
+
+    Returns rows of (weekday, hour_of_day, message_count, voice_seconds).
+    """
+    conn = get_db_connection()
+    cursor = conn.execute(
+        """
+        SELECT (hour / 24 + 3) % 7 AS weekday, hour % 24 AS hour_of_day,
+               SUM(message_count) AS message_count, SUM(voice_seconds) AS voice_seconds
+        FROM activity_guild_hourly
+        WHERE guild_id = ? AND hour >= ? AND hour < ?
+        GROUP BY weekday, hour_of_day
+        """,
+        (guild_id, since_hour, until_hour)
+    )
+    return cursor.fetchall()
+
+def get_top_channels(guild_id, since_day, limit=10):
+    """Returns the channels with the most messages since a day, as (channel_id, message_count, voice_seconds) rows."""
+    conn = get_db_connection()
+    cursor = conn.execute(
+        """
+        SELECT channel_id, SUM(message_count) AS message_count, SUM(voice_seconds) AS voice_seconds
+        FROM activity_daily
+        WHERE guild_id = ? AND day >= ?
+        GROUP BY channel_id
+        ORDER BY message_count DESC, voice_seconds DESC
+        LIMIT ?
+        """,
+        (guild_id, since_day, limit)
     )
-    history = cursor.fetchall()
-    conn.close()
-    return history
+    return cursor.fetchall()
+
+# --- Monthly Epochs ---
+# monthly_activity_points only counts while monthly_epoch is the current month.
+# Older rows read as 0 and are zeroed on their next write, so a new month needs no UPDATE.
+
+def current_month_epoch(now=None):
+    """Returns the number of months since year 0 for `now` (UTC by default)."""
+    now = now or datetime.utcnow()
+    return now.year * 12 + now.month - 1
+
+MONTHLY_POINTS_SQL = "CASE WHEN monthly_epoch = ? THEN monthly_activity_points ELSE 0 END"
+
+# --- Change Listeners ---
+# In-memory views of the points (leaderboards, ranks) subscribe here instead of re-querying.
+
+_points_listeners = []
+
+def add_points_listener(listener):
+    """Registers listener(guild_id, rows), called after points change.
+
+    `rows` holds the new totals (user_id, activity_points, monthly_activity_points,
+    gambling_points) of every changed user, or is None when the whole guild changed.
+    Listeners run on the thread that made the write, after it has been committed.
+    """
+    _points_listeners.append(listener)
+
+def remove_points_listener(listener):
+    if listener in _points_listeners:
+        _points_listeners.remove(listener)
+
+def _fetch_point_totals(conn, keys):
+    totals = {}
+    epoch = current_month_epoch()
+    for guild_id, user_id in keys:
+        row = conn.execute(
+            f"SELECT user_id, activity_points, {MONTHLY_POINTS_SQL} AS monthly_activity_points, gambling_points "
+            "FROM users WHERE guild_id = ? AND user_id = ?",
+            (epoch, guild_id, user_id)
+        ).fetchone()
+        totals.setdefault(guild_id, []).append(row)
+    return totals
+
+def _notify_points_changed(totals):
+    for guild_id, rows in totals.items():
+        for listener in list(_points_listeners):
+            try:
+                listener(guild_id, rows)
+            except Exception as e:
+                logging.error(f"Points listener {listener!r} failed for guild {guild_id}: {e}")
 
 # --- User Data Functions ---
 
 def add_points(guild_id, user_id, activity_points_to_add, gambling_points_to_add):
     """Adds points for a user, creating a record if it doesn't exist."""
+    add_points_bulk([(guild_id, user_id, activity_points_to_add, gambling_points_to_add, 0, 0)])
+
+def add_points_bulk(rows):
+    """Adds points for many users in one transaction.
+
+    `rows` is an iterable of (guild_id, user_id, activity_points_to_add,
+    gambling_points_to_add, voice_seconds_to_add, messages_to_add).
+    """
+    rows = list(rows)
+    now = datetime.utcnow()
+    epoch = current_month_epoch(now)
+    totals = None
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT OR IGNORE INTO users (guild_id, user_id) VALUES (?, ?)",
-        (guild_id, user_id)
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO users (guild_id, user_id, activity_points, monthly_activity_points, monthly_epoch, gambling_points, voice_seconds, message_count, last_activity_timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET
+                activity_points = activity_points + excluded.activity_points,
+                monthly_activity_points = CASE
+                    WHEN monthly_epoch = excluded.monthly_epoch THEN monthly_activity_points + excluded.monthly_activity_points
+                    ELSE excluded.monthly_activity_points
+                END,
+                monthly_epoch = excluded.monthly_epoch,
+                gambling_points = gambling_points + excluded.gambling_points,
+                voice_seconds = voice_seconds + excluded.voice_seconds,
+                message_count = message_count + excluded.message_count,
+                last_activity_timestamp = excluded.last_activity_timestamp
+            """,
+            [
+                (guild_id, user_id, activity, activity, epoch, gambling, voice, messages, now)
+                for guild_id, user_id, activity, gambling, voice, messages in rows
+            ]
+        )
+        _append_ledger(conn, [
+            (guild_id, user_id, activity, gambling, 'activity')
+            for guild_id, user_id, activity, gambling, _, _ in rows
+            if activity or gambling
+        ], now)
+        if _points_listeners:
+            totals = _fetch_point_totals(conn, [(row[0], row[1]) for row in rows])
+    if totals:
+        _notify_points_changed(totals)
+
+def get_user_data(guild_id, user_id):
+    """Gets all data for a user, creating a record if it doesn't exist."""
+    conn = get_db_connection()
+    with conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO users (guild_id, user_id) VALUES (?, ?)",
+            (guild_id, user_id)
+        )
+    return find_user_data(guild_id, user_id)
+
+def find_user_data(guild_id, user_id):
+    """Gets all data for a user without creating a record; None if they have none."""
+    conn = get_db_connection()
+    cursor = conn.execute(
+        f"""
+        SELECT user_id, guild_id, activity_points, {MONTHLY_POINTS_SQL} AS monthly_activity_points, gambling_points,
+               message_count, voice_seconds, last_activity_timestamp
+        FROM users WHERE guild_id = ? AND user_id = ?
+        """,
+        (current_month_epoch(), guild_id, user_id)
     )
-    cursor.execute(
-        """
-        UPDATE users
-        SET activity_points = activity_points + ?,
-            monthly_activity_points = monthly_activity_points + ?,
-            gambling_points = gambling_points + ?,
-            last_activity_timestamp = ?
-        WHERE guild_id = ? AND user_id = ?
+    return cursor.fetchone()
+
+# Columns handed to points listeners, for use in RETURNING clauses
+_RETURNING_TOTALS = f"RETURNING user_id, activity_points, {MONTHLY_POINTS_SQL} AS monthly_activity_points, gambling_points"
+
+def update_gambling_points(guild_id, user_id, amount, reason='adjust'):
+    """Updates a user's gambling points by a relative amount, creating the user if needed."""
+    conn = get_db_connection()
+    with conn:
+        row = conn.execute(
+            f"""
+            INSERT INTO users (guild_id, user_id, gambling_points) VALUES (?, ?, ?)
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET gambling_points = gambling_points + excluded.gambling_points
+            {_RETURNING_TOTALS}
+            """,
+            (guild_id, user_id, amount, current_month_epoch())
+        ).fetchone()
+        _append_ledger(conn, [(guild_id, user_id, 0, amount, reason)])
+    _notify_points_changed({guild_id: [row]})
+    return row['gambling_points']
+
+# --- Economy Transactions ---
+# Balance checks happen inside the UPDATE itself, so concurrent commands can't overdraw.
+
+def _conditional_gambling_update(guild_id, user_id, amount, required_balance, reason):
+    conn = get_db_connection()
+    with conn:
+        row = conn.execute(
+            f"""
+            UPDATE users SET gambling_points = gambling_points + ?
+            WHERE guild_id = ? AND user_id = ? AND gambling_points >= ?
+            {_RETURNING_TOTALS}
+            """,
+            (amount, guild_id, user_id, required_balance, current_month_epoch())
+        ).fetchone()
+        if row is not None:
+            _append_ledger(conn, [(guild_id, user_id, 0, amount, reason)])
+    if row is None:
+        return None
+    _notify_points_changed({guild_id: [row]})
+    return row['gambling_points']
+
+def debit_gambling_points(guild_id, user_id, amount, reason='debit'):
+    """Takes `amount` only if the user has at least that much. Returns the new balance, or None."""
+    return _conditional_gambling_update(guild_id, user_id, -amount, amount, reason)
+
+def settle_bet(guild_id, user_id, amount, won):
+    """Settles an already rolled bet in one statement.
+
+    Returns the new balance, or None if the user can't cover `amount`.
+    """
+    return _conditional_gambling_update(guild_id, user_id, amount if won else -amount, amount, 'bet')
+
+def reserve_purchase(guild_id, user_id, price):
+    """Debits the price of a purchase before it is fulfilled. Returns the new balance, or None."""
+    return debit_gambling_points(guild_id, user_id, price, reason='purchase')
+
+def rollback_purchase(guild_id, user_id, price):
+    """Refunds a reserved purchase that could not be fulfilled. Returns the new balance."""
+    return update_gambling_points(guild_id, user_id, price, reason='refund')
+
+# --- Bulk Economy Operations ---
+# Role and guild-wide adjustments run as one transaction, applied set-based to
+# chunks of users loaded into a temp table. `progress(done, total)` is called
+# on the database thread after each chunk.
+
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', 5000))
+
+def _load_bulk_targets(conn, user_ids):
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS bulk_targets (user_id INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.bulk_targets")
+    conn.executemany("INSERT OR IGNORE INTO temp.bulk_targets (user_id) VALUES (?)", [(user_id,) for user_id in user_ids])
+
+def _debit_bulk_targets(conn, guild_id, debit_sql, params, reason, now):
+    """Takes `debit_sql` (an expression over gambling_points) from every loaded user. Returns (users, points) taken."""
+    where = f"guild_id = ? AND user_id IN (SELECT user_id FROM temp.bulk_targets) AND ({debit_sql}) > 0"
+    users, points = conn.execute(
+        f"SELECT COUNT(*), COALESCE(SUM({debit_sql}), 0) FROM users WHERE {where}", params + (guild_id,) + params
+    ).fetchone()
+    conn.execute(
+        f"""
+        INSERT INTO points_ledger (guild_id, user_id, activity_delta, gambling_delta, reason, created_at)
+        SELECT guild_id, user_id, 0, -({debit_sql}), ?, ? FROM users WHERE {where}
         """,
-        (activity_points_to_add, activity_points_to_add, gambling_points_to_add, datetime.utcnow(), guild_id, user_id)
+        params + (reason, now, guild_id) + params
     )
-    conn.commit()
-    conn.close()
+    conn.execute(f"UPDATE users SET gambling_points = gambling_points - ({debit_sql}) WHERE {where}", params + (guild_id,) + params)
+    return users, points
 
-def get_user_data(guild_id, user_id):
-    """Gets all data for a user, creating a record if it doesn't exist."""
+def _run_bulk(guild_id, chunks, total, apply, progress):
+    """Applies `apply(conn, now)` to each chunk of user ids in one transaction and sums its (users, points)."""
+    now = datetime.utcnow()
+    users = points = done = 0
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT OR IGNORE INTO users (guild_id, user_id) VALUES (?, ?)",
-        (guild_id, user_id)
+    with conn:
+        for chunk in chunks:
+            _load_bulk_targets(conn, chunk)
+            chunk_users, chunk_points = apply(conn, now)
+            users += chunk_users
+            points += chunk_points
+            done += len(chunk)
+            if progress:
+                progress(done, total)
+    # Too many rows changed to patch the in-memory views; they reload the guild instead
+    _notify_points_changed({guild_id: None})
+    return users, points
+
+def _chunked(user_ids):
+    return [user_ids[i:i + BULK_CHUNK_SIZE] for i in range(0, len(user_ids), BULK_CHUNK_SIZE)]
+
+def give_gambling_points_bulk(guild_id, user_ids, amount, reason='admin', progress=None):
+    """Gives `amount` to every user, creating users as needed. Returns (users, points) given."""
+    user_ids = list(user_ids)
+
+    def apply(conn, now):
+        cursor = conn.execute(
+            """
+            INSERT INTO users (guild_id, user_id, gambling_points)
+            SELECT ?, user_id, ? FROM temp.bulk_targets WHERE true
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET gambling_points = gambling_points + excluded.gambling_points
+            """,
+            (guild_id, amount)
+        )
+        conn.execute(
+            """
+            INSERT INTO points_ledger (guild_id, user_id, activity_delta, gambling_delta, reason, created_at)
+            SELECT ?, user_id, 0, ?, ?, ? FROM temp.bulk_targets
+            """,
+            (guild_id, amount, reason, now)
+        )
+        return cursor.rowcount, cursor.rowcount * amount
+    return _run_bulk(guild_id, _chunked(user_ids), len(user_ids), apply, progress)
+
+def take_gambling_points_bulk(guild_id, user_ids, amount, reason='admin', progress=None):
+    """Takes up to `amount` from every user, never below zero. Returns (users, points) taken."""
+    user_ids = list(user_ids)
+
+    def apply(conn, now):
+        return _debit_bulk_targets(conn, guild_id, "MIN(gambling_points, ?)", (amount,), reason, now)
+    return _run_bulk(guild_id, _chunked(user_ids), len(user_ids), apply, progress)
+
+def tax_gambling_points(guild_id, percent, reason='tax', progress=None):
+    """Takes `percent` of every positive balance in the guild, rounded down. Returns (users, points) taken."""
+    conn = get_db_connection()
+    user_ids = [row[0] for row in conn.execute(
+        "SELECT user_id FROM users WHERE guild_id = ? AND gambling_points > 0 ORDER BY user_id", (guild_id,)
+    )]
+
+    def apply(conn, now):
+        return _debit_bulk_targets(conn, guild_id, "gambling_points * ? / 100", (percent,), reason, now)
+    return _run_bulk(guild_id, _chunked(user_ids), len(user_ids), apply, progress)
+
+# --- Points Ledger ---
+# Every balance change is also appended to points_ledger in the same transaction.
+# Periodic snapshots compact the ledger so balances can be rebuilt from the latest
+# snapshot plus the entries after it. Entries older than the oldest kept snapshot
+# can't be replayed any more and are deleted with it.
+
+LEDGER_SNAPSHOTS_KEPT = int(os.getenv('LEDGER_SNAPSHOTS_KEPT', 3))
+
+def _append_ledger(conn, entries, now=None):
+    """Appends (guild_id, user_id, activity_delta, gambling_delta, reason) entries."""
+    if not entries:
+        return
+    now = now or datetime.utcnow()
+    conn.executemany(
+        "INSERT INTO points_ledger (guild_id, user_id, activity_delta, gambling_delta, reason, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        [entry + (now,) for entry in entries]
     )
-    cursor.execute("SELECT * FROM users WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
-    user_data = cursor.fetchone()
-    conn.close()
-    return user_data
 
-def update_gambling_points(guild_id, user_id, amount):
-    """Updates a user's gambling points by a relative amount."""
-    get_user_data(guild_id, user_id) # Ensure user exists
+def _latest_snapshot(conn, guild_id):
+    return conn.execute(
+        "SELECT snapshot_id, last_entry_id FROM ledger_snapshots WHERE guild_id = ? ORDER BY snapshot_id DESC LIMIT 1",
+        (guild_id,)
+    ).fetchone()
+
+# Balances at the latest snapshot plus the ledger tail, optionally up to an entry id
+_RECONSTRUCT_SQL = """
+    SELECT {snapshot_column} user_id, SUM(activity) AS activity_points, SUM(gambling) AS gambling_points FROM (
+        SELECT user_id, activity_points AS activity, gambling_points AS gambling
+        FROM ledger_snapshot_balances WHERE snapshot_id = ?
+        UNION ALL
+        SELECT user_id, activity_delta, gambling_delta
+        FROM points_ledger WHERE guild_id = ? AND entry_id > ? AND entry_id <= ?
+    ) {user_filter}
+    GROUP BY user_id
+"""
+
+def reconstruct_balances(guild_id, user_id=None):
+    """Rebuilds balances from the latest snapshot plus the ledger entries after it.
+
+    Returns {user_id: (activity_points, gambling_points)} for the guild, or only for `user_id`.
+    """
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE users SET gambling_points = gambling_points + ? WHERE guild_id = ? AND user_id = ?",
-        (amount, guild_id, user_id)
+    snapshot = _latest_snapshot(conn, guild_id)
+    snapshot_id, last_entry_id = (snapshot['snapshot_id'], snapshot['last_entry_id']) if snapshot else (None, 0)
+    params = [snapshot_id, guild_id, last_entry_id, 2**63 - 1]
+    user_filter = ""
+    if user_id is not None:
+        user_filter = "WHERE user_id = ?"
+        params.append(user_id)
+    cursor = conn.execute(_RECONSTRUCT_SQL.format(snapshot_column="", user_filter=user_filter), params)
+    return {row['user_id']: (row['activity_points'], row['gambling_points']) for row in cursor}
+
+def create_ledger_snapshot(guild_id):
+    """Compacts the ledger of a guild into a new snapshot and prunes old snapshots and the entries they cover.
+
+    Returns the new snapshot id, or None if nothing changed since the last one.
+    """
+    conn = get_db_connection()
+    with conn:
+        previous = _latest_snapshot(conn, guild_id)
+        previous_id, previous_entry = (previous['snapshot_id'], previous['last_entry_id']) if previous else (None, 0)
+        last_entry_id = conn.execute(
+            "SELECT MAX(entry_id) FROM points_ledger WHERE guild_id = ?", (guild_id,)
+        ).fetchone()[0]
+        if last_entry_id is None or last_entry_id <= previous_entry:
+            return None
+        snapshot_id = conn.execute(
+            "INSERT INTO ledger_snapshots (guild_id, last_entry_id, created_at) VALUES (?, ?, ?)",
+            (guild_id, last_entry_id, datetime.utcnow())
+        ).lastrowid
+        conn.execute(
+            "INSERT INTO ledger_snapshot_balances " + _RECONSTRUCT_SQL.format(snapshot_column="?,", user_filter=""),
+            (snapshot_id, previous_id, guild_id, previous_entry, last_entry_id)
+        )
+        stale = conn.execute(
+            "SELECT snapshot_id FROM ledger_snapshots WHERE guild_id = ? ORDER BY snapshot_id DESC LIMIT -1 OFFSET ?",
+            (guild_id, LEDGER_SNAPSHOTS_KEPT)
+        ).fetchall()
+        for row in stale:
+            conn.execute("DELETE FROM ledger_snapshot_balances WHERE snapshot_id = ?", (row['snapshot_id'],))
+            conn.execute("DELETE FROM ledger_snapshots WHERE snapshot_id = ?", (row['snapshot_id'],))
+        # Entry ids are reused once the highest one is deleted, so the entries after
+        # the previous snapshot always stay, even with a single snapshot kept
+        oldest_kept = conn.execute(
+            "SELECT MIN(last_entry_id) FROM ledger_snapshots WHERE guild_id = ?", (guild_id,)
+        ).fetchone()[0]
+        conn.execute(
+            "DELETE FROM points_ledger WHERE guild_id = ? AND entry_id <= ?",
+            (guild_id, min(oldest_kept, previous_entry))
+        )
+    return snapshot_id
+
+def _insert_rebase_snapshot(conn, guild_id):
+    last_entry_id = conn.execute("SELECT COALESCE(MAX(entry_id), 0) FROM points_ledger").fetchone()[0]
+    snapshot_id = conn.execute(
+        "INSERT INTO ledger_snapshots (guild_id, last_entry_id, created_at) VALUES (?, ?, ?)",
+        (guild_id, last_entry_id, datetime.utcnow())
+    ).lastrowid
+    conn.execute(
+        "INSERT INTO ledger_snapshot_balances SELECT ?, user_id, activity_points, gambling_points FROM users WHERE guild_id = ?",
+        (snapshot_id, guild_id)
     )
-    conn.commit()
-    cursor.execute("SELECT gambling_points FROM users WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
-    new_balance = cursor.fetchone()['gambling_points']
-    conn.close()
-    return new_balance
+    return snapshot_id
 
-def get_leaderboard(guild_id, point_type='activity_points', limit=10):
-    """Gets the top users based on a specified point type."""
+def rebase_ledger(guild_id, conn=None):
+    """Snapshots a guild's current balances as they are, e.g. after importing users the ledger never saw.
+
+    With `conn`, the snapshot joins the transaction open on it and the caller commits.
+    """
+    if conn is not None:
+        return _insert_rebase_snapshot(conn, guild_id)
+    conn = get_db_connection()
+    with conn:
+        return _insert_rebase_snapshot(conn, guild_id)
+
+def _select_leaderboard(guild_id, point_type, after, limit):
     if point_type not in ['activity_points', 'gambling_points', 'monthly_activity_points']:
         raise ValueError("Invalid point_type specified.")
 
+    conditions, params = "guild_id = ?", [guild_id]
+    if point_type == 'monthly_activity_points':
+        # Users without points this month are skipped by the (guild_id, monthly_epoch, ...) index
+        conditions += " AND monthly_epoch = ? AND monthly_activity_points > 0"
+        params.append(current_month_epoch())
+    if after is not None:
+        # The ranking indexes end in user_id (the primary key), so this seeks instead of skipping rows
+        conditions += f" AND ({point_type}, user_id) < (?, ?)"
+        params.extend(after)
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        f"SELECT user_id, {point_type} FROM users WHERE guild_id = ? ORDER BY {point_type} DESC LIMIT ?",
-        (guild_id, limit)
-    )
-    leaderboard = cursor.fetchall()
-    conn.close()
-    return leaderboard
+    return conn.execute(
+        f"SELECT user_id, {point_type} FROM users WHERE {conditions} ORDER BY {point_type} DESC, user_id DESC LIMIT ?",
+        params + [limit]
+    ).fetchall()
+
+def get_leaderboard(guild_id, point_type='activity_points', limit=10):
+    """Gets the top users based on a specified point type. Ties go to the higher user_id."""
+    return _select_leaderboard(guild_id, point_type, None, limit)
+
+def get_leaderboard_page(guild_id, point_type='activity_points', after=None, limit=10):
+    """Gets the users ranked right after `after`, a (points, user_id) cursor, in get_leaderboard order.
 
-def reset_monthly_points(guild_id):
-    """Resets the monthly activity points for all users in a guild."""
+    Pass the points and user_id of the last row of a page to get the next one.
+    A page deep in the board costs as much as the first one.
+    """
+    return _select_leaderboard(guild_id, point_type, after, limit)
+
+def get_guild_ids():
+    """Returns the ids of every guild with user data."""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE users SET monthly_activity_points = 0 WHERE guild_id = ?", (guild_id,))
-    conn.commit()
-    conn.close()
+    return [row[0] for row in conn.execute("SELECT DISTINCT guild_id FROM users ORDER BY guild_id")]
+
+def get_guild_points(guild_id, point_type='activity_points'):
+    """Gets (user_id, points) for every user of a guild."""
+    if point_type not in ['activity_points', 'gambling_points', 'monthly_activity_points']:
+        raise ValueError("Invalid point_type specified.")
+
+    conn = get_db_connection()
+    if point_type == 'monthly_activity_points':
+        cursor = conn.execute(f"SELECT user_id, {MONTHLY_POINTS_SQL} FROM users WHERE guild_id = ?", (current_month_epoch(), guild_id))
+    else:
+        cursor = conn.execute(f"SELECT user_id, {point_type} FROM users WHERE guild_id = ?", (guild_id,))
+    return [(user_id, points) for user_id, points in cursor]
 
 # --- Shop Functions ---
 
 def add_shop_item(guild_id, role_id, price):
     """Adds a new item to the shop."""
     conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            "INSERT INTO shop_items (guild_id, role_id, price) VALUES (?, ?, ?)",
-            (guild_id, role_id, price)
-        )
-        conn.commit()
+        with conn:
+            conn.execute(
+                "INSERT INTO shop_items (guild_id, role_id, price) VALUES (?, ?, ?)",
+                (guild_id, role_id, price)
+            )
         return True
     except sqlite3.IntegrityError:
         return False
     finally:
-        conn.close()
+        _shop_items_cache.invalidate(guild_id)
 
 def remove_shop_item(item_id):
     """Removes an item from the shop."""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM shop_items WHERE item_id = ?", (item_id,))
-    changes = conn.total_changes
-    conn.commit()
-    conn.close()
-    return changes > 0
+    with conn:
+        removed = conn.execute("DELETE FROM shop_items WHERE item_id = ? RETURNING guild_id", (item_id,)).fetchone()
+    _shop_item_cache.invalidate(item_id)
+    if removed is None:
+        return False
+    _shop_items_cache.invalidate(removed['guild_id'])
+    return True
 
 def get_shop_items(guild_id):
     """Gets all shop items for a guild."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT item_id, role_id, price FROM shop_items WHERE guild_id = ? ORDER BY price ASC", (guild_id,))
-    items = cursor.fetchall()
-    conn.close()
+    items = _shop_items_cache.get(guild_id)
+    if items is None:
+        version = _shop_items_cache.version
+        items = _select_shop_items(guild_id)
+        _shop_items_cache.set(guild_id, items, version)
     return items
 
+def _select_shop_items(guild_id):
+    conn = get_db_connection()
+    return conn.execute(
+        "SELECT item_id, role_id, price FROM shop_items WHERE guild_id = ? ORDER BY price ASC, item_id ASC", (guild_id,)
+    ).fetchall()
+
+def find_shop_items(guild_id):
+    """Gets a guild's shop items straight from SQLite, bypassing this process's cache.
+
+    For readers of guilds another shard process may own, whose changes never
+    invalidate the cache here.
+    """
+    return _select_shop_items(guild_id)
+
+def peek_shop_items(guild_id):
+    """Returns a guild's cached shop items without touching SQLite, or None if they aren't cached."""
+    return _shop_items_cache.peek(guild_id)
+
 def get_shop_item(item_id):
     """Gets a specific shop item by its ID."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM shop_items WHERE item_id = ?", (item_id,))
-    item = cursor.fetchone()
-    conn.close()
+    item = _shop_item_cache.get(item_id)
+    if item is None:
+        version = _shop_item_cache.version
+        conn = get_db_connection()
+        item = conn.execute("SELECT * FROM shop_items WHERE item_id = ?", (item_id,)).fetchone()
+        if item is not None:
+            _shop_item_cache.set(item_id, item, version)
     return item
 
+def peek_shop_item(item_id):
+    """Returns a cached shop item without touching SQLite, or None if it isn't cached."""
+    return _shop_item_cache.peek(item_id)
+
 # --- Guild Settings Functions ---
 
 def get_guild_settings(guild_id):
     """Gets settings for a guild, creating a record if it doesn't exist."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("INSERT OR IGNORE INTO guild_settings (guild_id) VALUES (?)", (guild_id,))
-    cursor.execute("SELECT * FROM guild_settings WHERE guild_id = ?", (guild_id,))
-    settings = cursor.fetchone()
-    conn.close()
+    settings = _guild_settings_cache.get(guild_id)
+    if settings is None:
+        version = _guild_settings_cache.version
+        conn = get_db_connection()
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO guild_settings (guild_id) VALUES (?)", (guild_id,))
+        settings = conn.execute("SELECT * FROM guild_settings WHERE guild_id = ?", (guild_id,)).fetchone()
+        _guild_settings_cache.set(guild_id, settings, version)
     return settings
 
+def peek_guild_settings(guild_id):
+    """Returns a guild's cached settings without touching SQLite, or None if they aren't cached."""
+    return _guild_settings_cache.peek(guild_id)
+
 def set_bet_win_chance(guild_id, chance):
     """Sets the win chance for the betting game."""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE guild_settings SET bet_win_chance = ? WHERE guild_id = ?", (chance, guild_id))
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute("UPDATE guild_settings SET bet_win_chance = ? WHERE guild_id = ?", (chance, guild_id))
+    _guild_settings_cache.invalidate(guild_id)
+
+def set_message_rate_limit(guild_id, burst, per_minute):
+    """Sets how many messages in a row earn points and how many more are allowed per minute."""
+    conn = get_db_connection()
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO guild_settings (guild_id) VALUES (?)", (guild_id,))
+        conn.execute(
+            "UPDATE guild_settings SET message_points_burst = ?, message_points_per_minute = ? WHERE guild_id = ?",
+            (burst, per_minute, guild_id)
+        )
+    _guild_settings_cache.invalidate(guild_id)
+
+def get_message_rate_limits():
+    """Returns (guild_id, burst, per_minute) for every guild with settings."""
+    conn = get_db_connection()
+    return conn.execute(
+        "SELECT guild_id, message_points_burst, message_points_per_minute FROM guild_settings"
+    ).fetchall()
+
+# --- Instrumentation ---
+# Timed wrappers replace these functions when METRICS_ENABLED=1. Internal calls
+# go through the module globals too, so nested calls are measured as well.
+
+metrics.instrument_functions(globals(), [
+    'init_db', 'log_member_count', 'get_member_count_history', 'get_latest_member_count',
+    'add_activity_buckets', 'prune_activity', 'get_activity_heatmap', 'get_top_channels',
+    'add_points', 'add_points_bulk', 'get_user_data', 'find_user_data', 'update_gambling_points',
+    'debit_gambling_points', 'settle_bet', 'reserve_purchase', 'rollback_purchase',
+    'reconstruct_balances', 'create_ledger_snapshot', 'rebase_ledger', 'get_leaderboard', 'get_leaderboard_page', 'get_guild_ids', 'get_guild_points',
+    'add_shop_item', 'remove_shop_item', 'get_shop_items', 'find_shop_items', 'get_shop_item', 'get_guild_settings', 'set_bet_win_chance',
+    'set_message_rate_limit', 'get_message_rate_limits',
+    'give_gambling_points_bulk', 'take_gambling_points_bulk', 'tax_gambling_points',
+], 'database', rows_written=lambda: get_db_connection().total_changes)
@@ -0,0 +1,254 @@
+"""In-memory leaderboards kept up to date from database change notifications."""
+import os
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+import database
+
+POINT_TYPES = ('activity_points', 'monthly_activity_points', 'gambling_points')
+MONTHLY = 'monthly_activity_points'
+
+# How many users each cached board holds; must be at least the size of the largest page served from it
+LEADERBOARD_CACHE_SIZE = int(os.getenv('LEADERBOARD_CACHE_SIZE', 50))
+# Rank indexes hold every user of a guild, so only the most recently used guilds are kept
+RANK_INDEX_MAX_GUILDS = int(os.getenv('RANK_INDEX_MAX_GUILDS', 100))
+
+class TopN:
+    """The best `capacity` users of one guild for one point type.
+
+    Users are ordered by (points, user_id) like database.get_leaderboard. `floor`
+    is an upper bound for every user that is not held, which is what lets point
+    changes be applied without going back to the database. A floor of None
+    means that nobody is outside the board.
+    """
+    __slots__ = ('capacity', 'scores', 'floor')
+
+    def __init__(self, capacity, rows):
+        self.capacity = capacity
+        self.scores = {user_id: points for user_id, points in rows}
+        self.floor = None
+        if len(self.scores) >= capacity:
+            self.floor = min((points, user_id) for user_id, points in self.scores.items())
+
+    def update(self, user_id, points):
+        key = (points, user_id)
+        if user_id in self.scores:
+            if self.floor is not None and key < self.floor:
+                # Someone outside the board may now be ahead of this user
+                del self.scores[user_id]
+            else:
+                self.scores[user_id] = points
+        elif self.floor is None or key > self.floor:
+            self.scores[user_id] = points
+            if len(self.scores) > self.capacity:
+                evicted = min((points, user_id) for user_id, points in self.scores.items())
+                del self.scores[evicted[1]]
+                self.floor = evicted
+
+    def discard(self, user_id):
+        """Drops a user who should no longer be listed at all."""
+        self.scores.pop(user_id, None)
+
+    def top(self, limit):
+        """Returns the best `limit` (user_id, points) pairs, or None if the board can't tell."""
+        if len(self.scores) < limit and self.floor is not None:
+            return None
+        ranked = sorted(self.scores.items(), key=lambda item: (item[1], item[0]), reverse=True)
+        return ranked[:limit]
+
+def _current_epoch(point_type):
+    """Month a board for `point_type` belongs to; None for point types that never reset."""
+    return database.current_month_epoch() if point_type == MONTHLY else None
+
+class LeaderboardCache:
+    """Per-guild TopN boards for every point type, seeded lazily from the database.
+
+    Monthly boards remember the month they were seeded in and are reseeded once it ends.
+    """
+
+    def __init__(self, capacity=LEADERBOARD_CACHE_SIZE):
+        self.capacity = capacity
+        self._boards = {}
+        self._lock = threading.Lock()
+
+    def top(self, guild_id, point_type, limit=10):
+        """Returns the cached top users, or None if the board has to be seeded first."""
+        with self._lock:
+            entry = self._boards.get((guild_id, point_type))
+            if entry is None or entry[0] != _current_epoch(point_type):
+                return None
+            return entry[1].top(limit)
+
+    def seed(self, guild_id, point_type, limit=10):
+        """Loads a board from the database and returns its top users.
+
+        Must run on the database writer thread so that no change notification can
+        slip in between the query and installing the board.
+        """
+        epoch = _current_epoch(point_type)
+        rows = database.get_leaderboard(guild_id, point_type=point_type, limit=self.capacity)
+        board = TopN(self.capacity, [(row['user_id'], row[point_type]) for row in rows])
+        with self._lock:
+            self._boards[(guild_id, point_type)] = (epoch, board)
+            return board.top(limit)
+
+    def on_points_changed(self, guild_id, rows):
+        """Listener for database.add_points_listener."""
+        with self._lock:
+            if rows is None:
+                for point_type in POINT_TYPES:
+                    self._boards.pop((guild_id, point_type), None)
+                return
+            for point_type in POINT_TYPES:
+                entry = self._boards.get((guild_id, point_type))
+                if entry is None:
+                    continue
+                board = entry[1]
+                for row in rows:
+                    if point_type == MONTHLY and row[point_type] <= 0:
+                        # Monthly leaderboards only list users with points this month
+                        board.discard(row['user_id'])
+                    else:
+                        board.update(row['user_id'], row[point_type])
+
+class RankIndex:
+    """Order-statistic index over the points of one guild for one point type.
+
+    Values live in sorted blocks with a Fenwick tree over the block sizes, so
+    updating a user and looking up a rank both cost O(log n) plus a bounded
+    shift inside one block.
+    """
+    BLOCK_SIZE = 512
+
+    def __init__(self, rows):
+        self.points = {user_id: points for user_id, points in rows}
+        values = sorted(self.points.values())
+        self._blocks = [values[i:i + self.BLOCK_SIZE] for i in range(0, len(values), self.BLOCK_SIZE)]
+        self._maxes = [block[-1] for block in self._blocks]
+        self._rebuild_tree()
+
+    def __len__(self):
+        return len(self.points)
+
+    def _rebuild_tree(self):
+        tree = [0] * (len(self._blocks) + 1)
+        for i, block in enumerate(self._blocks, start=1):
+            tree[i] += len(block)
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, index, delta):
+        index += 1
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index += index & -index
+
+    def _count_before(self, index):
+        """Number of values stored in the blocks before `index`."""
+        total = 0
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def _insert(self, value):
+        if not self._blocks:
+            self._blocks.append([value])
+            self._maxes.append(value)
+            self._rebuild_tree()
+            return
+        i = bisect_left(self._maxes, value)
+        if i == len(self._blocks):
+            i -= 1
+            self._blocks[i].append(value)
+            self._maxes[i] = value
+        else:
+            insort(self._blocks[i], value)
+        self._tree_add(i, 1)
+        block = self._blocks[i]
+        if len(block) > 2 * self.BLOCK_SIZE:
+            self._blocks[i:i + 1] = [block[:self.BLOCK_SIZE], block[self.BLOCK_SIZE:]]
+            self._maxes[i:i + 1] = [block[self.BLOCK_SIZE - 1], block[-1]]
+            self._rebuild_tree()
+
+    def _remove(self, value):
+        i = bisect_left(self._maxes, value)
+        block = self._blocks[i]
+        del block[bisect_left(block, value)]
+        if block:
+            self._maxes[i] = block[-1]
+            self._tree_add(i, -1)
+        else:
+            del self._blocks[i]
+            del self._maxes[i]
+            self._rebuild_tree()
+
+    def count_above(self, value):
+        """Number of users with strictly more points than `value`."""
+        i = bisect_right(self._maxes, value)
+        if i == len(self._blocks):
+            return 0
+        block = self._blocks[i]
+        after_block = len(self.points) - self._count_before(i + 1)
+        return after_block + len(block) - bisect_right(block, value)
+
+    def update(self, user_id, points):
+        old = self.points.get(user_id)
+        if old == points:
+            return
+        if old is not None:
+            self._remove(old)
+        self._insert(points)
+        self.points[user_id] = points
+
+    def rank(self, user_id):
+        """Returns (rank, total) for a user, or None if they have no points record. Ties share a rank."""
+        points = self.points.get(user_id)
+        if points is None:
+            return None
+        return self.count_above(points) + 1, len(self.points)
+
+class RankCache:
+    """RankIndex per guild and point type for the most recently used guilds."""
+
+    def __init__(self, max_guilds=RANK_INDEX_MAX_GUILDS):
+        self.max_guilds = max_guilds
+        self._guilds = OrderedDict()
+        self._lock = threading.Lock()
+
+    def rank(self, guild_id, point_type, user_id):
+        """Returns (points, rank, total), None for a user without a record, or False if the index needs seeding."""
+        with self._lock:
+            entry = self._guilds.get(guild_id, {}).get(point_type)
+            if entry is None or entry[0] != _current_epoch(point_type):
+                return False
+            self._guilds.move_to_end(guild_id)
+            index = entry[1]
+            result = index.rank(user_id)
+            return (index.points[user_id],) + result if result else None
+
+    def seed(self, guild_id, point_type, user_id):
+        """Loads a guild's index from the database, then answers like rank().
+
+        Must run on the database writer thread, like LeaderboardCache.seed.
+        """
+        epoch = _current_epoch(point_type)
+        index = RankIndex(database.get_guild_points(guild_id, point_type))
+        with self._lock:
+            self._guilds.setdefault(guild_id, {})[point_type] = (epoch, index)
+            self._guilds.move_to_end(guild_id)
+            while len(self._guilds) > self.max_guilds:
+                self._guilds.popitem(last=False)
+        return self.rank(guild_id, point_type, user_id)
+
+    def on_points_changed(self, guild_id, rows):
+        """Listener for database.add_points_listener."""
+        with self._lock:
+            if rows is None:
+                self._guilds.pop(guild_id, None)
+                return
+            for point_type, (_, index) in self._guilds.get(guild_id, {}).items():
+                for row in rows:
+                    index.update(row['user_id'], row[point_type])
@@ -0,0 +1,256 @@
+"""Counters and histograms in the Prometheus text format.
+
+Metrics are off unless METRICS_ENABLED=1. While off, the factories return a
+shared no-op metric and the decorators hand back the undecorated function,
+so instrumented code runs exactly as it would without them.
+"""
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+ENABLED = os.getenv('METRICS_ENABLED', '0') == '1'
+METRICS_DUMP_PATH = os.getenv('METRICS_DUMP_PATH', os.path.join('data', 'metrics.prom'))
+
+# Seconds; from sub-millisecond SQLite calls up to slow command handlers
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = {}
+_collectors = []
+_registry_lock = threading.Lock()
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {self.value}"]
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self, name, labelnames, values):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            bucket_label = f'le="{le}"'
+            lines.append(f"{name}_bucket{_format_labels(labelnames, values, bucket_label)} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, values)} {self.sum}")
+        lines.append(f"{name}_count{_format_labels(labelnames, values)} {self.count}")
+        return lines
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+class _NullMetric:
+    """Stands in for every metric while metrics are disabled."""
+
+    def labels(self, *values):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def observe(self, value):
+        pass
+
+_NULL = _NullMetric()
+
+def _register(cls, name, *args, **kwargs):
+    if not ENABLED:
+        return _NULL
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, *args, **kwargs)
+        return metric
+
+def counter(name, documentation, labelnames=()):
+    return _register(Counter, name, documentation, labelnames)
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+def register_collector(collector):
+    """Adds a callable that returns [(name, type, help, [(labels dict, value)])] at render time, e.g. for gauges."""
+    if ENABLED:
+        _collectors.append(collector)
+
+def render():
+    """Returns every metric in the Prometheus text exposition format."""
+    lines = []
+    with _registry_lock:
+        metrics = list(_registry.values())
+    for metric in metrics:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            families = collector()
+        except Exception as e:
+            logging.error(f"Metrics collector {collector.__name__} failed: {e}")
+            continue
+        for name, kind, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {value}")
+    return "\n".join(lines) + "\n"
+
+def dump(path=None):
+    """Writes the current metrics to a file, e.g. on SIGUSR1. Returns the path written."""
+    path = path or METRICS_DUMP_PATH
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as file:
+        file.write(render())
+    return path
+
+# --- Instrumentation ---
+
+def instrument_functions(namespace, names, subsystem, rows_written=None):
+    """Replaces functions in a module namespace with timed versions.
+
+    Records calls, errors and latency per function, plus rows returned (for
+    list and dict results) and, if `rows_written` is given, the change in its
+    value across the call (e.g. a connection's total_changes).
+    """
+    if not ENABLED:
+        return
+    calls = counter(f"{subsystem}_calls_total", f"Calls to {subsystem} functions.", ['function'])
+    errors = counter(f"{subsystem}_errors_total", f"{subsystem} calls that raised.", ['function'])
+    latency = histogram(f"{subsystem}_call_seconds", f"Latency of {subsystem} functions.", ['function'])
+    returned = counter(f"{subsystem}_rows_returned_total", f"Rows returned by {subsystem} functions.", ['function'])
+    written = counter(f"{subsystem}_rows_written_total", f"Rows inserted, updated or deleted by {subsystem} functions.", ['function'])
+
+    def wrap(name, func):
+        function_calls, function_errors = calls.labels(name), errors.labels(name)
+        function_latency, function_returned, function_written = latency.labels(name), returned.labels(name), written.labels(name)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            changes_before = rows_written() if rows_written else 0
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                function_errors.inc()
+                raise
+            finally:
+                function_latency.observe(time.perf_counter() - started)
+                function_calls.inc()
+            if rows_written:
+                function_written.inc(rows_written() - changes_before)
+            if isinstance(result, (list, dict)):
+                function_returned.inc(len(result))
+            return result
+        return wrapper
+
+    for name in names:
+        namespace[name] = wrap(name, namespace[name])
+
+def timed_task(task_name):
+    """Decorates a background task coroutine to record how long each run takes."""
+    def decorator(func):
+        if not ENABLED:
+            return func
+        durations = histogram('task_run_seconds', "Duration of background task runs.", ['task'], buckets=DEFAULT_BUCKETS + (30.0, 60.0, 300.0))
+        failures = counter('task_failures_total', "Background task runs that raised.", ['task'])
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                failures.labels(task_name).inc()
+                raise
+            finally:
+                durations.labels(task_name).observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+async def monitor_loop_lag(interval=0.5):
+    """Records how late the event loop wakes up from a sleep, until cancelled."""
+    lag = histogram('event_loop_lag_seconds', "How late the event loop resumed a sleeping task.")
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag.observe(max(0.0, time.perf_counter() - started - interval))
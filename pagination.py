@@ -0,0 +1,75 @@
+"""Embeds split into pages with buttons, for lists too long to show at once."""
+import logging
+import os
+import discord
+
+PAGE_SIZE = 10
+# How long the buttons keep working after the last click
+PAGE_VIEW_TIMEOUT_SECONDS = float(os.getenv('PAGE_VIEW_TIMEOUT_SECONDS', 180))
+
+class PageView(discord.ui.View):
+    """First/previous/next buttons over pages addressed by keyset cursors.
+
+    `fetch(cursor, page_number)` returns (embed, next_cursor), where the first
+    page has the cursor None and next_cursor is None on the last page. The view
+    remembers the cursor every visited page started from, so going back shows
+    the same page again instead of counting rows to find it.
+    """
+
+    def __init__(self, owner_id, fetch, timeout=PAGE_VIEW_TIMEOUT_SECONDS):
+        super().__init__(timeout=timeout)
+        self.owner_id = owner_id
+        self.fetch = fetch
+        self.cursors = [None]
+        self.next_cursor = None
+        self.interaction = None
+
+    async def start(self, interaction):
+        """Answers the command with the first page, with buttons only if there is more than one page."""
+        embed, self.next_cursor = await self.fetch(None, 1)
+        if self.next_cursor is None:
+            self.stop()
+            return await interaction.response.send_message(embed=embed)
+        self.update_buttons()
+        self.interaction = interaction
+        await interaction.response.send_message(embed=embed, view=self)
+
+    def update_buttons(self):
+        self.first_page.disabled = self.previous_page.disabled = len(self.cursors) == 1
+        self.next_page.disabled = self.next_cursor is None
+
+    async def show(self, interaction):
+        embed, self.next_cursor = await self.fetch(self.cursors[-1], len(self.cursors))
+        self.update_buttons()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    async def interaction_check(self, interaction):
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("Tylko osoba, która użyła komendy, może zmieniać strony.", ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(emoji='⏮️', style=discord.ButtonStyle.secondary)
+    async def first_page(self, interaction, button):
+        del self.cursors[1:]
+        await self.show(interaction)
+
+    @discord.ui.button(emoji='◀️', style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction, button):
+        if len(self.cursors) > 1:
+            self.cursors.pop()
+        await self.show(interaction)
+
+    @discord.ui.button(emoji='▶️', style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction, button):
+        if self.next_cursor is not None:
+            self.cursors.append(self.next_cursor)
+        await self.show(interaction)
+
+    async def on_timeout(self):
+        for item in self.children:
+            item.disabled = True
+        try:
+            await self.interaction.edit_original_response(view=self)
+        except discord.HTTPException as e:
+            logging.warning(f"Could not disable page buttons: {e}")
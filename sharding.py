@@ -0,0 +1,61 @@
+"""Shard layout of this process.
+
+SHARD_COUNT sets the total number of gateway shards; unset, Discord's
+recommended count is used. SHARD_IDS limits this process to some of them,
+e.g. "0-3" or "4,5,6,7", so that several processes can split the shards and
+share one database. The shard ranges of different processes must not overlap.
+
+Discord delivers a guild's events only to the shard that owns it, so every
+guild has exactly one worker. Work that isn't tied to a guild (command sync,
+the web dashboard, pruning) runs only in the primary worker, the one with
+shard 0.
+
+The read-through caches in database.py (guild settings, shop items) are per
+process and only invalidated by writes made in the same process. That is
+safe for commands, which only touch guilds the process owns, but anything
+that reads other shards' guilds, like the dashboard, must read SQLite
+directly (e.g. database.find_shop_items).
+"""
+import os
+
+def parse_shard_ids(value):
+    """Parses "0-3,8,10-11" into a sorted list of shard ids. Returns None for an empty value."""
+    if not value or not value.strip():
+        return None
+    shard_ids = set()
+    for part in value.split(','):
+        start, _, end = part.strip().partition('-')
+        shard_ids.update(range(int(start), int(end or start) + 1))
+    return sorted(shard_ids)
+
+SHARD_COUNT = int(os.environ['SHARD_COUNT']) if os.getenv('SHARD_COUNT') else None
+SHARD_IDS = parse_shard_ids(os.getenv('SHARD_IDS'))
+
+def shard_for_guild(guild_id, shard_count):
+    """The shard Discord routes a guild's events to."""
+    return (guild_id >> 22) % shard_count
+
+def _shard_ids(bot):
+    # Only AutoShardedBot has shard_ids; a plain Bot runs a single shard and owns everything
+    return getattr(bot, 'shard_ids', None)
+
+def owns_guild(bot, guild_id):
+    """Whether this process is the one responsible for a guild."""
+    shard_ids = _shard_ids(bot)
+    if bot.shard_count is None or shard_ids is None:
+        return True
+    return shard_for_guild(guild_id, bot.shard_count) in shard_ids
+
+def owned_guilds(bot):
+    return [guild for guild in bot.guilds if owns_guild(bot, guild.id)]
+
+def is_primary(bot):
+    """Whether this process runs the work that isn't tied to a guild."""
+    shard_ids = _shard_ids(bot)
+    return shard_ids is None or 0 in shard_ids
+
+def describe(bot):
+    shard_ids = _shard_ids(bot)
+    if shard_ids is None:
+        return f"shards: all of {bot.shard_count or 'auto'}"
+    return f"shards: {','.join(map(str, shard_ids))} of {bot.shard_count}"
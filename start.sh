@@ -12,4 +12,5 @@ if [ -z "$DISCORD_TOKEN" ]; then
 fi
 
 echo "Token found. Starting the application..."
-python3 bot.py
\ No newline at end of file
+# exec so the bot is PID 1 and receives the SIGTERM from docker stop
+exec python3 bot.py
\ No newline at end of file
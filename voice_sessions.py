@@ -0,0 +1,164 @@
+"""Event-driven voice activity accounting.
+
+A member earns voice time while they are in a channel, neither self-muted nor
+self-deafened, and at least one other member of that channel is active too.
+Time is credited whenever a channel's membership or a member's state changes,
+so the work done scales with voice state updates rather than with guild size.
+Per-channel time is split at hour boundaries of the wall clock, into the same
+hour buckets as database.current_activity_hour().
+"""
+import time
+
+def _split_hours(start, end):
+    """Yields (hour, seconds) for the part of the wall-clock span [start, end) in each hour."""
+    hour = int(start // 3600)
+    while start < end:
+        boundary = (hour + 1) * 3600
+        yield hour, min(end, boundary) - start
+        start, hour = boundary, hour + 1
+
+class _Channel:
+    __slots__ = ('members', 'since')
+
+    def __init__(self, since):
+        self.members = {}  # user_id -> (active, bot)
+        self.since = since
+
+class VoiceSessionTracker:
+    """Credits voice time per member and channel.
+
+    Seconds towards the next award carry over between collections, but only
+    for `carry_ttl` seconds after a member last earned any; after that the
+    partial interval is forfeited, so members who left voice are forgotten.
+    """
+
+    def __init__(self, award_interval, clock=time.monotonic, wall_clock=time.time, carry_ttl=86400):
+        self.award_interval = award_interval
+        self.carry_ttl = carry_ttl
+        self._clock = clock
+        self._wall_clock = wall_clock
+        self._channels = {}  # (guild_id, channel_id) -> _Channel
+        self._seconds = {}   # (guild_id, user_id) -> eligible seconds not collected yet
+        self._carry = {}     # (guild_id, user_id) -> (collected seconds towards the next award, when last earned)
+        self._channel_seconds = {}  # (guild_id, channel_id, hour) -> eligible member-seconds not collected yet
+
+    def _settle(self, guild_id, channel_id, now, wall):
+        """Credits the time since the channel last changed to its eligible members.
+
+        `wall` is the wall-clock time matching `now`, used to find the hours the time fell in.
+        """
+        channel = self._channels.get((guild_id, channel_id))
+        if channel is None:
+            return
+        elapsed = now - channel.since
+        channel.since = now
+        if elapsed <= 0:
+            return
+        active = [(user_id, bot) for user_id, (is_active, bot) in channel.members.items() if is_active]
+        if len(active) < 2:
+            return
+        credited = 0
+        for user_id, bot in active:
+            if not bot:
+                key = (guild_id, user_id)
+                self._seconds[key] = self._seconds.get(key, 0) + elapsed
+                credited += 1
+        if credited:
+            for hour, seconds in _split_hours(wall - elapsed, wall):
+                key = (guild_id, channel_id, hour)
+                self._channel_seconds[key] = self._channel_seconds.get(key, 0) + seconds * credited
+
+    def _join(self, guild_id, channel_id, user_id, active, bot, now):
+        channel = self._channels.get((guild_id, channel_id))
+        if channel is None:
+            channel = self._channels[(guild_id, channel_id)] = _Channel(now)
+        channel.members[user_id] = (active, bot)
+
+    def _leave(self, guild_id, channel_id, user_id):
+        channel = self._channels.get((guild_id, channel_id))
+        if channel is None:
+            return
+        channel.members.pop(user_id, None)
+        if not channel.members:
+            del self._channels[(guild_id, channel_id)]
+
+    def update(self, guild_id, user_id, before_channel_id, after_channel_id, active, bot=False):
+        """Applies one voice state transition. Channel ids are None while disconnected."""
+        now, wall = self._clock(), self._wall_clock()
+        self._settle(guild_id, before_channel_id, now, wall)
+        if after_channel_id != before_channel_id:
+            self._settle(guild_id, after_channel_id, now, wall)
+        if before_channel_id is not None:
+            self._leave(guild_id, before_channel_id, user_id)
+        if after_channel_id is not None:
+            self._join(guild_id, after_channel_id, user_id, active, bot, now)
+
+    def sync_guild(self, guild_id, states):
+        """Replaces what is known about a guild, e.g. at startup or after a reconnect.
+
+        `states` is an iterable of (channel_id, user_id, active, bot). Channels
+        still open from before are dropped without being settled: while the bot
+        was disconnected it can't tell who stayed, so that gap earns nothing.
+        Call close_guild() when the connection drops to credit the time up to then.
+        """
+        now = self._clock()
+        for key in [key for key in self._channels if key[0] == guild_id]:
+            del self._channels[key]
+        for channel_id, user_id, active, bot in states:
+            self._join(guild_id, channel_id, user_id, active, bot, now)
+
+    def close_guild(self, guild_id):
+        """Credits a guild's open sessions up to now and stops tracking them, e.g. when its shard disconnects."""
+        now, wall = self._clock(), self._wall_clock()
+        for key in [key for key in self._channels if key[0] == guild_id]:
+            self._settle(guild_id, key[1], now, wall)
+            del self._channels[key]
+
+    def drop_guild(self, guild_id):
+        """Forgets a guild the bot has left, discarding time that was not collected."""
+        for mapping in (self._channels, self._seconds, self._carry, self._channel_seconds):
+            for key in [key for key in mapping if key[0] == guild_id]:
+                del mapping[key]
+
+    def collect(self):
+        """Settles every open session and drains the credited time.
+
+        Returns a list of (guild_id, user_id, seconds, awards), where `awards` is the
+        number of whole award intervals completed. Partial intervals carry over.
+        """
+        now, wall = self._clock(), self._wall_clock()
+        for guild_id, channel_id in list(self._channels):
+            self._settle(guild_id, channel_id, now, wall)
+
+        results = []
+        for key, seconds in self._seconds.items():
+            whole = int(seconds)
+            if whole <= 0:
+                continue
+            awards, remainder = divmod(self._carry.get(key, (0, now))[0] + whole, self.award_interval)
+            if remainder:
+                self._carry[key] = (remainder, now)
+            else:
+                self._carry.pop(key, None)
+            results.append((key[0], key[1], whole, awards))
+        expired = [key for key, (_, earned_at) in self._carry.items() if now - earned_at > self.carry_ttl]
+        for key in expired:
+            del self._carry[key]
+        # Keep only the fractional seconds that did not make it into this batch
+        self._seconds = {key: seconds - int(seconds) for key, seconds in self._seconds.items() if seconds - int(seconds) > 0}
+        return results
+
+    def collect_channels(self):
+        """Drains the member-seconds credited per channel and hour since the last call.
+
+        Returns a list of (guild_id, channel_id, hour, seconds). Call it right after
+        collect(), which settles the open sessions.
+        """
+        results = [key + (int(seconds),) for key, seconds in self._channel_seconds.items() if int(seconds) > 0]
+        # Fractions carry over within the current hour; an hour that is over can't collect more
+        current_hour = int(self._wall_clock() // 3600)
+        self._channel_seconds = {
+            key: seconds - int(seconds) for key, seconds in self._channel_seconds.items()
+            if key[2] >= current_hour and seconds - int(seconds) > 0
+        }
+        return results
@@ -0,0 +1,260 @@
+"""Read-only HTTP dashboard and JSON API, served from the bot's event loop.
+
+Every query runs on one dedicated thread holding a read-only SQLite
+connection, so dashboard traffic can't take the write lock or queue behind
+the bot's database worker. Rendered responses are cached per URL until
+PRAGMA data_version says another connection has committed, and carry an
+ETag and Last-Modified so repeat polls are answered with 304.
+"""
+import asyncio
+import hashlib
+import html
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+from aiohttp import web
+import database
+import metrics
+from cache import LRUCache
+from leaderboards import POINT_TYPES
+
+WEB_HOST = os.getenv('WEB_HOST', '0.0.0.0')
+WEB_PORT = int(os.getenv('WEB_PORT', 8080))
+WEB_ACCESS_LOG = os.getenv('WEB_ACCESS_LOG', 'webapp.log')
+WEB_RESPONSE_CACHE_SIZE = int(os.getenv('WEB_RESPONSE_CACHE_SIZE', 256))
+MAX_LEADERBOARD_LIMIT = 100
+# /metrics answers loopback clients only, unless this is set
+METRICS_ALLOW_REMOTE = os.getenv('METRICS_ALLOW_REMOTE', '0') == '1'
+
+POINT_TYPE_LABELS = {
+    'activity_points': 'Aktywność (cały czas)',
+    'monthly_activity_points': 'Aktywność w tym miesiącu',
+    'gambling_points': 'Portfel',
+}
+
+_HTML_HEAD = """<!DOCTYPE html>
+<html lang="pl"><head><meta charset="utf-8"><title>{title}</title>
+<style>body{{font-family:sans-serif;margin:2em;max-width:60em}}table{{border-collapse:collapse;margin-bottom:1.5em}}
+td,th{{border:1px solid #ccc;padding:.25em .75em;text-align:left}}</style></head><body><h1>{title}</h1>
+"""
+
+class WebServer:
+    def __init__(self, bot=None, host=WEB_HOST, port=WEB_PORT):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self._responses = LRUCache('web_responses', WEB_RESPONSE_CACHE_SIZE)
+        self._executor = None
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.add_routes([
+            web.get('/', self.index),
+            web.get('/guilds/{guild_id}', self.guild_page),
+            web.get('/api/guilds', self.api_guilds),
+            web.get('/api/guilds/{guild_id}/leaderboard', self.api_leaderboard),
+            web.get('/api/guilds/{guild_id}/users/{user_id}', self.api_user),
+            web.get('/api/guilds/{guild_id}/shop', self.api_shop),
+            web.get('/api/guilds/{guild_id}/member-counts', self.api_member_counts),
+            web.get('/healthz', self.healthz),
+        ])
+        if metrics.ENABLED:
+            self.app.add_routes([web.get('/metrics', self.metrics_endpoint)])
+
+    async def start(self):
+        # One thread, so that data_version is always read from the same connection
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='webapp', initializer=database.use_readonly_connection
+        )
+        access_logger = logging.getLogger('webapp.access')
+        if WEB_ACCESS_LOG and not access_logger.handlers:
+            access_logger.addHandler(logging.FileHandler(WEB_ACCESS_LOG))
+            access_logger.propagate = False
+        self._runner = web.AppRunner(self.app, access_log=access_logger)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logging.info(f"Web dashboard listening on http://{self.host}:{self.port}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    # --- Response Cache ---
+    def _render(self, key, build):
+        """Returns (etag, last_modified, body, content_type), rebuilding the body only after a commit."""
+        conn = database.get_db_connection()
+        # data_version is per connection, so a reopened connection must not match old entries;
+        # monthly leaderboards also go stale when a month ends without any commit
+        version = (id(conn), database.get_data_version(), database.current_month_epoch())
+        cached = self._responses.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1:]
+        body, content_type = build()
+        etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+        # A commit that didn't change this response keeps its validators, so clients still get 304
+        last_modified = cached[2] if cached is not None and cached[1] == etag else time.time()
+        entry = (version, etag, last_modified, body, content_type)
+        self._responses.set(key, entry)
+        return entry[1:]
+
+    async def _respond(self, request, build):
+        loop = asyncio.get_running_loop()
+        etag, last_modified, body, content_type = await loop.run_in_executor(
+            self._executor, self._render, request.path_qs, build
+        )
+        headers = {
+            'ETag': etag,
+            'Last-Modified': formatdate(last_modified, usegmt=True),
+            'Cache-Control': 'no-cache',
+        }
+        if _not_modified(request, etag, last_modified):
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type=content_type, charset='utf-8', headers=headers)
+
+    # --- Names ---
+    def _guild_name(self, guild_id):
+        guild = self.bot.get_guild(guild_id) if self.bot else None
+        return guild.name if guild else None
+
+    def _member_name(self, guild_id, user_id):
+        guild = self.bot.get_guild(guild_id) if self.bot else None
+        member = guild.get_member(user_id) if guild else None
+        return member.display_name if member else None
+
+    def _role_name(self, guild_id, role_id):
+        guild = self.bot.get_guild(guild_id) if self.bot else None
+        role = guild.get_role(role_id) if guild else None
+        return role.name if role else None
+
+    # --- Data ---
+    def _guilds(self):
+        return [{'id': guild_id, 'name': self._guild_name(guild_id)} for guild_id in database.get_guild_ids()]
+
+    def _leaderboard(self, guild_id, point_type, limit):
+        return [
+            {'user_id': row['user_id'], 'name': self._member_name(guild_id, row['user_id']), 'points': row[point_type]}
+            for row in database.get_leaderboard(guild_id, point_type=point_type, limit=limit)
+        ]
+
+    def _shop(self, guild_id):
+        # Uncached: with several shard processes, the shop may be edited by one that isn't this one
+        return [
+            {'item_id': item['item_id'], 'role_id': item['role_id'], 'name': self._role_name(guild_id, item['role_id']), 'price': item['price']}
+            for item in database.find_shop_items(guild_id)
+        ]
+
+    def _member_counts(self, guild_id, since=None):
+        return [{'date': row['date'], 'member_count': row['member_count']} for row in database.get_member_count_history(guild_id, since)]
+
+    # --- JSON API ---
+    async def api_guilds(self, request):
+        return await self._respond(request, lambda: _json(self._guilds()))
+
+    async def api_leaderboard(self, request):
+        guild_id = _int_param(request.match_info['guild_id'])
+        point_type = request.query.get('type', 'activity_points')
+        if point_type not in POINT_TYPES:
+            raise web.HTTPBadRequest(text=f"type must be one of: {', '.join(POINT_TYPES)}")
+        try:
+            limit = max(1, min(int(request.query.get('limit', '10')), MAX_LEADERBOARD_LIMIT))
+        except ValueError:
+            raise web.HTTPBadRequest(text="limit must be an integer")
+        return await self._respond(request, lambda: _json(self._leaderboard(guild_id, point_type, limit)))
+
+    async def api_user(self, request):
+        guild_id = _int_param(request.match_info['guild_id'])
+        user_id = _int_param(request.match_info['user_id'])
+
+        def build():
+            row = database.find_user_data(guild_id, user_id)
+            if row is None:
+                raise web.HTTPNotFound()
+            return _json({
+                'user_id': user_id,
+                'name': self._member_name(guild_id, user_id),
+                'activity_points': row['activity_points'],
+                'monthly_activity_points': row['monthly_activity_points'],
+                'gambling_points': row['gambling_points'],
+                'message_count': row['message_count'],
+                'voice_seconds': row['voice_seconds'],
+            })
+        return await self._respond(request, build)
+
+    async def api_shop(self, request):
+        guild_id = _int_param(request.match_info['guild_id'])
+        return await self._respond(request, lambda: _json(self._shop(guild_id)))
+
+    async def api_member_counts(self, request):
+        guild_id = _int_param(request.match_info['guild_id'])
+        since = request.query.get('since')
+        return await self._respond(request, lambda: _json(self._member_counts(guild_id, since)))
+
+    async def healthz(self, request):
+        return web.Response(text='ok')
+
+    async def metrics_endpoint(self, request):
+        if not METRICS_ALLOW_REMOTE and request.remote not in ('127.0.0.1', '::1'):
+            raise web.HTTPForbidden()
+        return web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8', headers={'Cache-Control': 'no-store'})
+
+    # --- HTML ---
+    async def index(self, request):
+        def build():
+            parts = [_HTML_HEAD.format(title="Statystyki serwerów"), "<ul>"]
+            for guild in self._guilds():
+                name = html.escape(guild['name'] or f"Serwer {guild['id']}")
+                parts.append(f'<li><a href="/guilds/{guild["id"]}">{name}</a></li>')
+            parts.append("</ul></body></html>")
+            return "".join(parts).encode(), 'text/html'
+        return await self._respond(request, build)
+
+    async def guild_page(self, request):
+        guild_id = _int_param(request.match_info['guild_id'])
+
+        def build():
+            title = html.escape(self._guild_name(guild_id) or f"Serwer {guild_id}")
+            parts = [_HTML_HEAD.format(title=title), '<p><a href="/">← Wszystkie serwery</a></p>']
+            for point_type in POINT_TYPES:
+                parts.append(f"<h2>{POINT_TYPE_LABELS[point_type]}</h2><table><tr><th>#</th><th>Użytkownik</th><th>Punkty</th></tr>")
+                for i, entry in enumerate(self._leaderboard(guild_id, point_type, 10), start=1):
+                    name = html.escape(entry['name'] or f"ID: {entry['user_id']}")
+                    parts.append(f"<tr><td>{i}</td><td>{name}</td><td>{entry['points']}</td></tr>")
+                parts.append("</table>")
+            parts.append("<h2>Sklep</h2><table><tr><th>ID</th><th>Rola</th><th>Cena</th></tr>")
+            for item in self._shop(guild_id):
+                name = html.escape(item['name'] or f"ID: {item['role_id']}")
+                parts.append(f"<tr><td>{item['item_id']}</td><td>{name}</td><td>{item['price']}</td></tr>")
+            parts.append("</table><h2>Liczba członków (ostatnie 30 wpisów)</h2><table><tr><th>Data</th><th>Członkowie</th></tr>")
+            for entry in reversed(self._member_counts(guild_id)[-30:]):
+                parts.append(f"<tr><td>{entry['date']}</td><td>{entry['member_count']}</td></tr>")
+            parts.append("</table></body></html>")
+            return "".join(parts).encode(), 'text/html'
+        return await self._respond(request, build)
+
+def _json(data):
+    return json.dumps(data, ensure_ascii=False).encode(), 'application/json'
+
+def _int_param(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise web.HTTPNotFound()
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False